@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2011, 2013 K Richard Pixley
+#
+# See LICENSE for details.
+
+"""
+Benchmarks for cpiofile.
+
+Synthetic archives are generated deterministically from a seed, so
+that runs on different commits measure exactly the same input, and
+each operation is timed several times.  Results are written as JSON
+along with the commit they were measured on, so regressions can be
+tracked by comparing files from different runs.
+
+Typical use::
+
+    python benchmarks.py --members 10000 --output bench.json
+"""
+
+from __future__ import unicode_literals, print_function
+
+__docformat__ = 'restructuredtext en'
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import cpiofile
+
+formats = ['bin-le', 'bin-be', 'odc', 'newc', 'crc']
+"""the formats which are benchmarked by default""" # pylint: disable=W0105
+
+_poolsize = 1024 * 1024
+
+def _parse_range(text):
+    """parse 'low:high', (or a single number), into a (low, high) tuple"""
+    low, _, high = text.partition(':')
+    return (int(low), int(high or low))
+
+def generate(path, format='newc', members=1000, sizes=(0, 4096),
+             namelengths=(8, 64), seed=0):
+    """
+    Write a synthetic archive to *path* and return its size in bytes.
+    The same arguments always produce the same archive.
+
+    :param str format: a key of :py:data:`cpiofile.formats`
+    :param int members: number of members
+    :param sizes: (low, high) range of member content sizes.  Sizes are
+        drawn from a log uniform distribution, so that small files
+        dominate as they do in real trees.
+    :param namelengths: (low, high) range of member name lengths
+    :param int seed: seed for the random number generator
+    """
+    # pylint: disable=W0622
+    rng = random.Random(seed)
+    pool = rng.getrandbits(8 * _poolsize).to_bytes(_poolsize, 'little')
+    member_class = cpiofile.formats[format]
+    names = set()
+
+    with cpiofile.CpioFile.open(path, 'w', format=format) as archive:
+        for ino in range(1, members + 1):
+            length = rng.randint(*namelengths)
+            name = None
+            while name is None or name in names:
+                stem = '{0:x}/'.format(ino % 64)
+                name = (stem + ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz')
+                                       for _ in range(max(length - len(stem),
+                                                          1)))).encode('ascii')
+            names.add(name)
+
+            low, high = sizes
+            size = int(round(low - 1 + (high - low + 2) ** rng.random()))
+            size = min(max(size, low), high, _poolsize)
+            start = rng.randrange(_poolsize - size + 1)
+
+            member = member_class.trailer()
+            member.name = name
+            member.ino = ino & member_class.inomask
+            member.mode = 0o100644
+            member.mtime = 1000000000 + ino
+            member.filesize = size
+            member.content = pool[start:start + size]
+            archive.addfile(member)
+
+    return os.path.getsize(path)
+
+def _op_open(path, workdir):
+    cpiofile.CpioFile.open(path, 'r').close()
+
+def _op_list(path, workdir):
+    with cpiofile.CpioFile.open(path, 'r') as archive:
+        return archive.names
+
+def _op_lookup(path, workdir, lookups=100):
+    with cpiofile.CpioFile.open(path, 'r') as archive:
+        names = archive.names
+        step = max(len(names) // lookups, 1)
+        for name in names[::step]:
+            archive.get_member(name)
+
+def _op_read_all(path, workdir):
+    with cpiofile.CpioFile.open(path, 'r') as archive:
+        return sum(len(member.content) for member in archive.members)
+
+def _op_checksum_verify(path, workdir):
+    checksum = cpiofile.CpioMemberCRC._checksum # pylint: disable=W0212
+    with cpiofile.CpioFile.open(path, 'r') as archive:
+        for member in archive.members:
+            checksum(member.content, 0, member.filesize)
+
+def _op_extract(path, workdir):
+    target = os.path.join(workdir, 'extract')
+    with cpiofile.CpioFile.open(path, 'r') as archive:
+        archive.extractall(target)
+    shutil.rmtree(target)
+
+def _op_pack(path, workdir):
+    with cpiofile.CpioFile.open(path, 'r') as archive:
+        members = archive.members
+        fmt = [key for key, value in cpiofile.formats.items()
+               if members and type(members[0]) is value][0]
+        with cpiofile.CpioFile.open(mode='w', fileobj=io.BytesIO(),
+                                    format=fmt) as out:
+            for member in members:
+                out.addfile(member)
+
+def _op_pack_memory(path, workdir):
+    with cpiofile.CpioFile.open(path, 'r') as archive:
+        return len(archive.pack())
+
+def _op_manifest(path, workdir):
+    with cpiofile.CpioFile.open(path, 'r') as archive:
+        return archive.manifest()
+
+operations = [
+    ('open', _op_open),
+    ('list', _op_list),
+    ('lookup', _op_lookup),
+    ('read-all', _op_read_all),
+    ('checksum-verify', _op_checksum_verify),
+    ('extract', _op_extract),
+    ('pack', _op_pack),
+    ('pack-memory', _op_pack_memory),
+    ('manifest', _op_manifest),
+    ]
+"""(name, function) pairs of the operations which are timed""" # pylint: disable=W0105
+
+def _commit():
+    """return the current git commit, or None"""
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], stderr=devnull,
+                cwd=os.path.dirname(os.path.abspath(__file__))
+                ).decode('ascii').strip()
+    except (EnvironmentError, subprocess.CalledProcessError):
+        return None
+
+def run(formats=formats, members=1000, sizes=(0, 4096), namelengths=(8, 64),
+        seed=0, repeat=5, selected=None, workdir=None, log=None):
+    """
+    Generate an archive in each of *formats* and time each operation
+    on it *repeat* times.
+
+    :param selected: names of the operations to time, (default all)
+    :param log: if given, a callable which is passed each result as it
+        is produced
+    :returns: a dict suitable for serializing as JSON
+    """
+    # pylint: disable=W0621
+    results = []
+    cleanup = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='cpiofile-bench-')
+
+    try:
+        for fmt in formats:
+            path = os.path.join(workdir, 'bench-{0}.cpio'.format(fmt))
+            nbytes = generate(path, fmt, members, sizes, namelengths, seed)
+
+            for name, function in operations:
+                if selected and name not in selected:
+                    continue
+
+                times = timeit.repeat(lambda: function(path, workdir),
+                                      repeat=repeat, number=1)
+                times.sort()
+                best = times[0]
+                result = {
+                    'format': fmt,
+                    'operation': name,
+                    'members': members,
+                    'bytes': nbytes,
+                    'repeat': repeat,
+                    'best': best,
+                    'median': times[len(times) // 2],
+                    'mib_per_s': nbytes / best / (1024 * 1024) if best else None,
+                    }
+                results.append(result)
+
+                if log:
+                    log(result)
+
+            os.remove(path)
+
+    finally:
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'commit': _commit(),
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'parameters': {
+            'members': members,
+            'sizes': list(sizes),
+            'namelengths': list(namelengths),
+            'seed': seed,
+            },
+        'results': results,
+        }
+
+def _log(result):
+    sys.stderr.write('{format:>7} {operation:<16} {best:9.4f}s'
+                     ' {median:9.4f}s {mib_per_s:9.1f} MiB/s\n'.format(**result))
+
+def main(argv=None):
+    """entry point for the benchmarks"""
+    parser = argparse.ArgumentParser(description='benchmark cpiofile')
+    parser.add_argument('-f', '--format', dest='formats', action='append',
+                        choices=sorted(cpiofile.formats),
+                        help='format to benchmark, may be repeated'
+                        ' (default: {0})'.format(' '.join(formats)))
+    parser.add_argument('-n', '--members', type=int, default=1000,
+                        help='members per archive (default: %(default)s)')
+    parser.add_argument('-s', '--sizes', type=_parse_range, default='0:4096',
+                        metavar='LOW:HIGH',
+                        help='range of content sizes (default: %(default)s)')
+    parser.add_argument('-l', '--name-lengths', type=_parse_range,
+                        default='8:64', metavar='LOW:HIGH',
+                        help='range of name lengths (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed (default: %(default)s)')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='timings per operation (default: %(default)s)')
+    parser.add_argument('-o', '--operation', dest='operations',
+                        action='append',
+                        choices=[name for name, _ in operations],
+                        help='operation to time, may be repeated'
+                        ' (default: all)')
+    parser.add_argument('--output', default='-', metavar='FILE',
+                        help='write JSON results to FILE (default: stdout)')
+    args = parser.parse_args(argv)
+
+    results = run(args.formats or formats, args.members, args.sizes,
+                  args.name_lengths, args.seed, args.repeat,
+                  args.operations, log=_log)
+
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+            out.write('\n')
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
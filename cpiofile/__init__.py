@@ -0,0 +1,2997 @@
+#!/usr/bin/env python -3
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2011, 2013 K Richard Pixley
+#
+# See LICENSE for details.
+#
+# Time-stamp: <14-Aug-2013 22:32:13 PDT by rich@noir.com>
+
+"""
+Cpiofile is a library which reads and writes unix style 'cpio' format
+archives.
+
+.. todo:: open vs context manager
+.. todo:: make is_cpiofile work on fileobj
+"""
+
+from __future__ import unicode_literals, print_function
+
+__docformat__ = 'restructuredtext en'
+
+__all__ = [
+    'CheckSumError',
+    'CpioDiff',
+    'CpioError',
+    'CpioFile',
+    'CpioManifest',
+    'CpioMember',
+    'CpioMemberReader',
+    'CpioStats',
+    'formats',
+    'HeaderError',
+    'InvalidFileFormat',
+    'InvalidFileFormatNull',
+    'is_cpiofile',
+    'transcode',
+    'valid_magic',
+    ]
+
+import abc
+import collections
+import concurrent.futures
+import errno
+import fnmatch
+import hashlib
+import io
+import json
+import mmap
+import os
+import shutil
+import stat
+import struct
+import sys
+import time
+
+from cpiofile import compression, storage
+
+TRAILER = b'TRAILER!!!'
+"""name of the member which marks the end of an archive""" # pylint: disable=W0105
+
+class CpioError(Exception):
+    """Base class for CpioFile exceptions"""
+    pass
+
+class CheckSumError(CpioError):
+    """Exception indicating a check sum error"""
+    pass
+
+class InvalidFileFormat(CpioError):
+    """Exception indicating a file format error"""
+    pass
+
+class InvalidFileFormatNull(InvalidFileFormat):
+    """Exception indicating a null file"""
+    pass
+
+class HeaderError(CpioError):
+    """Exception indicating a header error"""
+    pass
+
+class CpioStats(object):
+    """
+    Counters and timers for the phases of reading and writing an
+    archive.  Pass an instance as the *stats* argument of
+    :py:meth:`CpioFile.open` to enable them.  When no instance is given
+    the only cost is a test against None at each measuring point.
+
+    Each phase accumulates a count, a number of bytes and a time in
+    seconds.  The phases are:
+
+    * 'map' - mapping, (or reading), the archive in :py:meth:`CpioFile._open`
+    * 'unpack' - all of :py:meth:`CpioFile.unpack_from`
+    * 'header' - decoding one member header
+    * 'name' - decoding one member name
+    * 'checksum' - computing one member's checksum
+    * 'pack' - encoding members for writing
+    * 'write' - writing member contents
+
+    :param callback: if given, a callable which is also called as
+        callback(phase, seconds, nbytes) for each measurement, which
+        is convenient for feeding other profiling or metrics tools
+    """
+
+    clock = staticmethod(getattr(time, 'perf_counter', time.time))
+    """the timer used for all measurements""" # pylint: disable=W0105
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.counts = {}
+        self.bytes = {}
+        self.times = {}
+
+    def record(self, phase, start, nbytes=0):
+        """
+        Record one occurrence of *phase* which began at :py:meth:`clock`
+        time *start* and covered *nbytes*.
+
+        :returns: the current clock time, so that consecutive phases
+            can be chained
+        """
+        now = self.clock()
+        elapsed = now - start
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+        self.bytes[phase] = self.bytes.get(phase, 0) + nbytes
+        self.times[phase] = self.times.get(phase, 0.0) + elapsed
+
+        if self.callback is not None:
+            self.callback(phase, elapsed, nbytes)
+
+        return now
+
+    @property
+    def bytes_mapped(self):
+        """number of archive bytes mapped or read"""
+        return self.bytes.get('map', 0)
+
+    @property
+    def headers_decoded(self):
+        """number of member headers decoded"""
+        return self.counts.get('header', 0)
+
+    @property
+    def bytes_checksummed(self):
+        """number of content bytes checksummed"""
+        return self.bytes.get('checksum', 0)
+
+    def report(self, stream=None):
+        """write a table of the phases to *stream*, (default stderr)"""
+        stream = stream or sys.stderr
+
+        for phase in sorted(self.times, key=self.times.get, reverse=True):
+            stream.write('{0:<10} {1:10d} {2:14d} {3:10.6f}s\n'.format(
+                phase, self.counts[phase], self.bytes[phase],
+                self.times[phase]))
+
+def valid_magic(block):
+    """predicate indicating whether *block* includes a valid magic number"""
+    return CpioMember.valid_magic(block)
+
+def _octal(value, width, field='value'):
+    """encode *value* of *field* as exactly *width* ascii octal digits"""
+    digits = '{0:0{1}o}'.format(value, width)
+
+    if len(digits) > width:
+        raise HeaderError('{0} {1} does not fit in {2} octal digits'
+                          .format(field, value, width))
+
+    return digits.encode('ascii')
+
+def _hex(value, width=8, field='value'):
+    """encode *value* of *field* as exactly *width* ascii hex digits"""
+    digits = '{0:0{1}X}'.format(value, width)
+
+    if len(digits) > width:
+        raise HeaderError('{0} {1} does not fit in {2} hex digits'
+                          .format(field, value, width))
+
+    return digits.encode('ascii')
+
+def _copy(src, dst, length, bufsize=1024 * 1024):
+    """
+    copy *length* bytes from the current position of file object *src*
+    to file object *dst*.  :py:func:`os.sendfile` is used when both
+    have file descriptors, so the data need never enter user space.
+    """
+    sendfile = getattr(os, 'sendfile', None)
+
+    if sendfile is not None and length:
+        try:
+            infd = src.fileno()
+            outfd = dst.fileno()
+            offset = src.tell()
+        except (AttributeError, io.UnsupportedOperation, EnvironmentError):
+            pass
+        else:
+            dst.flush()
+            remaining = length
+
+            try:
+                while remaining:
+                    sent = sendfile(outfd, infd, offset, remaining)
+                    if not sent:
+                        raise HeaderError('unexpected end of file')
+                    offset += sent
+                    remaining -= sent
+
+            except OSError as error:
+                if (remaining != length
+                    or error.errno not in (errno.EINVAL, errno.ENOSYS)):
+                    raise
+            else:
+                src.seek(offset)
+                return
+
+    remaining = length
+    while remaining:
+        chunk = src.read(min(bufsize, remaining))
+        if not chunk:
+            raise HeaderError('unexpected end of file')
+        dst.write(chunk)
+        remaining -= len(chunk)
+
+def _read_member_header(fileobj, pointer, stats=None):
+    """
+    Read the header and name of a member from *fileobj*, leaving it
+    positioned at the start of the content.
+
+    :param int pointer: offset of the member in its archive
+    :returns: a tuple of the member, (with no content), and its encoded
+        checksum, (or None for formats which have none)
+    """
+    if stats is not None:
+        start = stats.clock()
+
+    prefix = fileobj.read(6)
+    if prefix and len(prefix) < 6:
+        prefix += _read(fileobj, 6 - len(prefix))
+
+    member = CpioMember.encoded_class(prefix)()
+    size = member.coder.size
+    namesize, check = member.unpack_header(
+        prefix + _read(fileobj, size - len(prefix)))
+
+    if stats is not None:
+        start = stats.record('header', start, size)
+
+    nameend = pointer + size + namesize
+    member.name = _read(fileobj, namesize)[:-1]
+    member.offset = pointer
+    # pylint: disable=W0212
+    member._datastart = nameend + member._namepad(nameend)
+    _skip(fileobj, member._datastart - nameend)
+
+    if stats is not None:
+        stats.record('name', start, namesize)
+
+    return member, check
+
+def _copy_checksum(src, dst, length, bufsize=1024 * 1024):
+    """
+    copy *length* bytes from file object *src* to *dst*, returning
+    their crc format checksum.
+    """
+    csum = 0
+    remaining = length
+
+    while remaining:
+        chunk = src.read(min(bufsize, remaining))
+        if not chunk:
+            raise HeaderError('unexpected end of file')
+        dst.write(chunk)
+        csum += sum(bytearray(chunk))
+        remaining -= len(chunk)
+
+    return csum & 0xffffffff
+
+def _data_ranges(fileobj, length):
+    """
+    Generate (start, end) offsets of the regions holding data among the
+    next *length* bytes of *fileobj*, found with
+    :py:data:`os.SEEK_DATA` and :py:data:`os.SEEK_HOLE`.  The gaps
+    between them are holes, which read as zeros.  Where the file or the
+    system cannot tell, the whole range is one region.  The position
+    of *fileobj* is left undefined.
+    """
+    start = fileobj.tell()
+    end = start + length
+
+    try:
+        fd = fileobj.fileno()
+        seek_data, seek_hole = os.SEEK_DATA, os.SEEK_HOLE
+    except (AttributeError, io.UnsupportedOperation):
+        if length:
+            yield start, end
+        return
+
+    position = start
+    while position < end:
+        try:
+            data = os.lseek(fd, position, seek_data)
+        except OSError as error:
+            if error.errno == errno.ENXIO: # nothing but holes remain
+                return
+            if position != start:
+                raise
+            yield start, end
+            return
+
+        if data >= end:
+            return
+
+        position = min(os.lseek(fd, data, seek_hole), end)
+        yield data, position
+
+def _zeros(dst, length, bufsize=1024 * 1024):
+    """write *length* null bytes to file object *dst*"""
+    zeros = b'\x00' * min(length, bufsize)
+    while length:
+        dst.write(zeros[:length])
+        length -= min(length, bufsize)
+
+def _copy_sparse(src, dst, length, seek=False):
+    """
+    Like :py:func:`_copy`, but holes in *src* are not read.  Their
+    zeros are written to *dst*, or if *seek*, skipped over with a seek
+    so that *dst* gets holes too.
+    """
+    try:
+        start = src.tell()
+    except (AttributeError, io.UnsupportedOperation, EnvironmentError):
+        _copy(src, dst, length)
+        return
+
+    position = start
+
+    for data, end in _data_ranges(src, length):
+        if seek:
+            dst.seek(data - position, os.SEEK_CUR)
+        else:
+            _zeros(dst, data - position)
+        src.seek(data)
+        _copy(src, dst, end - data)
+        position = end
+
+    remaining = start + length - position
+    if seek and remaining:
+        dst.seek(remaining, os.SEEK_CUR)
+        dst.truncate()
+    else:
+        _zeros(dst, remaining)
+
+    src.seek(start + length)
+
+def _write_holes(src, dst, length, blocksize):
+    """
+    copy *length* bytes from raw file *src* to file object *dst*,
+    seeking over, rather than writing, any aligned *blocksize* blocks
+    of zeros so that they become holes in *dst*.
+    """
+    block = bytearray(blocksize)
+    view = memoryview(block)
+    zeros = bytes(blocksize)
+    remaining = length
+    hole = False
+
+    while remaining:
+        count = src.readinto(view[:min(blocksize, remaining)])
+        if not count:
+            raise HeaderError('unexpected end of file')
+
+        # comparing a bytearray to bytes is a memcmp
+        if (block if count == blocksize else block[:count]) == zeros[:count]:
+            dst.seek(count, os.SEEK_CUR)
+            hole = True
+        else:
+            dst.write(view[:count])
+            hole = False
+
+        remaining -= count
+
+    if hole:
+        dst.truncate()
+
+class _Gather(object):
+    """
+    Buffers waiting to be written to file descriptor *fd* together with
+    :py:func:`os.writev`.  They are referenced, not copied, until
+    written.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.buffers = []
+        self.pending = 0
+
+    def append(self, buf):
+        """queue *buf*, (any bytes like object)"""
+        if len(buf):
+            self.buffers.append(buf)
+            self.pending += len(buf)
+
+    def flush(self, maxbuffers=1024):
+        """write everything queued, at most *maxbuffers* per call"""
+        buffers = self.buffers
+        index = 0
+
+        while index < len(buffers):
+            batch = buffers[index:index + maxbuffers]
+            written = os.writev(self.fd, batch)
+            self.pending -= written
+
+            for buf in batch:
+                if written < len(buf):
+                    # a short write - resume part way through buf
+                    buffers[index] = memoryview(buf)[written:]
+                    break
+                written -= len(buf)
+                index += 1
+
+        del buffers[:]
+
+def _read(fileobj, length):
+    """read exactly *length* bytes from *fileobj*"""
+    chunks = []
+    remaining = length
+
+    while remaining:
+        chunk = fileobj.read(remaining)
+        if not chunk:
+            raise HeaderError('unexpected end of file')
+        chunks.append(chunk)
+        remaining -= len(chunk)
+
+    return b''.join(chunks)
+
+def _seekable(fileobj):
+    """predicate indicating whether *fileobj* can seek"""
+    try:
+        return fileobj.seekable()
+    except AttributeError:
+        return False
+
+def _positional(fileobj):
+    """
+    return a :py:class:`cpiofile.storage.FileBackend` reading a
+    duplicate of the descriptor of *fileobj* if it is a regular file,
+    or None.
+    """
+    try:
+        fd = fileobj.fileno()
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            return None
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+    return storage.FileBackend(fileobj=io.open(os.dup(fd), 'rb'),
+                               closefd=True)
+
+def _extract_path(name, path):
+    """
+    return where member *name* is extracted below directory *path*,
+    stripped of leading slashes.
+
+    :raises CpioError: if *name* would escape *path*, either with '..'
+        or through a symlink below *path*
+    """
+    name = name.lstrip(b'/')
+    parts = name.split(b'/')
+
+    if b'..' in parts:
+        raise CpioError('refusing to extract {0!r}'.format(name))
+
+    base = os.fsencode(path)
+    current = base
+    for part in parts[:-1]:
+        current = os.path.join(current, part)
+        if os.path.islink(current):
+            raise CpioError('refusing to extract {0!r} through symlink {1!r}'
+                            .format(name, current))
+
+    return os.path.join(base, name) if name else base
+
+def _skip(fileobj, length, bufsize=1024 * 1024):
+    """
+    move *fileobj* forward *length* bytes, by seeking when it can and
+    by reading and discarding otherwise.
+    """
+    if not length:
+        return
+
+    if _seekable(fileobj):
+        fileobj.seek(length, os.SEEK_CUR)
+        return
+
+    remaining = length
+    while remaining:
+        chunk = fileobj.read(min(bufsize, remaining))
+        if not chunk:
+            raise HeaderError('unexpected end of file')
+        remaining -= len(chunk)
+
+def _matcher(pattern):
+    """
+    return a predicate on member names for *pattern*, which is a shell
+    style glob, (str or bytes), a compiled regular expression, (which
+    is searched for), or a callable taking the name.
+    """
+    if hasattr(pattern, 'search'):
+        if isinstance(pattern.pattern, bytes):
+            return lambda name: pattern.search(name) is not None
+        return lambda name: (pattern.search(name.decode('utf-8',
+                                                        'surrogateescape'))
+                             is not None)
+
+    if callable(pattern):
+        return pattern
+
+    if not isinstance(pattern, bytes):
+        pattern = os.fsencode(pattern)
+
+    return lambda name: fnmatch.fnmatchcase(name, pattern)
+
+def _selector(include=None, exclude=None, predicate=None):
+    """
+    return a predicate on members, (with headers and names decoded but
+    no content), combining the arguments of
+    :py:meth:`CpioFile.iter_members`, or None if all are None.
+    """
+    if include is None and exclude is None and predicate is None:
+        return None
+
+    def patterns(value):
+        if value is None:
+            return []
+        if isinstance(value, (str, bytes)) or not hasattr(value, '__iter__'):
+            value = [value]
+        return [_matcher(pattern) for pattern in value]
+
+    includes = patterns(include)
+    excludes = patterns(exclude)
+
+    def select(member):
+        name = member.name
+        return ((include is None or any(match(name) for match in includes))
+                and not any(match(name) for match in excludes)
+                and (predicate is None or predicate(member)))
+
+    return select
+
+def _resync(block, offset):
+    """
+    return the offset of the first plausible member header at or after
+    *offset* in *block*, or None.  Candidates are found by searching for
+    each magic number and are accepted if they unpack cleanly, (or fail
+    only their checksum).
+    """
+    found = dict((magic, block.find(magic, offset)) for magic in __magicmap__)
+
+    while True:
+        candidates = [at for at in found.values() if at >= 0]
+        if not candidates:
+            return None
+
+        candidate = min(candidates)
+        try:
+            CpioMember.encoded_class(block, candidate)().unpack_from(
+                block, candidate)
+            return candidate
+        except CheckSumError:
+            return candidate
+        except CpioError:
+            pass
+
+        for magic, at in list(found.items()):
+            if at == candidate:
+                found[magic] = block.find(magic, candidate + 1)
+
+def _walk(block, offset=0):
+    """
+    Generate the members of the archive in *block* starting at
+    *offset*, up to and including the trailer, decoding only their
+    headers and names.  Contents are left unset and never touched.
+    """
+    pointer = offset
+
+    while True:
+        member = CpioMember.encoded_class(block, pointer)()
+        namesize, _ = member.unpack_header(block, pointer)
+        namestart = pointer + member.coder.size
+        member.name = block[namestart:namestart + namesize - 1]
+        member.offset = pointer
+
+        yield member
+
+        if member.name == TRAILER:
+            return
+
+        pointer += member.size
+
+def _normalize(members, mtime=0):
+    """
+    Normalize the metadata of *members*, (in archive order), for a
+    deterministic archive.  Ownership and device numbers are zeroed,
+    mtimes are set to *mtime* and inodes are renumbered sequentially.
+    Members which shared an inode still do, and their link counts are
+    the number of members sharing it.  Directory link counts are
+    recomputed from the directories in *members*.
+    """
+    keys = []
+    links = {}
+    subdirs = {}
+
+    for member in members:
+        if stat.S_ISDIR(member.mode):
+            key = id(member)
+            parent = member.name.rstrip(b'/').rpartition(b'/')[0]
+            subdirs[parent] = subdirs.get(parent, 0) + 1
+        elif member.nlink > 1:
+            key = (member.devmajor, member.devminor, member.ino)
+        else:
+            key = id(member)
+
+        keys.append(key)
+        links[key] = links.get(key, 0) + 1
+
+    inodes = {}
+    for member, key in zip(members, keys):
+        member.ino = inodes.setdefault(key, len(inodes) + 1)
+
+        if stat.S_ISDIR(member.mode):
+            member.nlink = 2 + subdirs.get(member.name.rstrip(b'/'), 0)
+        else:
+            member.nlink = links[key]
+
+        member.uid = member.gid = 0
+        member.devmajor = member.devminor = 0
+        member.mtime = mtime
+
+def _digest(fileobj, content, length, algorithm, bufsize=1024 * 1024):
+    """
+    Return a tuple of the :py:mod:`hashlib` *algorithm* digest and the
+    crc format checksum of *length* bytes of content, which are read
+    from *fileobj* if it is not None, (leaving its position unchanged),
+    and taken from *content* otherwise.
+    """
+    digest = hashlib.new(algorithm)
+    csum = 0
+
+    if fileobj is None:
+        digest.update(content)
+        return digest.digest(), sum(bytearray(content)) & 0xffffffff
+
+    start = fileobj.tell()
+    remaining = length
+
+    while remaining:
+        chunk = fileobj.read(min(bufsize, remaining))
+        if not chunk:
+            raise HeaderError('unexpected end of file')
+        digest.update(chunk)
+        csum += sum(bytearray(chunk))
+        remaining -= len(chunk)
+
+    fileobj.seek(start)
+    return digest.digest(), csum & 0xffffffff
+
+def _chunks(source, start, length, bufsize=1024 * 1024):
+    """
+    generate *length* bytes of *source* from *start* in pieces of at
+    most *bufsize* bytes, which are views rather than copies unless
+    *source* is a :py:class:`cpiofile.storage.RangeCache`.
+    """
+    end = start + length
+
+    if isinstance(source, storage.RangeCache):
+        for offset in range(start, end, bufsize):
+            yield source.read_at(offset, min(bufsize, end - offset))
+        return
+
+    with memoryview(source) as view:
+        for offset in range(start, end, bufsize):
+            with view[offset:min(offset + bufsize, end)] as chunk:
+                yield chunk
+
+def _hash(source, start, length, algorithms, bufsize=1024 * 1024):
+    """
+    return a dict of the hex digests, by :py:mod:`hashlib` algorithm
+    name, of *length* bytes of *source* from *start*.  Each chunk of
+    *bufsize* bytes is fed to every algorithm in turn while it is still
+    in cache.
+    """
+    digests = [hashlib.new(algorithm) for algorithm in algorithms]
+
+    for chunk in _chunks(source, start, length, bufsize):
+        for digest in digests:
+            digest.update(chunk)
+
+    return dict((digest.name, digest.hexdigest()) for digest in digests)
+
+def _same_content(one, other, bufsize=1024 * 1024):
+    """
+    predicate indicating whether members *one* and *other*, (of equal
+    filesize), have the same content.  They are compared a chunk at a
+    time, straight from their archives.
+    """
+    # pylint: disable=W0212
+    source, start = one._source()
+    first = _chunks(source, start, one.filesize, bufsize)
+    source, start = other._source()
+    second = _chunks(source, start, other.filesize, bufsize)
+
+    try:
+        for chunk, otherchunk in zip(first, second):
+            if chunk != otherchunk:
+                return False
+        return True
+    finally:
+        # release any views of the maps now, rather than when collected
+        first.close()
+        second.close()
+
+def is_cpiofile(name):
+    """predicate indicating whether *name* is a valid cpiofile"""
+    with io.open(name, 'rb') as fff:
+        return valid_magic(fff.read(16))
+
+class StructBase(object):
+    """
+    An abstract base class representing objects which are inherently
+    based on a struct.
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    coder = None
+    """
+    The :py:class:`struct.Struct` used to encode/decode this object
+    into a block of memory.  This is expected to be overridden by
+    subclasses.
+    """ # pylint: disable=W0105
+
+    @property
+    def size(self):
+        """
+        Exact size in bytes of a block of memory into which is suitable
+        for packing this instance.
+        """
+        return self.coder.size
+
+    def unpack(self, block):
+        """convenience function for unpacking"""
+        return self.unpack_from(block)
+
+    @abc.abstractmethod
+    def unpack_from(self, block, offset=0):
+        """
+        Set the values of this instance from an in-memory
+        representation of the struct.
+
+        :param string block: block of memory from which to unpack
+        :param int offset: optional offset into the memory block from
+            which to start unpacking
+        """
+        raise NotImplementedError
+
+    def pack(self):
+        """convenience function for packing"""
+        block = bytearray(self.size)
+        self.pack_into(block)
+        return block
+
+    @abc.abstractmethod
+    def pack_into(self, block, offset=0):
+        """
+        Store the values of this instance into an in-memory
+        representation of the file.
+
+        :param string block: block of memory into which to pack
+        :param int offset: optional offset into the memory block into
+            which to start packing
+        """
+        raise NotImplementedError
+
+    __hash__ = None
+
+    def __eq__(self, other):
+        raise NotImplementedError
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def close_enough(self, other):
+        """
+        This is a comparison similar to __eq__ except that here the
+        goal is to determine whether two objects are "close enough"
+        despite perhaps having been produced at different times in
+        different locations in the file system.
+        """
+        return self == other
+
+class CpioFile(StructBase):
+    """Class representing an entire cpio file"""
+
+    _members = []
+
+    mode = 'r'
+    """
+    'r' for an archive opened for reading, 'r|' for reading as a
+    stream, 'r+' for reading and patching in place, 'w' for writing
+    """ # pylint: disable=W0105
+
+    patchable = ('ino', 'mode', 'uid', 'gid', 'nlink', 'mtime',
+                 'devmajor', 'devminor', 'rdevmajor', 'rdevminor')
+    """
+    The member fields which :py:meth:`patch_member` can change.  They
+    are encoded in fixed width in every format, so changing them never
+    moves anything else in the archive.
+    """ # pylint: disable=W0105
+
+    member_class = None
+    """
+    The :py:class:`CpioMember` subclass used for new members when
+    writing.
+    """ # pylint: disable=W0105
+
+    fileobj = None
+    _closefileobj = False
+    _map = None
+    _pending = None
+    _mtime = 0
+    _digests = None
+    _links = None
+    _holders = None
+    _sparse = False
+    _gather = None
+    _backend = None
+
+    gather_threshold = 256 * 1024
+    """
+    When writing to a file with a descriptor, headers, padding and
+    contents smaller than this are queued and written together with
+    :py:func:`os.writev` once this many bytes are queued.  Larger
+    contents are copied with :py:func:`os.sendfile`.  0 disables
+    batching for archives opened afterwards.
+    """ # pylint: disable=W0105
+
+    gather_buffers = 1024
+    """
+    the most buffers queued, or passed to one :py:func:`os.writev`
+    call, (IOV_MAX is 1024 on Linux)
+    """ # pylint: disable=W0105
+
+    hash_threshold = 1024 * 1024
+    """
+    :py:meth:`manifest` hashes contents at least this large in a thread
+    pool, (:py:mod:`hashlib` releases the GIL while it works), and
+    smaller ones in the calling thread.
+    """ # pylint: disable=W0105
+
+    holesize = 64 * 1024
+    """
+    On extraction, aligned blocks of this many zeros in regular file
+    contents are left as holes rather than written.  0 writes every
+    byte.
+    """ # pylint: disable=W0105
+
+    dedup_algorithm = 'sha256'
+    """the :py:mod:`hashlib` algorithm used to find duplicate contents""" # pylint: disable=W0105
+
+    stats = None
+    """a :py:class:`CpioStats` instance, or None when not measuring""" # pylint: disable=W0105
+
+    damaged = None
+    """
+    When reading with *recover*, a list of (start, end) offsets of the
+    regions of the archive which could not be read, otherwise None.
+    An archive which ends without a trailer has a final region ending
+    at its end, (which is empty if it was cut off between members).
+    """ # pylint: disable=W0105
+
+    def __init__(self):
+        self._members = []
+
+    @property
+    def members(self):
+        """accessor for a list of the members of this cpio file"""
+        return self._members
+
+    @property
+    def names(self):
+        """accessor for a list of names of the members of this cpio file"""
+        return [member.name for member in self.members]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, thingy, value, traceback):
+        self.close()
+
+    @classmethod
+    def open(cls, name=None, mode='r', fileobj=None, format='newc',
+             stats=None, deterministic=False, mtime=0, dedup=False,
+             sparse=False, recover=False, compress=None, jobs=None,
+             backend=None):
+        """
+        Open an archive.
+
+        :param str name: a file name
+        :param str mode: 'r' to read an existing archive, 'r|' to
+            read one sequentially, (eg, from a pipe), with
+            :py:meth:`iter_members`, 'r+' to read one and patch its
+            headers in place with
+            :py:meth:`patch_member`, 'w' to write a new one, or 'a' to
+            add members to the end of an existing one.  When appending,
+            :py:attr:`members` holds only the new members and the
+            format of the existing archive overrides *format*.
+        :param fileobj: if given, a file object which is used instead
+            of opening *name*
+        :param str format: when writing, the key in :py:data:`formats`
+            of the format in which to write members
+        :param stats: if given, a :py:class:`CpioStats` instance which
+            accumulates measurements of the work done
+        :param bool deterministic: when writing, produce an archive which
+            depends only on the names, modes, link structure and
+            contents of the members.  Members are queued and written
+            sorted by name on :py:meth:`close`, with uid, gid and device
+            numbers zeroed, mtimes set to *mtime* and inodes renumbered
+            from 1 in that order, (hardlinks keep sharing a number).
+        :param int mtime: the mtime given to every member of a
+            deterministic archive
+        :param bool dedup: when writing newc or crc archives, store each
+            distinct regular file content only once.  Later members
+            whose content, mode, owner and mtime match an earlier one
+            become hardlinks to it: they share its inode number, carry
+            no data, and the whole group's link counts are corrected on
+            :py:meth:`close`.  Unless *deterministic*, that correction
+            requires a seekable file.
+        :param bool sparse: when writing, find the holes in sparse
+            files added with :py:meth:`add` or :py:meth:`addfile`
+            using :py:data:`os.SEEK_DATA` and :py:data:`os.SEEK_HOLE`,
+            and write their zeros without reading them
+        :param bool recover: when reading in mode 'r' or 'r+', do not
+            stop at a damaged member.  Search onwards for the next
+            plausible header and continue from there, collecting every
+            member which can be read, and record the regions skipped
+            in :py:attr:`damaged`.
+        :param str compress: when writing, a key of
+            :py:data:`cpiofile.compression.compressors`.  The archive
+            is compressed in that format by a
+            :py:class:`cpiofile.compression.ParallelCompressor`, using
+            *jobs* threads, (default one per cpu).  Not for appending.
+            When reading in mode 'r' or 'r|', a key of
+            :py:data:`cpiofile.compression.decompressors`, or 'auto'
+            to detect it.  The archive is decompressed by a
+            :py:class:`cpiofile.compression.ParallelDecompressor`
+            using *jobs* threads.  In mode 'r' the whole decompressed
+            archive is held in memory, so 'r|' suits large ones.
+        :param backend: when reading in mode 'r', an object with a size
+            attribute and a read_at(offset, size) method, (eg, a
+            :py:class:`cpiofile.storage.FileBackend`), from which the
+            archive is read instead of *name* or *fileobj*.  Unless it
+            is a :py:class:`cpiofile.storage.RangeCache` already, it is
+            put behind one.
+        """
+        # pylint: disable=W0622
+        if mode == 'r':
+            self = cls()
+            self.stats = stats
+            if recover:
+                self.damaged = []
+
+            if backend is not None:
+                if not isinstance(backend, storage.RangeCache):
+                    backend = storage.RangeCache(backend)
+                return self._open(block=backend)
+
+            if compress:
+                if fileobj is None:
+                    fileobj = io.open(
+                        os.path.normpath(os.path.expanduser(name)), 'rb')
+                fileobj = self._decompressor(fileobj, compress, jobs, True)
+
+            return self._open(name, fileobj)
+
+        if mode == 'r|':
+            self = cls()
+            self.mode = mode
+            self.stats = stats
+
+            if fileobj is None:
+                fileobj = io.open(os.path.normpath(os.path.expanduser(name)),
+                                  'rb')
+                self._closefileobj = True
+
+            if compress:
+                fileobj = self._decompressor(fileobj, compress, jobs,
+                                             self._closefileobj)
+                self._closefileobj = True
+
+            self.fileobj = fileobj
+            return self
+
+        if mode == 'r+':
+            self = cls()
+            self.mode = mode
+            self.stats = stats
+            if recover:
+                self.damaged = []
+
+            if fileobj is None:
+                fileobj = io.open(os.path.normpath(os.path.expanduser(name)),
+                                  'r+b')
+
+            self._map = mmap.mmap(fileobj.fileno(), 0, mmap.MAP_SHARED,
+                                  mmap.PROT_READ | mmap.PROT_WRITE)
+            return self._open(name, fileobj, self._map)
+
+        if mode not in ('w', 'a'):
+            raise ValueError('mode must be \'r\', \'r|\', \'r+\', \'w\''
+                             ' or \'a\'')
+
+        if format not in formats:
+            raise ValueError('unknown format \'{0}\''.format(format))
+
+        if deterministic and mode == 'a':
+            raise ValueError('cannot append deterministically')
+
+        if dedup and not issubclass(formats[format], CpioMemberNew):
+            raise ValueError('dedup requires the newc or crc format')
+
+        if compress and mode == 'a':
+            raise ValueError('cannot append to a compressed archive')
+
+        self = cls()
+        self.mode = mode
+        self.member_class = formats[format]
+        self.stats = stats
+        self._sparse = sparse
+
+        if deterministic:
+            self._pending = []
+            self._mtime = mtime
+
+        if dedup:
+            self._digests = {}
+            self._links = {}
+
+        if fileobj is None:
+            path = os.path.normpath(os.path.expanduser(name))
+            if mode == 'a' and os.path.exists(path):
+                fileobj = io.open(path, 'r+b')
+            else:
+                fileobj = io.open(path, 'wb')
+            self._closefileobj = True
+
+        if compress:
+            fileobj = compression.ParallelCompressor(
+                fileobj, compress, jobs=jobs, closefd=self._closefileobj)
+            self._closefileobj = True
+
+        self.fileobj = fileobj
+
+        if mode == 'a':
+            self._seek_trailer()
+
+            if dedup and not issubclass(self.member_class, CpioMemberNew):
+                raise ValueError('dedup requires the newc or crc format')
+
+        if self.gather_threshold and hasattr(os, 'writev'):
+            try:
+                fd = fileobj.fileno()
+            except (AttributeError, io.UnsupportedOperation,
+                    EnvironmentError):
+                pass
+            else:
+                # from here on the descriptor is written directly, so
+                # bring its position into line with the file object's
+                fileobj.flush()
+                if fileobj.seekable():
+                    fileobj.seek(fileobj.tell())
+                self._gather = _Gather(fd)
+
+        if dedup and not deterministic and not fileobj.seekable():
+            raise ValueError('dedup requires a seekable file unless'
+                             ' deterministic')
+
+        return self
+
+    @staticmethod
+    def _decompressor(fileobj, compress, jobs, closefd):
+        """return a file object decompressing *fileobj*"""
+        return compression.ParallelDecompressor(
+            fileobj, None if compress == 'auto' else compress, jobs=jobs,
+            closefd=closefd)
+
+    def _seek_trailer(self):
+        """
+        Position the file for appending by finding the trailer of the
+        existing archive, if any, and adopt the format of that archive.
+        Only the headers are examined; the pages holding member
+        contents are never touched.
+        """
+        self.fileobj.seek(0, os.SEEK_END)
+
+        if not self.fileobj.tell():
+            return
+
+        mymap = mmap.mmap(self.fileobj.fileno(), 0, mmap.MAP_SHARED,
+                          mmap.PROT_READ)
+        try:
+            for member in _walk(mymap):
+                if member.name == TRAILER:
+                    break
+        finally:
+            mymap.close()
+
+        self.member_class = type(member)
+        self.fileobj.seek(member.offset)
+
+    def _open(self, name=None, fileobj=None, mymap=None, block=None):
+        """
+        The _open function takes some form of file identifier and creates
+        an :py:class:`CpioFile` instance from it.
+
+        :param :py:class:`str` name: a file name
+        :param :py:class:`file` fileobj: if given, this overrides *name*
+        :param :py:class:`mmap.mmap` mymap: if given, this overrides *fileobj*
+        :param :py:class:`bytes` block: file contents in a block of memory, (if given, this overrides *mymap*)
+
+        The file to be used can be specified in any of four different
+        forms, (in reverse precedence):
+
+        #. a file name
+        #. :py:class:`file` object
+        #. :py:mod:`mmap.mmap`, or
+        #. a block of memory
+        """
+
+        if block is not None:
+            if not name:
+                name = '<unknown>'
+
+            self.unpack_from(block)
+
+            if fileobj:
+                fileobj.close()
+
+            return self
+
+        if mymap is not None:
+            block = mymap
+
+        elif fileobj:
+            if self.stats is not None:
+                start = self.stats.clock()
+
+            try:
+                mymap = mmap.mmap(fileobj.fileno(), 0,
+                                  mmap.MAP_SHARED, mmap.PROT_READ)
+
+            # pylint: disable=W0702
+            except:
+                # a regular file which cannot be mapped is still read
+                # at offsets rather than through its shared position
+                mymap = None
+                self._backend = _positional(fileobj)
+                if self._backend is None:
+                    block = fileobj.read()
+                else:
+                    block = storage.RangeCache(self._backend)
+
+            if self.stats is not None:
+                self.stats.record('map', start,
+                                  len(block if mymap is None else mymap))
+
+        elif name:
+            fileobj = io.open(os.path.normpath(os.path.expanduser(name)), 'rb')
+
+        else:
+            assert False
+
+        return self._open(name=name,
+                         fileobj=fileobj,
+                         mymap=mymap,
+                         block=block)
+
+    def close(self):
+        """
+        When writing, finish the archive with a trailer and close the
+        file if it was opened by :py:meth:`open`.  When patching, flush
+        and unmap the archive.  When streaming, close the file if it
+        was opened by :py:meth:`open`.  When reading a file which could
+        not be mapped, close the descriptor it is read through.
+        Otherwise a noop.
+        """
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
+
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._map = None
+
+        if self.mode == 'r|':
+            if self._closefileobj and self.fileobj is not None:
+                self.fileobj.close()
+            self.fileobj = None
+            return
+
+        if self.mode not in ('w', 'a') or self.fileobj is None:
+            return
+
+        if self._pending is not None:
+            self._write_pending()
+
+        if self._links:
+            self._relink()
+
+        for buf in self.member_class.trailer().pack_buffers():
+            self._emit(buf)
+        self._flush()
+
+        if self.mode == 'a':
+            self.fileobj.truncate()
+
+        if self._closefileobj:
+            self.fileobj.close()
+        else:
+            self.fileobj.flush()
+
+        self.fileobj = None
+
+    def patch_member(self, name, **fields):
+        """
+        Change the header *fields* of the member *name*, rewriting only
+        the encoded header of that member in the mapped archive.  The
+        archive must have been opened with mode 'r+'.  Only the fields
+        in :py:attr:`patchable` may be changed; content checksums are
+        unaffected since they cover content alone.
+
+        :raises HeaderError: if a value does not fit the member's
+            format, in which case nothing is changed
+        :returns: the patched member
+        """
+        if self._map is None:
+            raise CpioError('archive not open for patching')
+
+        unknown = set(fields).difference(self.patchable)
+        if unknown:
+            raise ValueError('cannot patch {0}'.format(', '.join(sorted(unknown))))
+
+        member = self.get_member(name)
+        if member is None:
+            raise KeyError(name)
+
+        original = dict((key, getattr(member, key)) for key in fields)
+        _, check = member.unpack_header(self._map, member.offset)
+
+        for key, value in fields.items():
+            setattr(member, key, value)
+
+        try:
+            header = member.pack_header(check)
+        except HeaderError:
+            for key, value in original.items():
+                setattr(member, key, value)
+            raise
+
+        end = member.offset + member.coder.size
+        self._map[member.offset:end] = header[:member.coder.size]
+
+        return member
+
+    def add(self, path, arcname=None):
+        """
+        Write the file system object *path* to the archive as a new
+        member named *arcname*, (which defaults to *path*).  Regular
+        file contents are copied with :py:func:`os.sendfile` where
+        possible.
+
+        :returns: the new member
+        """
+        if arcname is None:
+            arcname = path
+
+        if not isinstance(arcname, bytes):
+            arcname = os.fsencode(arcname)
+
+        status = os.lstat(path)
+        member = self.member_class.from_stat(arcname, status)
+
+        if stat.S_ISLNK(status.st_mode):
+            target = os.readlink(path)
+            if not isinstance(target, bytes):
+                target = os.fsencode(target)
+            member.content = target
+            member.filesize = len(target)
+            return self.addfile(member)
+
+        if stat.S_ISREG(status.st_mode):
+            if self._pending is not None:
+                self._pending.append((member, path))
+                return member
+
+            with io.open(path, 'rb') as fileobj:
+                return self.addfile(member, fileobj)
+
+        return self.addfile(member)
+
+    def addfile(self, member, fileobj=None):
+        """
+        Write *member* to the archive.  Its content is read from
+        *fileobj* if given, and taken from member.content otherwise.
+
+        :returns: *member*
+        """
+        if self.mode not in ('w', 'a'):
+            raise CpioError('archive not open for writing')
+
+        if self._pending is not None:
+            if fileobj is not None:
+                member.content = fileobj.read(member.filesize)
+            self._pending.append((member, None))
+            return member
+
+        return self._write(member, fileobj)
+
+    def _write_pending(self):
+        """
+        Normalize and write the members queued by a deterministic
+        archive, in name order.
+        """
+        pending, self._pending = self._pending, None
+        pending.sort(key=lambda entry: entry[0].name)
+
+        if self._digests is not None:
+            self._group_duplicates(pending)
+
+        _normalize([member for member, _ in pending], self._mtime)
+
+        for member, path in pending:
+            if path is None:
+                self._write(member)
+            else:
+                with io.open(path, 'rb') as fileobj:
+                    self._write(member, fileobj)
+
+    def _group_duplicates(self, pending):
+        """
+        Turn queued regular files with duplicate contents into hardlink
+        groups before a deterministic archive is normalized, so that
+        their link counts are known when they are written.  Ownership
+        and mtime are ignored here since normalization makes them
+        equal.
+        """
+        firsts = {}
+
+        for member, path in pending:
+            if not stat.S_ISREG(member.mode) or not member.filesize:
+                continue
+
+            if path is None:
+                digest, _ = _digest(None, member.content, member.filesize,
+                                    self.dedup_algorithm)
+            else:
+                with io.open(path, 'rb') as fileobj:
+                    digest, _ = _digest(fileobj, None, member.filesize,
+                                        self.dedup_algorithm)
+
+            first = firsts.setdefault((digest, member.filesize, member.mode),
+                                      member)
+            if first is not member:
+                member.devmajor = first.devmajor
+                member.devminor = first.devminor
+                member.ino = first.ino
+                member.nlink = first.nlink = 2
+
+    def _dedup(self, member, fileobj):
+        """
+        Decide whether regular file *member* is a hardlink to content
+        already written.  If so, make it one, (with no data).
+
+        :returns: a tuple of the file object to take content from, (or
+            None), and the content checksum, (or None if not yet known)
+        """
+        key = (member.devmajor, member.devminor, member.ino)
+
+        if member.nlink > 1:
+            # Already a hardlink, either in the file system or because
+            # a deterministic archive grouped it.
+            if key not in self._links:
+                self._links[key] = [member]
+                return fileobj, None
+
+            first = key
+
+        else:
+            digest, check = _digest(fileobj, member.content, member.filesize,
+                                    self.dedup_algorithm)
+            if not isinstance(member, CpioMemberCRC):
+                check = 0
+
+            first = self._digests.setdefault(
+                (digest, member.filesize, member.mode, member.uid,
+                 member.gid, member.mtime), key)
+
+            if first == key:
+                self._links[key] = [member]
+                return fileobj, check
+
+        group = self._links[first]
+        member.devmajor = group[0].devmajor
+        member.devminor = group[0].devminor
+        member.ino = group[0].ino
+        member.filesize = 0
+        member.content = b''
+        group.append(member)
+
+        return None, 0
+
+    def _relink(self):
+        """
+        Rewrite the headers of hardlink groups created by dedup whose
+        link counts were not known when they were written.
+        """
+        links, self._links = self._links, None
+        position = None
+
+        for group in links.values():
+            for member in group:
+                if member.nlink == len(group):
+                    continue
+
+                if member.offset is None:
+                    raise CpioError('cannot correct link counts in an'
+                                    ' unseekable archive')
+
+                if position is None:
+                    self._flush()
+                    self.fileobj.flush()
+                    position = self.fileobj.tell()
+
+                member.nlink = len(group)
+                self.fileobj.seek(member.offset)
+                self.fileobj.write(member.pack_header(member.check)
+                                   [:member.coder.size])
+
+        if position is not None:
+            self.fileobj.seek(position)
+
+    def _write(self, member, fileobj=None):
+        """stream *member* to the archive - see :py:meth:`addfile`"""
+        stats = self.stats
+        if stats is not None:
+            start = stats.clock()
+
+        check = None
+        if (self._links is not None and stat.S_ISREG(member.mode)
+            and member.filesize):
+            fileobj, check = self._dedup(member, fileobj)
+
+        data = None
+        if (fileobj is not None and self._gather is not None
+            and not self._sparse and member.filesize < self.gather_threshold):
+            # small enough to batch, so read it now, once
+            data = _read(fileobj, member.filesize)
+            fileobj = None
+
+            if check is None and isinstance(member, CpioMemberNew):
+                # pylint: disable=W0212
+                check = member._checksum(data, 0, member.filesize)
+
+                if stats is not None:
+                    start = stats.record('checksum', start, member.filesize)
+
+        if (check is None and fileobj is not None
+            and isinstance(member, CpioMemberNew)):
+            check = member.stream_checksum(fileobj, member.filesize,
+                                           self._sparse)
+
+            if stats is not None:
+                start = stats.record('checksum', start, member.filesize)
+
+        if self._links is not None:
+            member.check = check
+            if self.fileobj.seekable():
+                member.offset = self._tell()
+
+        if data is not None:
+            buffers = [member.pack_header(check), data,
+                       b'\x00' * member.datapad]
+        elif fileobj is None:
+            buffers = member.pack_buffers(check)
+        else:
+            buffers = [member.pack_header(check)]
+
+        if stats is not None:
+            start = stats.record('pack', start, len(buffers[0]))
+
+        for buf in buffers:
+            self._emit(buf)
+
+        if fileobj is not None:
+            self._flush()
+            if self._sparse:
+                _copy_sparse(fileobj, self.fileobj, member.filesize)
+            else:
+                _copy(fileobj, self.fileobj, member.filesize)
+            if self._gather is not None:
+                # whatever the copy left in the file object's buffer
+                # must reach the descriptor before the next writev
+                self.fileobj.flush()
+            self._emit(b'\x00' * member.datapad)
+
+        self.members.append(member)
+
+        if stats is not None:
+            stats.record('write', start, member.filesize + member.datapad)
+
+        return member
+
+    def _emit(self, buf):
+        """write *buf* to the archive, batching it if possible"""
+        gather = self._gather
+
+        if gather is None:
+            self.fileobj.write(buf)
+            return
+
+        gather.append(buf)
+
+        if (gather.pending >= self.gather_threshold
+            or len(gather.buffers) >= self.gather_buffers):
+            gather.flush(self.gather_buffers)
+
+    def _flush(self):
+        """write any batched buffers"""
+        if self._gather is not None:
+            self._gather.flush(self.gather_buffers)
+
+    def _tell(self):
+        """return the archive position, including batched buffers"""
+        pending = self._gather.pending if self._gather is not None else 0
+        return self.fileobj.tell() + pending
+
+    def extract(self, member, path='', fileobj=None):
+        """
+        Create *member* in the file system below directory *path*.
+        Content is read from *fileobj* if given and taken from
+        member.content otherwise.  Leading slashes are stripped from
+        member names and names which would escape *path*, either with
+        '..' or through a symlink below *path*, (as one extracted
+        earlier), are refused.
+        Runs of zeros are left as holes, (see :py:attr:`holesize`), as
+        are the holes of a sparse *fileobj*.
+
+        :returns: the path created
+        """
+        name = member.name.lstrip(b'/')
+        target = _extract_path(member.name, path)
+        mode = member.mode
+        parent = os.path.dirname(target)
+
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+
+        if stat.S_ISDIR(mode):
+            if os.path.islink(target) and name:
+                # replace it, rather than change modes through it
+                os.unlink(target)
+            if not os.path.isdir(target):
+                os.mkdir(target, 0o700)
+
+        else:
+            if os.path.lexists(target):
+                os.unlink(target)
+
+            if stat.S_ISLNK(mode):
+                target_name = (fileobj.read(member.filesize) if fileobj
+                               else member.content)
+                os.symlink(target_name, target)
+                return target
+
+            if stat.S_ISREG(mode):
+                with io.open(target, 'wb') as out:
+                    if fileobj is not None:
+                        _copy_sparse(fileobj, out, member.filesize,
+                                     seek=bool(self.holesize))
+                    elif member.filesize and self.holesize:
+                        with member.open() as reader:
+                            _write_holes(reader, out, member.filesize,
+                                         self.holesize)
+                    elif member.filesize:
+                        with member.open() as reader:
+                            shutil.copyfileobj(reader, out)
+
+            elif stat.S_ISFIFO(mode):
+                os.mkfifo(target)
+
+            else:
+                os.mknod(target, mode, os.makedev(member.rdevmajor,
+                                                  member.rdevminor))
+
+        os.chmod(target, stat.S_IMODE(mode))
+        os.utime(target, (member.mtime, member.mtime))
+
+        return target
+
+    def unpack_from(self, block, offset=0):
+        stats = self.stats
+        if stats is not None:
+            start = stats.clock()
+
+        pointer = offset
+
+        while True:
+            try:
+                cmem = CpioMember.encoded_class(block, pointer)()
+                if stats is not None:
+                    cmem.stats = stats
+                cmem.unpack_from(block, pointer)
+
+            except CheckSumError:
+                if self.damaged is None:
+                    raise
+                # the header is sound, so only this member is lost
+                self.damaged.append((pointer, pointer + cmem.size))
+                pointer += cmem.size
+                continue
+
+            except CpioError:
+                if self.damaged is None:
+                    raise
+                resync = _resync(block, pointer + 1)
+                self.damaged.append((pointer, len(block) if resync is None
+                                     else resync))
+                if resync is None:
+                    break
+                pointer = resync
+                continue
+
+            cmem.offset = pointer
+            pointer += cmem.size
+
+            if cmem.name == TRAILER:
+                break
+
+            self.members.append(cmem)
+
+        if stats is not None:
+            stats.record('unpack', start, pointer - offset)
+
+    def __iter__(self):
+        return self.iter_members()
+
+    def iter_members(self, include=None, exclude=None, predicate=None):
+        """
+        Generate the members which match the given filters, in archive
+        order.  The filters are applied to each member as soon as its
+        header and name are decoded, so the contents of rejected
+        members are never copied, and in 'r|' mode are skipped by
+        seeking, or by discarding reads where the file cannot seek.
+
+        In 'r|' mode the file is read as it is iterated, so it can be
+        iterated only once, and members are not kept in
+        :py:attr:`members`.
+
+        :param include: a pattern or list of patterns.  If given, only
+            members whose names match one of them are generated.  A
+            pattern is a shell style glob, (str or bytes), a compiled
+            regular expression, which is searched for in the name, or a
+            callable which is passed the name.
+        :param exclude: a pattern or list of patterns.  Members whose
+            names match any of them are not generated.
+        :param predicate: if given, a callable which is passed each
+            member, (with its header fields and name but no content),
+            and returns true for those to generate
+        """
+        select = _selector(include, exclude, predicate)
+
+        if self.mode == 'r|':
+            return self._iter_stream(select)
+
+        if select is None:
+            return iter(self.members)
+
+        return (member for member in self.members if select(member))
+
+    def _iter_stream(self, select):
+        """
+        Generate the members read sequentially from
+        :py:attr:`fileobj`, for which *select* is true, (or all if it
+        is None).
+        """
+        fileobj = self.fileobj
+        stats = self.stats
+        pointer = 0
+
+        while True:
+            member, check = _read_member_header(fileobj, pointer, stats)
+
+            if stats is not None:
+                start = stats.clock()
+
+            pointer += member.size
+
+            if member.name == TRAILER:
+                return
+
+            if select is not None and not select(member):
+                _skip(fileobj, member.filesize + member.datapad)
+                continue
+
+            content = _read(fileobj, member.filesize)
+
+            if check is not None:
+                # pylint: disable=W0212
+                if check != member._checksum(content, 0, member.filesize):
+                    raise CheckSumError
+
+                if stats is not None:
+                    stats.record('checksum', start, member.filesize)
+
+            member.content = content
+            _skip(fileobj, member.datapad)
+
+            yield member
+
+    def pack_into(self, block, offset=0):
+        stats = self.stats
+        if stats is not None:
+            start = stats.clock()
+
+        pointer = offset
+
+        for member in self.members:
+            member.pack_into(block, pointer)
+            pointer += member.size
+
+        trailer = self._trailer_class().trailer()
+        trailer.pack_into(block, pointer)
+
+        if stats is not None:
+            stats.record('pack', start, pointer + trailer.size - offset)
+
+    def _trailer_class(self):
+        """the member class of the trailer when packing"""
+        if self.member_class is not None:
+            return self.member_class
+        if self.members:
+            return type(self.members[0])
+        return CpioMemberNew
+
+    @property
+    def size(self):
+        """
+        Exact size in bytes of this archive when packed, including all
+        padding and the trailer.
+        """
+        return (sum(member.size for member in self.members)
+                + self._trailer_class().trailer().size)
+
+    def pack_file(self, name):
+        """
+        Pack this archive into a new file *name* through a writable
+        :py:mod:`mmap` of exactly :py:attr:`size` bytes, so that
+        contents are copied once, from their archive or memory straight
+        into the page cache.
+
+        :returns: the size of the file
+        """
+        size = self.size
+
+        with io.open(os.path.normpath(os.path.expanduser(name)),
+                     'w+b') as fileobj:
+            fileobj.truncate(size)
+            mymap = mmap.mmap(fileobj.fileno(), size, mmap.MAP_SHARED,
+                              mmap.PROT_READ | mmap.PROT_WRITE)
+            try:
+                self.pack_into(mymap)
+                mymap.flush()
+            finally:
+                mymap.close()
+
+        return size
+
+    def extractall(self, path='', members=None):
+        """
+        Extract *members*, (default all members), below directory
+        *path*.  Directories are created as needed and have their
+        modes and times set last so that read only directories can
+        still be populated.
+        """
+        directories = []
+        links = {}
+        deferred = {}
+
+        for member in self if members is None else members:
+            if stat.S_ISDIR(member.mode):
+                directories.append(member)
+                continue
+
+            if not stat.S_ISREG(member.mode) or member.nlink < 2:
+                self.extract(member, path)
+                continue
+
+            # Hardlinks.  A link's data may come with any one of its
+            # members, (the last one by GNU cpio's newc convention), so
+            # empty members are deferred until it has been seen.
+            key = (member.devmajor, member.devminor, member.ino)
+
+            if key in links:
+                self._extract_link(member, path, links[key])
+            elif not member.filesize:
+                deferred.setdefault(key, []).append(member)
+            else:
+                self.extract(member, path)
+                links[key] = member
+                for other in deferred.pop(key, []):
+                    self._extract_link(other, path, member)
+
+        for group in deferred.values():
+            self.extract(group[0], path)
+            for other in group[1:]:
+                self._extract_link(other, path, group[0])
+
+        directories.sort(key=lambda member: member.name, reverse=True)
+        for member in directories:
+            self.extract(member, path)
+
+    def _extract_link(self, member, path, source):
+        """
+        extract *member* below *path* as a hardlink to member *source*,
+        which has been extracted already.
+        """
+        # both are checked, as a symlink extracted since may lie above
+        # either of them
+        source = _extract_path(source.name, path)
+        target = _extract_path(member.name, path)
+
+        parent = os.path.dirname(target)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+
+        if os.path.lexists(target):
+            os.unlink(target)
+
+        os.link(source, target)
+        return target
+
+    def get_member(self, name):
+        """return a member by *name*"""
+        for member in self.members:
+            if member.name == name:
+                return member
+
+        return None
+
+    def data_member(self, member):
+        """
+        return the member which carries the content of *member*: itself,
+        or for a hardlink stored without data, (as GNU cpio's newc
+        format stores all but one link of each group), the member of its
+        link group which has it.
+        """
+        if (member.filesize or member.nlink < 2
+            or not stat.S_ISREG(member.mode)):
+            return member
+
+        if self._holders is None:
+            self._holders = dict(
+                ((other.devmajor, other.devminor, other.ino), other)
+                for other in self.members
+                if stat.S_ISREG(other.mode) and other.filesize
+                and other.nlink > 1)
+
+        return self._holders.get((member.devmajor, member.devminor,
+                                  member.ino), member)
+
+    def open_member(self, member):
+        """
+        return a seekable, read only :py:class:`CpioMemberReader` over
+        the content of *member*, which is a member or the name of one.
+        Nothing is copied until it is read, so large members can be
+        streamed, (eg, with :py:func:`shutil.copyfileobj`), in bounded
+        memory.
+
+        :raises KeyError: if there is no member by that name
+        """
+        if not isinstance(member, CpioMember):
+            name = member
+            member = self.get_member(name)
+            if member is None:
+                raise KeyError('member {0!r} not found'.format(name))
+
+        return member.open()
+
+    def manifest(self, algorithms=('sha256',), include=None, exclude=None,
+                 jobs=None):
+        """
+        return a :py:class:`CpioManifest` of the members which match
+        *include* and *exclude*, (as for :py:meth:`iter_members`).
+        Each content is read once, straight from the map, (or as it is
+        streamed in mode 'r|'), and fed to every algorithm.  Hardlinks
+        stored without data are given the size and digests of the link
+        which carries it, (see :py:meth:`data_member`), wherever in the
+        archive that is.
+
+        :param algorithms: names of :py:mod:`hashlib` algorithms, eg,
+            'sha256' or 'blake2b'
+        :param int jobs: threads hashing contents of at least
+            :py:attr:`hash_threshold` bytes, (default one per cpu)
+        """
+        if isinstance(algorithms, (str, bytes)):
+            algorithms = [algorithms]
+        algorithms = [hashlib.new(algorithm).name for algorithm in algorithms]
+
+        jobs = jobs or os.cpu_count() or 1
+        entries = []
+        pending = collections.deque()
+        holders = {}
+        links = []
+
+        with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+            for member in self.iter_members(include, exclude):
+                if stat.S_ISREG(member.mode) and member.nlink > 1:
+                    key = (member.devmajor, member.devminor, member.ino)
+                    if member.filesize:
+                        holders.setdefault(key, len(entries))
+                    else:
+                        # filled in once the whole archive is seen
+                        links.append((len(entries), key))
+
+                source, start = member._source() # pylint: disable=W0212
+
+                if member.filesize >= self.hash_threshold:
+                    digests = pool.submit(_hash, source, start,
+                                          member.filesize, algorithms)
+                    pending.append(len(entries))
+                else:
+                    digests = _hash(source, start, member.filesize,
+                                    algorithms)
+
+                entries.append((member.name, member.mode, member.filesize,
+                                digests))
+
+                # a streamed content is held until it is hashed, so
+                # bound the number waiting
+                while len(pending) > 2 * jobs:
+                    index = pending.popleft()
+                    name, mode, size, digests = entries[index]
+                    entries[index] = (name, mode, size, digests.result())
+
+            for index in pending:
+                name, mode, size, digests = entries[index]
+                entries[index] = (name, mode, size, digests.result())
+
+        for index, key in links:
+            if key in holders:
+                name, mode, _, _ = entries[index]
+                _, _, size, digests = entries[holders[key]]
+                entries[index] = (name, mode, size, digests)
+
+        return CpioManifest(entries)
+
+    def diff(self, other, fields=None):
+        """
+        return a :py:class:`CpioDiff` describing how archive *other*
+        differs from this one.
+        """
+        return CpioDiff(self, other, fields)
+
+    def __eq__(self, other):
+        return (isinstance(other, CpioFile)
+                and len(self.members) == len(other.members)
+                and all(mine == theirs
+                        and mine.name == theirs.name
+                        and mine.content == theirs.content
+                        for mine, theirs in zip(self.members, other.members)))
+
+    def close_enough(self, other):
+        """
+        Archives are close enough if they hold close enough members by
+        the same names, in any order.
+        """
+        return (isinstance(other, CpioFile)
+                and not self.diff(other, ('mode', 'uid', 'gid', 'filesize',
+                                          'rdevmajor', 'rdevminor')))
+
+class CpioManifest(object):
+    """
+    The names, modes, sizes and content digests of the members of an
+    archive, as made by :py:meth:`CpioFile.manifest`, which can be
+    saved with :py:meth:`dump`, read back with :py:meth:`load` and
+    checked against an archive with :py:meth:`verify`.
+
+    .. py:attribute:: entries
+
+       (name, mode, size, digests) tuples in archive order, where
+       digests is a dict of hex digests by :py:mod:`hashlib` algorithm
+    """
+
+    def __init__(self, entries=None):
+        self.entries = list(entries or [])
+
+    @property
+    def algorithms(self):
+        """the algorithms used in any entry"""
+        return sorted(set(algorithm for _, _, _, digests in self.entries
+                          for algorithm in digests))
+
+    def dump(self, fileobj):
+        """
+        write the entries to text file *fileobj*, one JSON object per
+        line.  Names are decoded with surrogateescape, so any bytes
+        survive :py:meth:`load`.
+        """
+        for name, mode, size, digests in self.entries:
+            fileobj.write(json.dumps({
+                'name': name.decode('utf-8', 'surrogateescape'),
+                'mode': mode,
+                'size': size,
+                'digests': digests,
+                }, sort_keys=True))
+            fileobj.write('\n')
+
+    @classmethod
+    def load(cls, fileobj):
+        """return the manifest written to text file *fileobj* by :py:meth:`dump`"""
+        entries = []
+
+        for line in fileobj:
+            if line.strip():
+                record = json.loads(line)
+                entries.append((record['name'].encode('utf-8',
+                                                      'surrogateescape'),
+                                record['mode'], record['size'],
+                                record['digests']))
+
+        return cls(entries)
+
+    def verify(self, archive, jobs=None):
+        """
+        Check *archive* against this manifest, hashing its contents with
+        the algorithms recorded here.  Where a name occurs more than
+        once, the last occurrence counts, as it would on extraction.
+
+        :returns: a list of (name, differences) tuples, empty if the
+            archive matches, where differences is ['missing'] for a
+            name which is not in the archive, ['unexpected'] for one
+            which is not in the manifest, or a list of 'mode', 'size'
+            and the algorithms whose digests differ
+        """
+        actual = archive.manifest(self.algorithms or ['sha256'], jobs=jobs)
+        found = dict((name, (mode, size, digests))
+                     for name, mode, size, digests in actual.entries)
+        expected = dict((name, (mode, size, digests))
+                        for name, mode, size, digests in self.entries)
+        problems = []
+
+        for name in sorted(expected):
+            if name not in found:
+                problems.append((name, ['missing']))
+                continue
+
+            mode, size, digests = expected[name]
+            other_mode, other_size, other_digests = found[name]
+            differences = []
+
+            if mode != other_mode:
+                differences.append('mode')
+            if size != other_size:
+                differences.append('size')
+            differences.extend(algorithm for algorithm in sorted(digests)
+                               if digests[algorithm]
+                               != other_digests.get(algorithm))
+
+            if differences:
+                problems.append((name, differences))
+
+        problems.extend((name, ['unexpected']) for name in sorted(found)
+                        if name not in expected)
+        return problems
+
+class CpioDiff(object):
+    """
+    The differences between two archives, *old* and *new*.  Members
+    are joined by name through a dict index of each archive.  Headers
+    are compared first, and contents only when their sizes match, a
+    chunk at a time without copying them out of the archives.  The size
+    and content of a hardlink stored without data are those of the
+    link which carries it (see :py:meth:`CpioFile.data_member`).
+
+    .. py:attribute:: added
+
+       members of *new* whose names are not in *old*
+
+    .. py:attribute:: removed
+
+       members of *old* whose names are not in *new*
+
+    .. py:attribute:: changed
+
+       (old member, new member, differences) tuples, where differences
+       is a list of the names of the differing :py:attr:`fields`, plus
+       'content' if the contents differ
+
+    :param fields: the header fields to compare, (default
+        :py:attr:`fields`)
+    """
+
+    fields = ('mode', 'uid', 'gid', 'mtime', 'filesize',
+              'rdevmajor', 'rdevminor')
+    """
+    The header fields compared by default.  Inode, device and link
+    numbers are left out as they describe where an archive was made
+    rather than what is in it.
+    """ # pylint: disable=W0105
+
+    def __init__(self, old, new, fields=None):
+        if fields is not None:
+            self.fields = tuple(fields)
+
+        self.old = old
+        self.new = new
+        self.added = []
+        self.removed = []
+        self.changed = []
+
+        index = dict((member.name, member) for member in old.members)
+        seen = set()
+
+        for member in new.members:
+            seen.add(member.name)
+            previous = index.get(member.name)
+
+            if previous is None:
+                self.added.append(member)
+                continue
+
+            # a hardlink stored without data has the size and content
+            # of the link which carries it
+            olddata = old.data_member(previous)
+            newdata = new.data_member(member)
+
+            differences = []
+            for field in self.fields:
+                if field == 'filesize':
+                    one, other = olddata, newdata
+                else:
+                    one, other = previous, member
+                if getattr(one, field) != getattr(other, field):
+                    differences.append(field)
+
+            if (olddata.filesize == newdata.filesize
+                and not _same_content(olddata, newdata)):
+                differences.append('content')
+
+            if differences:
+                self.changed.append((previous, member, differences))
+
+        self.removed = [member for member in old.members
+                        if member.name not in seen]
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    __nonzero__ = __bool__
+
+    def write(self, name=None, fileobj=None, format=None):
+        """
+        Write a delta archive holding the added and changed members of
+        the new archive, in its order.  Removals cannot be expressed in
+        a cpio archive and are left out.
+
+        :param str format: a key of :py:data:`formats`, (default the
+            format of the new archive's first member, or newc)
+        :returns: the number of members written
+        """
+        # pylint: disable=W0622
+        wanted = set(member.name for member in self.added)
+        wanted.update(new.name for _, new, _ in self.changed)
+        members = [member for member in self.new.members
+                   if member.name in wanted]
+
+        if format is None:
+            format = 'newc'
+            if self.new.members:
+                for key, value in sorted(formats.items()):
+                    if type(self.new.members[0]) is value:
+                        format = key
+                        break
+
+        with CpioFile.open(name, 'w', fileobj=fileobj, format=format) as out:
+            for member in members:
+                out.addfile(_recode(member, out.member_class))
+
+        return len(members)
+
+def _recode(member, member_class):
+    """return *member*, or a copy of it as a *member_class* instance"""
+    if type(member) is member_class:
+        return member
+
+    copy = member_class()
+    for field in ('name', 'devmajor', 'devminor', 'ino', 'mode', 'uid',
+                  'gid', 'nlink', 'rdevmajor', 'rdevminor', 'mtime',
+                  'filesize', 'content'):
+        setattr(copy, field, getattr(member, field))
+
+    return copy
+
+def transcode(src, dst, format='newc', stats=None):
+    """
+    Copy the archive *src* to *dst*, rewriting every member in
+    *format*.  Both are read and written sequentially, one member at a
+    time, so either may be a pipe and no member is held whole in
+    memory.  Headers are decoded and re-encoded, contents are copied
+    with :py:func:`os.sendfile` where both files allow it, and crc
+    checksums are taken from a crc source or computed as contents
+    pass.  Source checksums are not verified.
+
+    :param src: a file name, or a binary file object to read
+    :param dst: a file name, or a binary file object to write
+    :param str format: a key of :py:data:`formats`
+    :param stats: if given, a :py:class:`CpioStats` instance
+    :raises HeaderError: if a field of a member does not fit *format*,
+        eg, a filesize beyond odc's 11 octal digits.  It is raised
+        before anything of that member is written.  Inode numbers are
+        renumbered to fit formats which have fewer digits for them.
+    :returns: the number of members copied, (not counting the trailer)
+    """
+    # pylint: disable=W0622
+    if format not in formats:
+        raise ValueError('unknown format \'{0}\''.format(format))
+
+    member_class = formats[format]
+    crc = issubclass(member_class, CpioMemberCRC)
+    opened = []
+
+    if isinstance(src, (str, bytes)):
+        src = io.open(os.path.normpath(os.path.expanduser(src)), 'rb')
+        opened.append(src)
+
+    if isinstance(dst, (str, bytes)):
+        dst = io.open(os.path.normpath(os.path.expanduser(dst)), 'wb')
+        opened.append(dst)
+
+    try:
+        pointer = 0
+        count = 0
+        inodes = {}
+        renumbered = 0
+
+        while True:
+            member, check = _read_member_header(src, pointer, stats)
+            pointer += member.size
+            length = member.filesize
+            out = _recode(member, member_class)
+
+            if out.inomask < member.inomask and member.name != TRAILER:
+                # the inode numbers are narrower, so number the members
+                # afresh rather than risk unrelated ones colliding,
+                # keeping hardlinks together
+                key = (member.devmajor, member.devminor, member.ino)
+                number = inodes.get(key) if member.nlink > 1 else None
+                if number is None:
+                    renumbered += 1
+                    number = renumbered
+                    if member.nlink > 1:
+                        inodes[key] = number
+                out.ino = number & out.inomask
+
+            if not crc or member.name == TRAILER:
+                check = 0
+            elif type(member) is not CpioMemberCRC:
+                check = (out.stream_checksum(src, length) if _seekable(src)
+                         else None)
+
+            header = out.pack_header(check or 0)
+
+            if stats is not None:
+                start = stats.clock()
+
+            if check is not None:
+                dst.write(header)
+                _copy(src, dst, length)
+
+            elif _seekable(dst):
+                # write the header now and correct its checksum after
+                position = dst.tell()
+                dst.write(header)
+                check = _copy_checksum(src, dst, length)
+                dst.seek(position)
+                dst.write(out.pack_header(check))
+                dst.seek(length, os.SEEK_CUR)
+
+            else:
+                content = _read(src, length)
+                dst.write(out.pack_header(out._checksum(content, 0, length))) # pylint: disable=W0212
+                dst.write(content)
+
+            dst.write(b'\x00' * out.datapad)
+            _skip(src, member.datapad)
+
+            if stats is not None:
+                stats.record('write', start, out.size)
+
+            if member.name == TRAILER:
+                break
+
+            count += 1
+
+        dst.flush()
+
+    finally:
+        for fileobj in opened:
+            fileobj.close()
+
+    return count
+
+class _RangeView(object):
+    """
+    the parts of the :py:class:`memoryview` interface which
+    :py:class:`CpioMemberReader` uses, over *length* bytes at *start*
+    in a :py:class:`cpiofile.storage.RangeCache`
+    """
+
+    def __init__(self, cache, start, length):
+        self.cache = cache
+        self.start = start
+        self.length = min(length, max(len(cache) - start, 0))
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        begin, end, _ = index.indices(self.length)
+        return self.cache.read_at(self.start + begin, max(end - begin, 0))
+
+    def release(self):
+        """nothing is held, so nothing to release"""
+        pass
+
+class CpioMemberReader(io.RawIOBase):
+    """
+    A seekable, read only file over *length* bytes at *start* in
+    *block*, (usually the :py:mod:`mmap` of an archive), as returned by
+    :py:meth:`CpioFile.open_member`.  Reads copy directly from the
+    block into the caller's buffer, so members of any size can be
+    hashed or copied in fixed size pieces.  The block stays exported,
+    (and so cannot be unmapped), until the reader is closed.
+
+    Each reader keeps its own position and never moves a file
+    position, so readers of one archive may be used from different
+    threads at once.  A single reader is no more thread safe than any
+    other file object.
+    """
+
+    def __init__(self, block, start, length):
+        io.RawIOBase.__init__(self)
+        if isinstance(block, storage.RangeCache):
+            self._view = _RangeView(block, start, length)
+        else:
+            self._view = memoryview(block)[start:start + length]
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+
+        view = self._view
+        position = self._position
+        count = max(min(len(buffer), len(view) - position), 0)
+
+        if count:
+            memoryview(buffer).cast('B')[:count] = view[position:
+                                                       position + count]
+            self._position = position + count
+
+        return count
+
+    def readall(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+
+        position = self._position
+        self._position = max(len(self._view), position)
+        return bytes(self._view[position:])
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += len(self._view)
+        elif whence != os.SEEK_SET:
+            raise ValueError('invalid whence ({0})'.format(whence))
+
+        if offset < 0:
+            raise ValueError('negative seek position {0}'.format(offset))
+
+        self._position = offset
+        return offset
+
+    def tell(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        io.RawIOBase.close(self)
+
+class CpioMember(StructBase):
+    """class representing a member of a cpio archive"""
+
+    coder = None
+
+    name = None
+    magic = None
+    devmajor = None
+    devminor = None
+    ino = None
+    mode = None
+    uid = None
+    gid = None
+    nlink = None
+    rdevmajor = None
+    rdevminor = None
+    mtime = None
+    filesize = None
+
+    _content = None
+    _block = None
+    _datastart = None
+
+    stats = None
+    """a :py:class:`CpioStats` instance, or None when not measuring""" # pylint: disable=W0105
+
+    offset = None
+    """offset of this member's header in the archive it was read from""" # pylint: disable=W0105
+
+    check = None
+    """the content checksum encoded when this member was written""" # pylint: disable=W0105
+
+    inomask = 0xffff
+    """inode numbers are truncated to fit this mask when written""" # pylint: disable=W0105
+
+    @staticmethod
+    def valid_magic(block, offset=0):
+        """
+        predicate indicating whether a block of memory has a valid magic number
+        """
+        try:
+            return CpioMember.encoded_class(block, offset)
+        except InvalidFileFormat:
+            return False
+
+    @staticmethod
+    def encoded_class(block, offset=0):
+        """
+        predicate indicating whether a block of memory includes a magic number
+        """
+        if not block:
+            raise InvalidFileFormatNull
+
+        for key in __magicmap__:
+            if block[offset:offset + len(key)] == key:
+                return __magicmap__[key]
+
+        raise InvalidFileFormat
+
+    def unpack_from(self, block, offset=0):
+        stats = self.stats
+        if stats is not None:
+            start = stats.clock()
+
+        length = len(block)
+        namestart = offset + self.coder.size
+
+        if namestart > length:
+            raise HeaderError('truncated header at {0}'.format(offset))
+
+        if isinstance(block, storage.RangeCache):
+            # struct needs a buffer, so take a copy of just the header
+            header, hoffset = block[offset:namestart], 0
+        else:
+            header, hoffset = block, offset
+
+        try:
+            namesize, check = self.unpack_header(header, hoffset)
+        except (ValueError, struct.error) as error:
+            raise HeaderError('bad header at {0}: {1}'.format(offset, error))
+
+        if stats is not None:
+            start = stats.record('header', start, self.coder.size)
+
+        nameend = namestart + namesize
+
+        if (namesize < 1 or nameend > length
+            or block[nameend - 1:nameend] != b'\x00'):
+            raise HeaderError('bad name at {0}'.format(namestart))
+
+        self.name = block[namestart:nameend - 1] # drop the null
+
+        if stats is not None:
+            start = stats.record('name', start, namesize)
+
+        datastart = nameend + self._namepad(nameend)
+
+        if datastart + self.filesize > length:
+            raise HeaderError('truncated content at {0}'.format(datastart))
+
+        self._content = None
+        self._block = block
+        self._datastart = datastart
+
+        if check is not None:
+            if check != self._checksum(block, datastart, self.filesize):
+                raise CheckSumError
+
+            if stats is not None:
+                stats.record('checksum', start, self.filesize)
+
+        return self
+
+    @property
+    def content(self):
+        """
+        The content of this member as bytes.  Members unpacked from a
+        block of memory copy their content out of it only when this is
+        first used.
+        """
+        if self._content is None and self._block is not None:
+            self._content = self._block[self._datastart:
+                                        self._datastart + self.filesize]
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+        self._block = None
+
+    @property
+    def dataoffset(self):
+        """
+        offset of this member's content in the archive it was read
+        from, or None
+        """
+        return self._datastart
+
+    def open(self, start=0, length=None):
+        """
+        return a :py:class:`CpioMemberReader` over the content of this
+        member, which reads from the archive itself for members
+        unpacked from one.
+
+        :param int start: offset in the content at which the reader
+            begins
+        :param int length: number of bytes the reader covers, (default
+            the rest of the content)
+        """
+        if length is None:
+            length = max(self.filesize - start, 0)
+
+        if self._block is not None:
+            return CpioMemberReader(self._block, self._datastart + start,
+                                    length)
+
+        return CpioMemberReader(self.content, start, length)
+
+    def unpack_header(self, block, offset=0):
+        """
+        Set the metadata of this member from the header at *offset* in
+        *block*, leaving the name and content alone.
+
+        :returns: a tuple of the encoded name size, (including the
+            terminating null), and the encoded checksum, (or None for
+            formats which have none)
+        """
+        (self.magic, dev, self.ino, self.mode,
+         self.uid, self.gid, self.nlink, rdev,
+         mtimehigh, mtimelow, namesize, filesizehigh,
+         filesizelow) = self.coder.unpack_from(block, offset)
+
+        self.devmajor = os.major(dev)
+        self.devminor = os.minor(dev)
+        self.rdevmajor = os.major(rdev)
+        self.rdevminor = os.minor(rdev)
+
+        self.mtime = (mtimehigh << 16) | mtimelow
+        self.filesize = (filesizehigh << 16) | filesizelow
+
+        return namesize, None
+
+    # pylint: disable=W0613
+    def _namepad(self, nameend):
+        """number of pad bytes following a name which ends at *nameend*"""
+        return 0
+    # pylint: enable=W0613
+
+    def _source(self):
+        """
+        return a (block, offset) tuple locating the content of this
+        member, without copying it out of the archive it was read from.
+        """
+        if self._content is None and self._block is not None:
+            return self._block, self._datastart
+
+        return self.content, 0
+
+    def pack_buffers(self, check=None):
+        """
+        return the encoded member as a list of buffers: the header,
+        (with the name and its padding), the content and the padding
+        which follows it.  The content of a member read from an archive
+        is a :py:class:`memoryview` of that archive rather than a copy.
+
+        :param int check: as for :py:meth:`pack_header`
+        """
+        source, start = self._source()
+        if not self.filesize:
+            content = b''
+        elif isinstance(source, bytes) and not start:
+            content = source
+        elif isinstance(source, storage.RangeCache):
+            content = source.read_at(start, self.filesize)
+        else:
+            content = memoryview(source)[start:start + self.filesize]
+
+        return [self.pack_header(check), content, b'\x00' * self.datapad]
+
+    def pack_into(self, block, offset=0):
+        for buf in self.pack_buffers():
+            end = offset + len(buf)
+            block[offset:end] = buf
+            offset = end
+
+        return self
+
+    def pack_header(self, check=None):
+        """
+        return the encoded header of this member followed by its name,
+        the terminating null and any padding, ie, everything which
+        precedes the content.
+
+        :param int check: checksum to encode, for formats which have
+            one.  If None, it is computed from :py:attr:`content`.
+        """
+        # pylint: disable=W0613
+        namesize = len(self.name) + 1
+        dev = os.makedev(self.devmajor, self.devminor) & 0xffff
+        rdev = os.makedev(self.rdevmajor, self.rdevminor)
+
+        for field, value, bits in (('ino', self.ino, 16),
+                                   ('mode', self.mode, 16),
+                                   ('uid', self.uid, 16),
+                                   ('gid', self.gid, 16),
+                                   ('nlink', self.nlink, 16),
+                                   ('rdev', rdev, 16),
+                                   ('mtime', self.mtime, 32),
+                                   ('namesize', namesize, 16),
+                                   ('filesize', self.filesize, 32)):
+            if not 0 <= value < 1 << bits:
+                raise HeaderError('{0}: {1} {2} does not fit in {3} bits'
+                                  .format(self.name, field, value, bits))
+
+        header = self.coder.pack(self.magic, dev, self.ino, self.mode,
+                                 self.uid, self.gid, self.nlink, rdev,
+                                 self.mtime >> 16, self.mtime & 0xffff,
+                                 namesize, self.filesize >> 16,
+                                 self.filesize & 0xffff)
+
+        return header + self.name + b'\x00' * (1 + (namesize & 1))
+
+    @property
+    def datapad(self):
+        """number of null bytes which follow the content of this member"""
+        return 0
+
+    @classmethod
+    def trailer(cls):
+        """return a new member suitable for use as an archive trailer"""
+        member = cls()
+        member.name = TRAILER
+        member.devmajor = member.devminor = 0
+        member.rdevmajor = member.rdevminor = 0
+        member.ino = member.mode = member.uid = member.gid = 0
+        member.nlink = 1
+        member.mtime = member.filesize = 0
+        member.content = b''
+        return member
+
+    @classmethod
+    def from_stat(cls, name, status):
+        """
+        return a new member named *name* with metadata taken from
+        *status*, an :py:func:`os.stat` result.  The content of regular
+        files is left unset, but filesize is set from *status*.
+        """
+        member = cls()
+        member.name = name
+        member.devmajor = os.major(status.st_dev)
+        member.devminor = os.minor(status.st_dev)
+        member.ino = status.st_ino & cls.inomask
+        member.mode = status.st_mode
+        member.uid = status.st_uid
+        member.gid = status.st_gid
+        member.nlink = status.st_nlink
+        member.rdevmajor = os.major(status.st_rdev)
+        member.rdevminor = os.minor(status.st_rdev)
+        member.mtime = int(status.st_mtime)
+
+        if stat.S_ISREG(status.st_mode):
+            member.filesize = status.st_size
+        else:
+            member.filesize = 0
+            member.content = b''
+
+        return member
+
+    @property
+    def size(self):
+        return (self.coder.size
+                + len(self.name) + 1
+                + self.filesize)
+
+    def __repr__(self):
+        return ('<{0}@{1}: coder={2}, name=\'{3}\', magic=\'{4}\''
+                +', devmajor={5}, devminor={6}, ino={7}, mode={8}'
+                +', uid={9}, gid={10}, nlink={11}, rdevmajor={12}'
+                +', rdevmino={13}, mtime={14}, filesize={15}>'
+                .format(self.__class__.__name__, hex(id(self)), self.coder,
+                        self.name, self.magic, self.devmajor, self.devminor,
+                        self.ino, self.mode, self.uid, self.gid, self.nlink,
+                        self.rdevmajor, self.rdevminor, self.mtime,
+                        self.filesize))
+
+    def __eq__(self, other):
+        return (isinstance(other, self.__class__)
+                and self.coder == other.coder
+                and self.magic == other.magic
+                and self.devmajor == other.devmajor
+                and self.devminor == other.devminor
+                and self.ino == other.ino
+                and self.mode == other.mode
+                and self.uid == other.uid
+                and self.gid == other.gid
+                and self.nlink == other.nlink
+                and self.rdevmajor == other.rdevmajor
+                and self.rdevminor == other.rdevminor
+                and self.mtime == other.mtime
+                and self.filesize == other.filesize)
+
+    def close_enough(self, other):
+        """
+        Members are close enough if they have the same name, type,
+        permissions, owner, size, device numbers and content,
+        regardless of format, inode, link count, containing device or
+        mtime.
+        """
+        return (isinstance(other, CpioMember)
+                and self.name == other.name
+                and self.mode == other.mode
+                and self.uid == other.uid
+                and self.gid == other.gid
+                and self.filesize == other.filesize
+                and self.rdevmajor == other.rdevmajor
+                and self.rdevminor == other.rdevminor
+                and self.content == other.content)
+
+class CpioMemberBin(CpioMember):
+    """intermediate class indicating binary members - for subclassing only"""
+
+    @property
+    def datapad(self):
+        return self.filesize & 1
+
+    def _namepad(self, nameend):
+        return nameend & 1
+
+    @property
+    def size(self):
+        namesize = len(self.name) + 1 # add null
+
+        retval = self.coder.size
+        retval += namesize
+
+        if isinstance(self, CpioMemberBin) and (namesize & 1):
+            retval += 1
+
+        retval += self.filesize
+
+        if isinstance(self, CpioMemberBin) and (self.filesize & 1):
+            retval += 1
+
+        return retval
+
+class CpioMember32b(CpioMemberBin):
+    """
+    .. todo:: need to pad after name and after content for old binary.
+    """
+    coder = struct.Struct(b'>2sHHHHHHHHHHHH')
+    magic = b'\x71\xc7'
+
+class CpioMember32l(CpioMemberBin):
+    """class representing a 32bit little endian binary member"""
+    coder = struct.Struct(b'<2sHHHHHHHHHHHH')
+    magic = b'\xc7\x71'
+
+class CpioMemberODC(CpioMember):
+    """class representing an ODC member"""
+    coder = struct.Struct(b'=6s6s6s6s6s6s6s6s11s6s11s')
+    magic = b'070707'
+    inomask = 0o777777
+
+    def unpack_header(self, block, offset=0):
+        (self.magic, dev, ino, mode,
+         uid, gid, nlink, rdev,
+         mtime, namesize, filesize) = self.coder.unpack_from(block, offset)
+
+        self.ino = int(ino, 8)
+        self.mode = int(mode, 8)
+        self.uid = int(uid, 8)
+        self.gid = int(gid, 8)
+        self.nlink = int(nlink, 8)
+
+        dev = int(dev, 8)
+        rdev = int(rdev, 8)
+        self.devmajor = os.major(dev)
+        self.devminor = os.minor(dev)
+        self.rdevmajor = os.major(rdev)
+        self.rdevminor = os.minor(rdev)
+
+        self.mtime = int(mtime, 8)
+        self.filesize = int(filesize, 8)
+
+        return int(namesize, 8), None
+
+    def pack_header(self, check=None):
+        # pylint: disable=W0613
+        namesize = len(self.name) + 1
+        dev = os.makedev(self.devmajor, self.devminor)
+        rdev = os.makedev(self.rdevmajor, self.rdevminor)
+
+        return self.coder.pack(
+            self.magic, _octal(dev, 6, 'dev'), _octal(self.ino, 6, 'ino'),
+            _octal(self.mode, 6, 'mode'), _octal(self.uid, 6, 'uid'),
+            _octal(self.gid, 6, 'gid'), _octal(self.nlink, 6, 'nlink'),
+            _octal(rdev, 6, 'rdev'), _octal(self.mtime, 11, 'mtime'),
+            _octal(namesize, 6, 'namesize'),
+            _octal(self.filesize, 11, 'filesize')) + self.name + b'\x00'
+
+class CpioMemberNew(CpioMember):
+    """class representing a new member"""
+    coder = struct.Struct(b'6s8s8s8s8s8s8s8s8s8s8s8s8s8s')
+    magic = b'070701'
+    inomask = 0xffffffff
+
+    # pylint: disable=W0613
+    @staticmethod
+    def _checksum(block, offset, length):
+        """return a checksum for *block* at *offset* and *length*"""
+        return 0
+    # pylint: enable=W0613
+
+    def unpack_header(self, block, offset=0):
+        unpacks = self.coder.unpack_from(block, offset)
+
+        self.magic = unpacks[0]
+
+        self.ino = int(unpacks[1], 16)
+        self.mode = int(unpacks[2], 16)
+        self.uid = int(unpacks[3], 16)
+        self.gid = int(unpacks[4], 16)
+        self.nlink = int(unpacks[5], 16)
+
+        self.mtime = int(unpacks[6], 16)
+        self.filesize = int(unpacks[7], 16)
+
+        self.devmajor = int(unpacks[8], 16)
+        self.devminor = int(unpacks[9], 16)
+        self.rdevmajor = int(unpacks[10], 16)
+        self.rdevminor = int(unpacks[11], 16)
+
+        return int(unpacks[12], 16), int(unpacks[13], 16)
+
+    def _namepad(self, nameend):
+        return (4 - (nameend % 4)) % 4
+
+    def pack_header(self, check=None):
+        namesize = len(self.name) + 1
+
+        if check is None:
+            source, start = self._source()
+            check = self._checksum(source, start, self.filesize)
+
+        header = self.coder.pack(
+            self.magic, _hex(self.ino, field='ino'),
+            _hex(self.mode, field='mode'), _hex(self.uid, field='uid'),
+            _hex(self.gid, field='gid'), _hex(self.nlink, field='nlink'),
+            _hex(self.mtime, field='mtime'),
+            _hex(self.filesize, field='filesize'),
+            _hex(self.devmajor, field='devmajor'),
+            _hex(self.devminor, field='devminor'),
+            _hex(self.rdevmajor, field='rdevmajor'),
+            _hex(self.rdevminor, field='rdevminor'),
+            _hex(namesize, field='namesize'), _hex(check, field='check'))
+
+        return (header + self.name
+                + b'\x00' * (1 + (4 - (self.coder.size + namesize) % 4) % 4))
+
+    @property
+    def datapad(self):
+        return (4 - (self.filesize % 4)) % 4
+
+    def stream_checksum(self, fileobj, length, sparse=False):
+        """
+        return the checksum of the next *length* bytes of *fileobj*,
+        leaving its position unchanged.
+
+        :param bool sparse: if true, holes in *fileobj* are not read
+        """
+        # pylint: disable=W0613
+        return 0
+
+    @property
+    def size(self):
+        retval = self.coder.size
+        retval += len(self.name) + 1
+        retval += ((4 - (retval % 4)) % 4)
+        retval += self.filesize
+        retval += ((4 - (retval % 4)) % 4)
+        return retval
+
+class CpioMemberCRC(CpioMemberNew):
+    """class representing a cpio archive member with a CRC"""
+    magic = b'070702'
+
+    @staticmethod
+    def _checksum(block, offset, length):
+        return sum(bytearray(block[offset:offset + length])) & 0xffffffff
+
+    def stream_checksum(self, fileobj, length, sparse=False,
+                        bufsize=1024 * 1024):
+        start = fileobj.tell()
+        csum = 0
+
+        # holes are zeros, which add nothing to the sum
+        ranges = (_data_ranges(fileobj, length) if sparse
+                  else [(start, start + length)])
+
+        for begin, end in ranges:
+            fileobj.seek(begin)
+            remaining = end - begin
+
+            while remaining:
+                chunk = fileobj.read(min(bufsize, remaining))
+                if not chunk:
+                    raise HeaderError('unexpected end of file')
+                csum += sum(bytearray(chunk))
+                remaining -= len(chunk)
+
+        fileobj.seek(start)
+        return csum & 0xffffffff
+
+__magicmap__ = {
+    b'\x71\xc7': CpioMember32b,
+    b'\xc7\x71': CpioMember32l,
+    b'070707': CpioMemberODC,
+    b'070701': CpioMemberNew,
+    b'070702': CpioMemberCRC,
+    }
+
+formats = {
+    'bin': CpioMember32l if sys.byteorder == 'little' else CpioMember32b,
+    'bin-le': CpioMember32l,
+    'bin-be': CpioMember32b,
+    'odc': CpioMemberODC,
+    'newc': CpioMemberNew,
+    'crc': CpioMemberCRC,
+    }
+"""
+The member classes by the format names used by GNU cpio's -H option.
+'bin' is the native byte order binary format.
+""" # pylint: disable=W0105
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2011, 2013 K Richard Pixley
+#
+# See LICENSE for details.
+
+"""
+Allow cpiofile to be run as ``python -m cpiofile``.
+"""
+
+import sys
+
+from cpiofile.cli import main
+
+sys.exit(main())
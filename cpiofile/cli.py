@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2011, 2013 K Richard Pixley
+#
+# See LICENSE for details.
+
+"""
+Command line interface to cpiofile.
+
+The list, extract, create and pass subcommands mirror the -t, -i, -o
+and -p modes of GNU cpio, using the fastest paths available in the
+library: archives are read through :py:mod:`mmap`, (or streamed from
+stdin), and file contents are copied with :py:func:`os.sendfile` where
+possible.
+"""
+
+from __future__ import unicode_literals, print_function
+
+__docformat__ = 'restructuredtext en'
+
+__all__ = [
+    'main',
+    ]
+
+import argparse
+import io
+import os
+import re
+import stat
+import sys
+import time
+
+import cpiofile
+from cpiofile import http, scan
+
+class _Stats(object):
+    """accumulate and report member and byte counts for --stats"""
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.phases = cpiofile.CpioStats() if enabled else None
+        self.members = 0
+        self.bytes = 0
+        self.start = time.time()
+
+    def count(self, nbytes):
+        """count one member of *nbytes*"""
+        self.members += 1
+        self.bytes += nbytes
+
+    def report(self, stream=None):
+        """write a summary to *stream*, (default stderr), if enabled"""
+        if not self.enabled:
+            return
+
+        stream = stream or sys.stderr
+        elapsed = time.time() - self.start
+        rate = self.bytes / elapsed / (1024 * 1024) if elapsed else 0.0
+        stream.write('{0} members, {1} bytes in {2:.3f}s ({3:.1f} MiB/s)\n'
+                     .format(self.members, self.bytes, elapsed, rate))
+        self.phases.report(stream)
+
+def _read_names(fileobj):
+    """generate the non-empty lines of *fileobj*"""
+    for line in fileobj:
+        line = line.rstrip('\n')
+        if line:
+            yield line
+
+def _read_paths(fileobj, null=False):
+    """generate the names, (as bytes), listed in binary *fileobj*"""
+    separator = b'\x00' if null else b'\n'
+
+    for name in fileobj.read().split(separator):
+        if name:
+            yield name
+
+def _open_archive(args, stats):
+    """
+    open the archive named by -F, or stdin, for reading.  stdin, and
+    compressed archives, are streamed unless recovering, which needs
+    all of it in memory.
+    """
+    if args.file:
+        mode = 'r|' if args.decompress and not args.recover else 'r'
+        return cpiofile.CpioFile.open(args.file, mode, stats=stats.phases,
+                                      recover=args.recover,
+                                      compress=args.decompress,
+                                      jobs=args.jobs)
+
+    return cpiofile.CpioFile.open(mode='r' if args.recover else 'r|',
+                                  fileobj=sys.stdin.buffer,
+                                  stats=stats.phases, recover=args.recover,
+                                  compress=args.decompress, jobs=args.jobs)
+
+def _report_damage(archive):
+    """report the damaged regions of *archive*, returning the exit status"""
+    for start, end in archive.damaged or []:
+        sys.stderr.write('cpiofile: skipped damaged bytes {0} to {1}\n'
+                         .format(start, end))
+
+    return 1 if archive.damaged else 0
+
+def _selected(args, archive):
+    """
+    generate the members of *archive* which match args.patterns.  The
+    contents of other members are never read.
+    """
+    return archive.iter_members(include=args.patterns or None)
+
+def _verbose_line(member):
+    """return an 'ls -l' style line for *member*"""
+    return '{0} {1:3d} {2:<8d} {3:<8d} {4:8d} {5} '.format(
+        stat.filemode(member.mode), member.nlink, member.uid, member.gid,
+        member.filesize,
+        time.strftime('%b %d %H:%M', time.localtime(member.mtime))
+        ).encode('ascii')
+
+def do_list(args):
+    """the 'list' subcommand, like cpio -t"""
+    stats = _Stats(args.stats)
+    out = sys.stdout.buffer
+
+    with _open_archive(args, stats) as archive:
+        for member in _selected(args, archive):
+            if args.verbose:
+                out.write(_verbose_line(member))
+            out.write(member.name + b'\n')
+            stats.count(member.size)
+
+    out.flush()
+    stats.report()
+    return _report_damage(archive)
+
+def do_extract(args):
+    """the 'extract' subcommand, like cpio -i"""
+    stats = _Stats(args.stats)
+
+    def counted(members):
+        for member in members:
+            if args.verbose:
+                sys.stderr.write(member.name.decode('utf-8', 'replace') + '\n')
+            stats.count(member.size)
+            yield member
+
+    with _open_archive(args, stats) as archive:
+        archive.extractall(args.directory, counted(_selected(args, archive)))
+
+    stats.report()
+    return _report_damage(archive)
+
+def do_create(args):
+    """the 'create' subcommand, like cpio -o"""
+    stats = _Stats(args.stats)
+    paths = ([os.fsencode(path) for path in args.paths]
+             or _read_paths(sys.stdin.buffer, args.null))
+
+    options = dict(format=args.format, stats=stats.phases,
+                   deterministic=args.reproducible, mtime=args.mtime,
+                   dedup=args.dedup, sparse=args.sparse,
+                   compress=args.compress, jobs=args.jobs)
+
+    if args.append and (args.reproducible or not args.file):
+        sys.stderr.write('cpiofile: --append requires --file and cannot be'
+                         ' combined with --reproducible\n')
+        return 2
+
+    try:
+        if args.file:
+            archive = cpiofile.CpioFile.open(args.file,
+                                             'a' if args.append else 'w',
+                                             **options)
+        else:
+            archive = cpiofile.CpioFile.open(mode='w',
+                                             fileobj=sys.stdout.buffer,
+                                             **options)
+    except ValueError as error:
+        sys.stderr.write('cpiofile: {0}\n'.format(error))
+        return 2
+
+    with archive:
+        for path in paths:
+            member = archive.add(path)
+            if args.verbose:
+                sys.stderr.write(path.decode('utf-8', 'replace') + '\n')
+            stats.count(member.size)
+
+    stats.report()
+    return 0
+
+def do_pass(args):
+    """the 'pass' subcommand, like cpio -p"""
+    stats = _Stats(args.stats)
+    paths = ([os.fsencode(path) for path in args.paths]
+             or _read_paths(sys.stdin.buffer, args.null))
+    copier = cpiofile.CpioFile()
+    directories = []
+
+    for path in paths:
+        status = os.lstat(path)
+        member = cpiofile.CpioMemberNew.from_stat(path, status)
+
+        if stat.S_ISDIR(status.st_mode):
+            directories.append(member)
+        elif stat.S_ISREG(status.st_mode):
+            with io.open(path, 'rb') as fileobj:
+                copier.extract(member, args.directory, fileobj)
+        else:
+            if stat.S_ISLNK(status.st_mode):
+                member.content = os.fsencode(os.readlink(path))
+            copier.extract(member, args.directory)
+
+        if args.verbose:
+            sys.stderr.write(path.decode('utf-8', 'replace') + '\n')
+        stats.count(member.filesize)
+
+    copier.extractall(args.directory, directories)
+    stats.report()
+    return 0
+
+def do_diff(args):
+    """the 'diff' subcommand"""
+    stats = _Stats(args.stats)
+    out = sys.stdout.buffer
+
+    with cpiofile.CpioFile.open(args.old, 'r', stats=stats.phases) as old:
+        with cpiofile.CpioFile.open(args.new, 'r', stats=stats.phases) as new:
+            diff = old.diff(new)
+
+            for member in diff.removed:
+                out.write(b'D ' + member.name + b'\n')
+            for member in diff.added:
+                out.write(b'A ' + member.name + b'\n')
+            for _, member, differences in diff.changed:
+                out.write('M {0} '.format(','.join(differences))
+                          .encode('ascii') + member.name + b'\n')
+
+            if args.delta:
+                diff.write(args.delta)
+
+            for member in new.members:
+                stats.count(member.size)
+
+    out.flush()
+    stats.report()
+    return 1 if diff else 0
+
+def do_manifest(args):
+    """the 'manifest' subcommand"""
+    stats = _Stats(args.stats)
+    out = sys.stdout.buffer
+
+    with _open_archive(args, stats) as archive:
+        if args.verify:
+            with io.open(args.verify, 'r') as fileobj:
+                expected = cpiofile.CpioManifest.load(fileobj)
+
+            problems = expected.verify(archive, jobs=args.jobs)
+            for name, differences in problems:
+                out.write('{0} '.format(','.join(differences))
+                          .encode('ascii') + name + b'\n')
+            out.flush()
+            status = 1 if problems else 0
+        else:
+            manifest = archive.manifest(args.algorithms or ['sha256'],
+                                        include=args.patterns or None,
+                                        jobs=args.jobs)
+            manifest.dump(sys.stdout)
+            sys.stdout.flush()
+            status = 0
+
+    stats.report()
+    return status or _report_damage(archive)
+
+def do_scan(args):
+    """the 'scan' subcommand"""
+    paths = list(args.paths)
+
+    if args.paths_from == '-':
+        paths.extend(_read_names(sys.stdin))
+    elif args.paths_from:
+        with io.open(args.paths_from, 'r') as fileobj:
+            paths.extend(_read_names(fileobj))
+
+    algorithm = None if args.checksum == 'none' else args.checksum
+    grep = args.grep.encode('utf-8') if args.grep else None
+
+    try:
+        archives, members, errors = scan.scan(
+            scan.expand_paths(paths), sys.stdout, jobs=args.jobs,
+            ordered=args.ordered, algorithm=algorithm, grep=grep,
+            progress=scan.print_progress if args.progress else None)
+    except re.error as error:
+        sys.stderr.write('cpiofile: invalid --grep pattern: {0}\n'
+                         .format(error))
+        return 2
+
+    return 1 if errors else 0
+
+def do_serve(args):
+    """the 'serve' subcommand"""
+    server = http.CpioHTTPServer((args.bind, args.port), args.archive)
+    host, port = server.server_address[:2]
+    sys.stderr.write('serving {0} on http://{1}:{2}/\n'.format(
+        args.archive, host, port))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog='cpiofile',
+        description='read and write cpio archives')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-v', '--verbose', action='store_true',
+                        help='list member names as they are processed')
+    common.add_argument('--stats', action='store_true',
+                        help='report member count, bytes and throughput on'
+                        ' stderr')
+
+    reading = argparse.ArgumentParser(add_help=False, parents=[common])
+    reading.add_argument('-F', '--file', metavar='ARCHIVE',
+                         help='archive to read (default: stdin)')
+    reading.add_argument('--recover', action='store_true',
+                         help='skip damaged parts of the archive, reading'
+                         ' every member which can be salvaged')
+    reading.add_argument('-z', '--decompress',
+                         choices=['auto'] + sorted(
+                             cpiofile.compression.decompressors),
+                         help='decompress the archive, on all cpus')
+    reading.add_argument('-j', '--jobs', type=int, default=None,
+                         help='number of decompressing, (and hashing),'
+                         ' threads (default: one per cpu)')
+    reading.add_argument('patterns', nargs='*', metavar='PATTERN',
+                         help='only process members matching these shell'
+                         ' patterns')
+
+    naming = argparse.ArgumentParser(add_help=False, parents=[common])
+    naming.add_argument('-0', '--null', action='store_true',
+                        help='names read from stdin are null terminated')
+
+    sub = subparsers.add_parser('list', aliases=['t'], parents=[reading],
+                                help='list archive members, like cpio -t')
+    sub.set_defaults(func=do_list)
+
+    sub = subparsers.add_parser('extract', aliases=['i'], parents=[reading],
+                                help='extract archive members, like cpio -i')
+    sub.add_argument('-D', '--directory', default='.',
+                     help='directory to extract into (default: %(default)s)')
+    sub.set_defaults(func=do_extract)
+
+    sub = subparsers.add_parser('create', aliases=['o'], parents=[naming],
+                                help='create an archive, like cpio -o')
+    sub.add_argument('-F', '--file', metavar='ARCHIVE',
+                     help='archive to write (default: stdout)')
+    sub.add_argument('-H', '--format', default='newc',
+                     choices=sorted(cpiofile.formats),
+                     help='archive format (default: %(default)s)')
+    sub.add_argument('-A', '--append', action='store_true',
+                     help='add to the end of an existing archive, in its'
+                     ' format, like cpio -A')
+    sub.add_argument('--reproducible', action='store_true',
+                     help='write members sorted by name with normalized'
+                     ' owners, times and inode numbers')
+    sub.add_argument('--mtime', type=int,
+                     default=int(os.environ.get('SOURCE_DATE_EPOCH', 0)),
+                     help='mtime of every member with --reproducible'
+                     ' (default: $SOURCE_DATE_EPOCH or 0)')
+    sub.add_argument('--dedup', action='store_true',
+                     help='store duplicate file contents once, as hardlinks'
+                     ' (newc and crc only)')
+    sub.add_argument('--sparse', action='store_true',
+                     help='do not read the holes of sparse files')
+    sub.add_argument('-z', '--compress',
+                     choices=sorted(cpiofile.compression.compressors),
+                     help='compress the archive, on all cpus')
+    sub.add_argument('-j', '--jobs', type=int, default=None,
+                     help='number of compressing threads (default: one per'
+                     ' cpu)')
+    sub.add_argument('paths', nargs='*', metavar='PATH',
+                     help='files to archive (default: names read from stdin)')
+    sub.set_defaults(func=do_create)
+
+    sub = subparsers.add_parser('pass', aliases=['p'], parents=[naming],
+                                help='copy files into a directory, like'
+                                ' cpio -p')
+    sub.add_argument('directory', metavar='DIRECTORY',
+                     help='destination directory')
+    sub.add_argument('paths', nargs='*', metavar='PATH',
+                     help='files to copy (default: names read from stdin)')
+    sub.set_defaults(func=do_pass)
+
+    sub = subparsers.add_parser('diff', parents=[common],
+                                help='list members added (A), removed (D)'
+                                ' or modified (M) between two archives')
+    sub.add_argument('old', metavar='OLD', help='original archive')
+    sub.add_argument('new', metavar='NEW', help='new archive')
+    sub.add_argument('-o', '--delta', metavar='ARCHIVE',
+                     help='also write the added and modified members of NEW'
+                     ' to ARCHIVE')
+    sub.set_defaults(func=do_diff)
+
+    sub = subparsers.add_parser('manifest', parents=[reading],
+                                help='write the name, mode, size and content'
+                                ' digests of each member as JSON lines')
+    sub.add_argument('-a', '--algorithm', dest='algorithms', action='append',
+                     help='hashlib algorithm, may be repeated'
+                     ' (default: sha256)')
+    sub.add_argument('--verify', metavar='MANIFEST',
+                     help='instead, check the archive against MANIFEST and'
+                     ' list the members which differ')
+    sub.set_defaults(func=do_manifest)
+
+    sub = subparsers.add_parser(
+        'scan', help='list members of many archives in parallel as JSON lines')
+    sub.add_argument('paths', nargs='*', metavar='PATH',
+                     help='archives to scan; directories are walked')
+    sub.add_argument('-f', '--from', dest='paths_from', metavar='FILE',
+                     help='read archive names, one per line, from FILE'
+                     ' ("-" for stdin)')
+    sub.add_argument('-j', '--jobs', type=int, default=None,
+                     help='number of worker processes (default: one per cpu)')
+    sub.add_argument('-u', '--unordered', dest='ordered',
+                     action='store_false',
+                     help='write results as archives finish rather than in'
+                     ' input order')
+    sub.add_argument('-c', '--checksum', default='sha256', metavar='ALGORITHM',
+                     help='hashlib algorithm for member checksums, or "none"'
+                     ' (default: %(default)s)')
+    sub.add_argument('-g', '--grep', metavar='REGEX',
+                     help='only report members whose content matches REGEX')
+    sub.add_argument('-p', '--progress', action='store_true',
+                     help='report progress on stderr')
+    sub.set_defaults(func=do_scan)
+
+    sub = subparsers.add_parser(
+        'serve', help='serve the files in an archive over HTTP')
+    sub.add_argument('archive', metavar='ARCHIVE', help='archive to serve')
+    sub.add_argument('-b', '--bind', default='127.0.0.1', metavar='ADDRESS',
+                     help='address to listen on (default: %(default)s)')
+    sub.add_argument('-p', '--port', type=int, default=8000,
+                     help='port to listen on (default: %(default)s)')
+    sub.set_defaults(func=do_serve)
+
+    return parser
+
+def main(argv=None):
+    """entry point for the cpiofile command"""
+    args = _parser().parse_args(argv)
+    return args.func(args)
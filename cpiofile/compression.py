@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2011, 2013 K Richard Pixley
+#
+# See LICENSE for details.
+
+"""
+Compressing and decompressing archives on several cores.
+
+:py:class:`ParallelCompressor` is a write only file object which cuts
+what is written to it into blocks and compresses them concurrently in
+a thread pool, (:py:mod:`zlib` and :py:mod:`lzma` release the GIL
+while they work), writing the results in order.  Each block becomes a
+complete gzip member or xz stream, and concatenations of those are
+themselves valid gzip and xz files, so the output can be read by any
+gzip or xz decompressor.  This is the approach of pigz, at the cost of
+a little compression at each block boundary.
+
+:py:class:`ParallelDecompressor` reverses this for any archive made
+of several gzip members or xz streams, whoever wrote it.  Candidate
+boundaries are found by searching the compressed data for the magic
+number which starts each unit, the data is cut there into segments
+which are decompressed concurrently, and the output is reassembled in
+order.  A candidate which turns out to lie inside a unit is harmless:
+the segment before it ends part way through a unit, and is redone
+joined with the next.  A unit larger than the read ahead window, (as
+is an archive compressed by plain gzip or xz), cannot be cut, and is
+decompressed on one thread a piece at a time as it is read.  So is a
+unit whose output would be larger than the window, so that a highly
+compressible segment cannot fill memory: at most two segments per
+thread are in flight, each holding at most a window of output.
+
+Typical use::
+
+    with cpiofile.CpioFile.open('initramfs.cpio.gz', 'w',
+                                compress='gzip') as archive:
+        ...
+
+    with cpiofile.CpioFile.open('initramfs.cpio.gz', 'r|',
+                                compress='auto') as archive:
+        for member in archive:
+            ...
+"""
+
+from __future__ import unicode_literals, print_function
+
+__docformat__ = 'restructuredtext en'
+
+__all__ = [
+    'compressors',
+    'decompressors',
+    'detect',
+    'ParallelCompressor',
+    'ParallelDecompressor',
+    ]
+
+import collections
+import concurrent.futures
+import io
+import lzma
+import os
+import zlib
+
+def _gzip(block, level):
+    """return *block* compressed as one gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(block) + compressor.flush()
+
+def _xz(block, level):
+    """return *block* compressed as one xz stream"""
+    return lzma.compress(block, lzma.FORMAT_XZ, preset=level)
+
+compressors = {
+    'gzip': (_gzip, 6),
+    'xz': (_xz, 6),
+    }
+"""
+(function, default level) pairs by compressed format name.  Each
+function compresses one block into a self contained unit of the format.
+""" # pylint: disable=W0105
+
+decompressors = {
+    'gzip': (b'\x1f\x8b\x08',
+             lambda: zlib.decompressobj(16 + zlib.MAX_WBITS), b''),
+    'xz': (b'\xfd7zXZ\x00',
+           lambda: lzma.LZMADecompressor(lzma.FORMAT_XZ), b'\x00'),
+    }
+"""
+(magic, factory, padding) tuples by compressed format name: the bytes
+which begin each unit, a function returning a decompressor for one
+unit, and a byte which may pad between units.
+""" # pylint: disable=W0105
+
+def detect(block):
+    """
+    return the name of the compressed format *block* begins with, or
+    None if it is not recognized.
+    """
+    for name, (magic, _, _) in decompressors.items():
+        if block.startswith(magic):
+            return name
+
+    return None
+
+def _decompress(format, data, limit):
+    """
+    Decompress the consecutive units of *format* in *data*, producing
+    at most *limit* bytes.
+
+    :returns: a tuple of the output, the data of a final unit which
+        is cut short or would exceed *limit*, (or b''), an error, (or
+        None) if the data does not begin with a unit, and whether that
+        final unit was stopped at *limit* rather than cut short
+    """
+    # pylint: disable=W0622
+    _, factory, padding = decompressors[format]
+    output = []
+    produced = 0
+    view = data
+
+    while view:
+        if padding:
+            view = view.lstrip(padding)
+            if not view:
+                break
+
+        decompressor = factory()
+        room = limit - produced
+        try:
+            chunk = (decompressor.decompress(view, room) if room > 0
+                     else b'')
+        except (zlib.error, lzma.LZMAError, EOFError) as error:
+            return b''.join(output), view, error, False
+
+        if not decompressor.eof:
+            return b''.join(output), view, None, len(chunk) >= room
+
+        output.append(chunk)
+        produced += len(chunk)
+        view = decompressor.unused_data
+
+    return b''.join(output), b'', None, False
+
+class ParallelCompressor(io.RawIOBase):
+    """
+    A write only file object which compresses what is written to it
+    into *fileobj*.
+
+    :param str format: a key of :py:data:`compressors`
+    :param int level: compression level, (default that of *format*)
+    :param int blocksize: uncompressed bytes per block
+    :param int jobs: number of compressing threads, (default one per
+        cpu)
+    :param bool closefd: if true, closing this also closes *fileobj*
+    """
+
+    def __init__(self, fileobj, format='gzip', level=None,
+                 blocksize=1024 * 1024, jobs=None, closefd=False):
+        # pylint: disable=W0622
+        io.RawIOBase.__init__(self)
+
+        if format not in compressors:
+            raise ValueError('unknown compressed format \'{0}\''
+                             .format(format))
+
+        self.fileobj = fileobj
+        self.function, default = compressors[format]
+        self.level = default if level is None else level
+        self.blocksize = blocksize
+        self.closefd = closefd
+        self.jobs = jobs or os.cpu_count() or 1
+        self._pool = concurrent.futures.ThreadPoolExecutor(self.jobs)
+        self._pending = collections.deque()
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+
+        self._buffer += data
+        blocksize = self.blocksize
+
+        while len(self._buffer) >= blocksize:
+            block = bytes(self._buffer[:blocksize])
+            del self._buffer[:blocksize]
+            self._submit(block)
+
+        return len(data)
+
+    def _submit(self, block):
+        """compress *block* in the pool, keeping a bounded queue"""
+        self._pending.append(self._pool.submit(self.function, block,
+                                               self.level))
+
+        # two blocks per thread keeps every thread busy while bounding
+        # the memory held by blocks waiting to be written
+        while len(self._pending) > 2 * self.jobs:
+            self.fileobj.write(self._pending.popleft().result())
+
+    def flush(self):
+        """
+        Compress and write everything written so far.  This ends the
+        current block early, so it is best called only when done.
+        """
+        if self.closed:
+            return
+
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            del self._buffer[:]
+
+        while self._pending:
+            self.fileobj.write(self._pending.popleft().result())
+
+        self.fileobj.flush()
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown()
+            io.RawIOBase.close(self)
+            if self.closefd:
+                self.fileobj.close()
+
+class ParallelDecompressor(io.RawIOBase):
+    """
+    A read only, unseekable file object which decompresses *fileobj*.
+
+    :param str format: a key of :py:data:`decompressors`, or None to
+        detect it from the first bytes
+    :param int jobs: number of decompressing threads, (default one per
+        cpu)
+    :param int window: the most compressed bytes read ahead and in
+        flight at once, and the most output of any one segment
+    :param int chunksize: bytes read from *fileobj* at a time
+    :param bool closefd: if true, closing this also closes *fileobj*
+    """
+
+    def __init__(self, fileobj, format=None, jobs=None,
+                 window=32 * 1024 * 1024, chunksize=1024 * 1024,
+                 closefd=False):
+        # pylint: disable=W0622
+        io.RawIOBase.__init__(self)
+
+        self.fileobj = fileobj
+        self.window = window
+        self.chunksize = chunksize
+        self.closefd = closefd
+        self._input = bytearray(fileobj.read(chunksize))
+        self._eof = not self._input
+
+        if format is None:
+            format = detect(bytes(self._input[:8]))
+            if format is None:
+                raise ValueError('unrecognized compressed format')
+
+        if format not in decompressors:
+            raise ValueError('unknown compressed format \'{0}\''
+                             .format(format))
+
+        self.format = format
+        self._magic, self._factory, self._padding = decompressors[format]
+        self.jobs = jobs or os.cpu_count() or 1
+        self._pool = concurrent.futures.ThreadPoolExecutor(self.jobs)
+        self._pending = collections.deque()
+        self._inflight = 0
+        self._carry = b''
+        self._unit = None
+        self._output = b''
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def _submit(self, data):
+        """decompress segment *data* in the pool"""
+        self._pending.append((self._pool.submit(_decompress, self.format,
+                                                data, self.window), data))
+        self._inflight += len(data)
+
+    def _fill(self):
+        """read and submit segments until the window is full"""
+        magic = self._magic
+
+        while (not self._eof and len(self._pending) < 2 * self.jobs
+               and self._inflight + len(self._input) < self.window):
+            chunk = self.fileobj.read(self.chunksize)
+            if not chunk:
+                self._eof = True
+                break
+
+            # the input held no boundary before, so only the new chunk,
+            # (and a magic number straddling it), need be searched
+            searched = max(len(self._input) - len(magic) + 1, 1)
+            self._input += chunk
+            cut = self._input.rfind(magic, searched)
+            if cut > 0:
+                self._submit(bytes(self._input[:cut]))
+                del self._input[:cut]
+
+        if self._eof and self._input:
+            self._submit(bytes(self._input))
+            del self._input[:]
+
+    def _take(self):
+        """return the next piece of input for a streamed unit, or b''"""
+        if self._input:
+            chunk = bytes(self._input[:self.chunksize])
+            del self._input[:self.chunksize]
+            return chunk
+
+        if self._eof:
+            return b''
+
+        chunk = self.fileobj.read(self.chunksize)
+        self._eof = not chunk
+        return chunk
+
+    def _stream(self):
+        """
+        return the next piece of output of the unit being streamed, or
+        b'' when it has ended.
+        """
+        unit = self._unit
+
+        while not unit.eof:
+            if (getattr(unit, 'unconsumed_tail', b'')
+                    or not getattr(unit, 'needs_input', True)):
+                data = getattr(unit, 'unconsumed_tail', b'')
+            else:
+                data = self._take()
+
+            try:
+                output = unit.decompress(data, self.chunksize)
+            except (zlib.error, lzma.LZMAError, EOFError) as error:
+                raise IOError('corrupt {0} data: {1}'.format(self.format,
+                                                             error))
+
+            if output:
+                return output
+
+            if not data:
+                raise EOFError('compressed archive is truncated')
+
+        # back to cutting whatever follows the unit
+        self._input[:0] = unit.unused_data
+        self._unit = None
+        return b''
+
+    def _begin_stream(self):
+        """
+        stream the unit which begins the unfinished carry, (or the
+        input), taking back everything read after it.
+        """
+        for future, _ in self._pending:
+            future.cancel()
+
+        self._input[:0] = self._carry + b''.join(
+            data for _, data in self._pending)
+        self._pending.clear()
+        self._inflight = 0
+        self._carry = b''
+
+        if self._padding:
+            self._input = bytearray(self._input.lstrip(self._padding))
+        if self._input:
+            self._unit = self._factory()
+
+    def _next(self):
+        """return the next piece of output, or b'' at the end"""
+        while True:
+            if self._unit is not None:
+                output = self._stream()
+                if output:
+                    return output
+                continue
+
+            if len(self._pending) < self.jobs:
+                self._fill()
+
+            if not self._pending:
+                if self._input:
+                    # a unit larger than the window
+                    self._begin_stream()
+                    continue
+
+                if self._carry:
+                    raise EOFError('compressed archive is truncated')
+                return b''
+
+            future, data = self._pending.popleft()
+            self._inflight -= len(data)
+
+            if self._carry:
+                # the last segment ended inside a unit, so this one
+                # began at a false boundary - redo it from the unit
+                future.cancel()
+                output, self._carry, error, full = _decompress(
+                    self.format, self._carry + data, self.window)
+            else:
+                output, self._carry, error, full = future.result()
+
+            if error is not None:
+                raise IOError('corrupt {0} data: {1}'.format(self.format,
+                                                             error))
+
+            if full or len(self._carry) > self.window:
+                # a unit whose output, (or whose false boundaries),
+                # run past the window
+                self._begin_stream()
+
+            if output:
+                return output
+
+    def readinto(self, buffer):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+
+        while self._position >= len(self._output):
+            self._output = self._next()
+            self._position = 0
+            if not self._output:
+                return 0
+
+        count = min(len(buffer), len(self._output) - self._position)
+        memoryview(buffer).cast('B')[:count] = memoryview(self._output)[
+            self._position:self._position + count]
+        self._position += count
+        return count
+
+    def readall(self):
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+
+        chunks = [self._output[self._position:]]
+        chunk = self._next()
+        while chunk:
+            chunks.append(chunk)
+            chunk = self._next()
+
+        self._output = b''
+        self._position = 0
+        return b''.join(chunks)
+
+    def close(self):
+        if self.closed:
+            return
+
+        for future, _ in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._pool.shutdown()
+        io.RawIOBase.close(self)
+
+        if self.closefd:
+            self.fileobj.close()
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2011, 2013 K Richard Pixley
+#
+# See LICENSE for details.
+
+"""
+A read only, :py:mod:`os` like view of the files in a cpio archive.
+
+:py:class:`CpioFS` answers listdir, stat, walk, open, readlink and
+exists over an archive without extracting it.  A directory tree is
+indexed once, when it is created, so that listing a directory costs
+time in proportion to its entries rather than to the whole archive.
+Directories which are implied by member names but have no member of
+their own appear as directories with mode 0755.
+
+Paths may be str or bytes, (results follow the type given, as in
+:py:mod:`os`), are relative to the root of the archive whether or
+not they begin with a slash, and symlinks are followed within the
+archive.  Errors are raised as the same :py:exc:`OSError` subclasses
+:py:mod:`os` raises.
+
+Typical use::
+
+    with cpiofile.CpioFile.open('archive.cpio', 'r') as archive:
+        fs = CpioFS(archive)
+        for dirpath, dirnames, filenames in fs.walk('/'):
+            ...
+"""
+
+from __future__ import unicode_literals, print_function
+
+__docformat__ = 'restructuredtext en'
+
+__all__ = [
+    'CpioFS',
+    ]
+
+import errno
+import io
+import os
+import posixpath
+import stat
+
+import cpiofile
+
+_maxlinks = 40
+"""symlinks followed resolving one path before giving up with ELOOP""" # pylint: disable=W0105
+
+def _error(code, path):
+    """return an OSError, (of the matching subclass), for *code* at *path*"""
+    return OSError(code, os.strerror(code), path)
+
+def _directory(name):
+    """return a member standing in for a directory with no member"""
+    member = cpiofile.CpioMemberNew.trailer()
+    member.name = name
+    member.mode = stat.S_IFDIR | 0o755
+    member.nlink = 2
+    return member
+
+class CpioFS(object):
+    """
+    A read only file system view of *archive*, a
+    :py:class:`cpiofile.CpioFile` opened for random access, (mode 'r'
+    or 'r+').  Later members replace earlier ones of the same name, as
+    they would on extraction.
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+        self._nodes = {b'': _directory(b'.')}
+        self._children = {b'': []}
+
+        for member in archive.members:
+            key = posixpath.normpath(b'/' + member.name).lstrip(b'/')
+            if key:
+                self._add(key, member)
+
+    def _add(self, key, member):
+        """index *member* at *key*, adding any missing parents"""
+        parent, name = posixpath.split(key)
+
+        if parent not in self._children:
+            self._add(parent, _directory(parent))
+
+        if key not in self._nodes:
+            self._children[parent].append(name)
+
+        self._nodes[key] = member
+
+        if stat.S_ISDIR(member.mode):
+            self._children.setdefault(key, [])
+
+    def _lookup(self, path, follow_symlinks=True):
+        """
+        return a tuple of the key and member for *path*, following
+        symlinks in all components but the last, and in the last too if
+        *follow_symlinks*.
+        """
+        pending = os.fsencode(path).split(b'/')
+        current = b''
+        links = 0
+
+        while pending:
+            part = pending.pop(0)
+
+            if part in (b'', b'.'):
+                continue
+
+            if part == b'..':
+                current = posixpath.dirname(current)
+                continue
+
+            key = posixpath.join(current, part) if current else part
+            member = self._nodes.get(key)
+
+            if member is None:
+                raise _error(errno.ENOENT, path)
+
+            if stat.S_ISLNK(member.mode) and (pending or follow_symlinks):
+                links += 1
+                if links > _maxlinks:
+                    raise _error(errno.ELOOP, path)
+
+                target = member.content
+                if target.startswith(b'/'):
+                    current = b''
+                pending[:0] = target.split(b'/')
+                continue
+
+            if pending and not stat.S_ISDIR(member.mode):
+                raise _error(errno.ENOTDIR, path)
+
+            current = key
+
+        return current, self._nodes[current]
+
+    def listdir(self, path='.'):
+        """return the names of the entries in directory *path*"""
+        key, member = self._lookup(path)
+
+        if not stat.S_ISDIR(member.mode):
+            raise _error(errno.ENOTDIR, path)
+
+        names = list(self._children[key])
+        if not isinstance(path, bytes):
+            names = [os.fsdecode(name) for name in names]
+
+        return names
+
+    def stat(self, path, follow_symlinks=True):
+        """return an :py:class:`os.stat_result` for *path*"""
+        _, member = self._lookup(path, follow_symlinks)
+        member = self.archive.data_member(member)
+
+        return os.stat_result(
+            (member.mode, member.ino,
+             os.makedev(member.devmajor, member.devminor), member.nlink,
+             member.uid, member.gid, member.filesize,
+             member.mtime, member.mtime, member.mtime),
+            {'st_rdev': os.makedev(member.rdevmajor, member.rdevminor)})
+
+    def lstat(self, path):
+        """like :py:meth:`stat`, but not following a final symlink"""
+        return self.stat(path, follow_symlinks=False)
+
+    def exists(self, path):
+        """predicate indicating whether *path* exists, (after symlinks)"""
+        try:
+            self._lookup(path)
+        except OSError:
+            return False
+        return True
+
+    def readlink(self, path):
+        """return the target of symlink *path*"""
+        _, member = self._lookup(path, follow_symlinks=False)
+
+        if not stat.S_ISLNK(member.mode):
+            raise _error(errno.EINVAL, path)
+
+        target = member.content
+        return target if isinstance(path, bytes) else os.fsdecode(target)
+
+    def open(self, path, mode='r', buffering=-1, encoding=None, errors=None,
+             newline=None):
+        """
+        Open the regular file *path* for reading, like :py:func:`io.open`.
+        The content is read from the archive as it is used.
+        """
+        if set(mode) - set('rbt') or 'r' not in mode:
+            raise _error(errno.EROFS, path)
+
+        _, member = self._lookup(path)
+
+        if stat.S_ISDIR(member.mode):
+            raise _error(errno.EISDIR, path)
+
+        raw = self.archive.data_member(member).open()
+
+        if 'b' in mode:
+            if buffering == 0:
+                return raw
+            return io.BufferedReader(raw, io.DEFAULT_BUFFER_SIZE
+                                     if buffering < 0 else buffering)
+
+        return io.TextIOWrapper(io.BufferedReader(raw), encoding, errors,
+                                newline)
+
+    def walk(self, top='.', topdown=True, followlinks=False):
+        """
+        Generate (dirpath, dirnames, filenames) tuples for the tree
+        below *top*, like :py:func:`os.walk`.
+        """
+        try:
+            key, member = self._lookup(top)
+        except OSError:
+            return
+
+        if not stat.S_ISDIR(member.mode):
+            return
+
+        for entry in self._walk(top, key, topdown, followlinks):
+            yield entry
+
+    def _walk(self, top, key, topdown, followlinks):
+        dirnames = []
+        filenames = []
+
+        for name in self._children[key]:
+            child = posixpath.join(key, name) if key else name
+            member = self._nodes[child]
+
+            if stat.S_ISLNK(member.mode):
+                try:
+                    member = self._lookup(child)[1]
+                except OSError:
+                    pass
+
+            if not isinstance(top, bytes):
+                name = os.fsdecode(name)
+
+            (dirnames if stat.S_ISDIR(member.mode) else filenames).append(name)
+
+        if topdown:
+            yield top, dirnames, filenames
+
+        for name in dirnames:
+            path = posixpath.join(top, name)
+            child = os.fsencode(name)
+            if key:
+                child = posixpath.join(key, child)
+
+            if stat.S_ISLNK(self._nodes[child].mode):
+                if not followlinks:
+                    continue
+                child = self._lookup(child)[0]
+
+            for entry in self._walk(path, child, topdown, followlinks):
+                yield entry
+
+        if not topdown:
+            yield top, dirnames, filenames
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2011, 2013 K Richard Pixley
+#
+# See LICENSE for details.
+
+"""
+Serving the members of a cpio archive over HTTP without extracting it.
+
+:py:class:`CpioApplication` is a WSGI application which can be
+mounted in any WSGI server.  Its bodies are
+:py:class:`cpiofile.CpioMemberReader` instances handed to the server's
+wsgi.file_wrapper, so they are read straight from the archive's map.
+
+:py:class:`CpioHTTPServer` is a self contained, threaded server built
+on :py:mod:`http.server` which sends member contents directly from the
+archive's file descriptor to the socket with :py:func:`os.sendfile`.
+
+Both answer GET and HEAD, map URL paths to member names through an
+index built once when they are created, and honour single byte
+ranges in Range headers.
+
+Typical use::
+
+    server = CpioHTTPServer(('127.0.0.1', 8000), 'archive.cpio')
+    server.serve_forever()
+"""
+
+from __future__ import unicode_literals, print_function
+
+__docformat__ = 'restructuredtext en'
+
+__all__ = [
+    'CpioApplication',
+    'CpioHTTPRequestHandler',
+    'CpioHTTPServer',
+    ]
+
+import email.utils
+import io
+import mimetypes
+import os
+import re
+import stat
+import wsgiref.util
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import unquote_to_bytes, urlsplit
+
+import cpiofile
+
+_reasons = {
+    200: 'OK',
+    206: 'Partial Content',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    416: 'Range Not Satisfiable',
+    }
+
+_byterange = re.compile(r'([0-9]*)-([0-9]*)\Z')
+"""a single byte range spec, (or suffix), of a Range header""" # pylint: disable=W0105
+
+def _key(name):
+    """return the index key for member or URL path *name*"""
+    while name.startswith(b'./'):
+        name = name[2:]
+    return name.strip(b'/')
+
+def _parse_range(header, length):
+    """
+    Interpret the Range *header* for content of *length* bytes.
+
+    :returns: a (start, stop) tuple for a single satisfiable byte
+        range, None when the whole content should be sent, (no header,
+        or one which is not understood or asks for several ranges), or
+        False when the range cannot be satisfied
+    """
+    if not header:
+        return None
+
+    unit, _, ranges = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+
+    match = _byterange.match(ranges.strip())
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        suffix = int(last)
+        if not suffix:
+            return False
+        return (max(length - suffix, 0), length)
+
+    start = int(first)
+    stop = int(last) + 1 if last else length
+
+    if start >= length or stop <= start:
+        return False
+
+    return (start, min(stop, length))
+
+class CpioApplication(object):
+    """
+    A WSGI application serving the regular file members of the
+    :py:class:`cpiofile.CpioFile` *archive*, (which must have been
+    opened for random access, ie, mode 'r' or 'r+').  The URL path
+    /a/b serves the member named a/b, (or ./a/b, or /a/b).
+
+    :param int blocksize: size of the pieces handed to the server
+    """
+
+    def __init__(self, archive, blocksize=64 * 1024):
+        self.archive = archive
+        self.blocksize = blocksize
+        self.index = dict((_key(member.name), archive.data_member(member))
+                          for member in archive.members
+                          if stat.S_ISREG(member.mode))
+
+    def lookup(self, path):
+        """return the member served at URL *path*, (a str), or None"""
+        return self.index.get(_key(unquote_to_bytes(path)))
+
+    def respond(self, method, path, range_header=None):
+        """
+        Decide the response to a request.
+
+        :returns: a tuple of (status, headers, member, start, length),
+            where headers is a list of (name, value) pairs and member
+            is None when there is no body to send
+        """
+        if method not in ('GET', 'HEAD'):
+            return (405, [('Allow', 'GET, HEAD'),
+                          ('Content-Length', '0')], None, 0, 0)
+
+        member = self.lookup(path)
+        if member is None:
+            return (404, [('Content-Length', '0')], None, 0, 0)
+
+        filesize = member.filesize
+        headers = [
+            ('Content-Type',
+             mimetypes.guess_type(path)[0] or 'application/octet-stream'),
+            ('Last-Modified', email.utils.formatdate(member.mtime,
+                                                     usegmt=True)),
+            ('Accept-Ranges', 'bytes'),
+            ]
+
+        span = _parse_range(range_header, filesize)
+
+        if span is False:
+            headers.append(('Content-Range', 'bytes */{0}'.format(filesize)))
+            headers.append(('Content-Length', '0'))
+            return (416, headers, None, 0, 0)
+
+        if span is None:
+            status, start, length = 200, 0, filesize
+        else:
+            status, start, length = 206, span[0], span[1] - span[0]
+            headers.append(('Content-Range', 'bytes {0}-{1}/{2}'.format(
+                span[0], span[1] - 1, filesize)))
+
+        headers.append(('Content-Length', str(length)))
+
+        if method == 'HEAD' or not length:
+            member = None
+
+        return (status, headers, member, start, length)
+
+    def __call__(self, environ, start_response):
+        status, headers, member, start, length = self.respond(
+            environ['REQUEST_METHOD'], environ.get('PATH_INFO', '/'),
+            environ.get('HTTP_RANGE'))
+
+        start_response('{0} {1}'.format(status, _reasons[status]), headers)
+
+        if member is None:
+            return []
+
+        wrapper = environ.get('wsgi.file_wrapper', wsgiref.util.FileWrapper)
+        return wrapper(member.open(start, length), self.blocksize)
+
+class CpioHTTPRequestHandler(BaseHTTPRequestHandler):
+    """
+    An :py:mod:`http.server` request handler for
+    :py:class:`CpioHTTPServer` which sends member contents with
+    :py:func:`os.sendfile` where it can.
+    """
+
+    server_version = 'cpiofile'
+
+    def do_GET(self): # pylint: disable=C0103
+        """answer a GET request"""
+        self._answer('GET')
+
+    def do_HEAD(self): # pylint: disable=C0103
+        """answer a HEAD request"""
+        self._answer('HEAD')
+
+    def _answer(self, method):
+        app = self.server.application
+        status, headers, member, start, length = app.respond(
+            method, urlsplit(self.path).path, self.headers.get('Range'))
+
+        self.send_response(status, _reasons[status])
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+
+        if member is not None:
+            self.server.send_member(self.wfile, member, start, length)
+
+class CpioHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    A threaded HTTP server for the archive at *path*, listening on
+    *address*, a (host, port) tuple.  Port 0 picks a free port, which
+    can be read back from :py:attr:`server_address`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, path,
+                 handler_class=CpioHTTPRequestHandler):
+        self.archive = cpiofile.CpioFile.open(path, 'r')
+        self.application = CpioApplication(self.archive)
+        self.fileobj = io.open(path, 'rb')
+        HTTPServer.__init__(self, address, handler_class)
+
+    def send_member(self, wfile, member, start, length):
+        """
+        write *length* bytes of the content of *member* from *start*
+        to *wfile*, the output of a request handler.
+        """
+        offset = member.dataoffset + start
+        remaining = length
+
+        try:
+            outfd = wfile.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            outfd = None
+
+        if outfd is not None and getattr(os, 'sendfile', None) is not None:
+            wfile.flush()
+
+            while remaining:
+                try:
+                    sent = os.sendfile(outfd, self.fileobj.fileno(),
+                                       offset, remaining)
+                except OSError:
+                    if remaining != length:
+                        raise
+                    break
+                if not sent:
+                    raise cpiofile.HeaderError('unexpected end of file')
+                offset += sent
+                remaining -= sent
+
+        if remaining:
+            with member.open(start + length - remaining,
+                             remaining) as reader:
+                for chunk in iter(lambda: reader.read(64 * 1024), b''):
+                    wfile.write(chunk)
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self.fileobj.close()
+        self.archive.close()
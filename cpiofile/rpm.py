@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2011, 2013 K Richard Pixley
+#
+# See LICENSE for details.
+
+"""
+Reading the cpio payload of an RPM package directly.
+
+An RPM package is a 96 byte lead, a signature header, (padded to a
+multiple of 8 bytes), a main header and then the payload, which is a
+cpio archive, usually compressed.  :py:class:`RpmFile` parses the
+lead and both headers just far enough to find where the payload
+starts and what compressed it, and then reads the payload as a
+stream, (decompressing gzip and xz on several threads with
+:py:class:`cpiofile.compression.ParallelDecompressor`), so no
+rpm2cpio process is needed.
+
+Typical use::
+
+    with RpmFile.open('package.rpm') as rpm:
+        with rpm.archive() as archive:
+            for member in archive:
+                ...
+"""
+
+from __future__ import unicode_literals, print_function
+
+__docformat__ = 'restructuredtext en'
+
+__all__ = [
+    'RpmFile',
+    'tags',
+    ]
+
+import bz2
+import io
+import lzma
+import os
+import struct
+
+import cpiofile
+
+from cpiofile import compression
+
+try:
+    from compression import zstd as _zstd
+except ImportError:
+    _zstd = None
+
+_leadmagic = b'\xed\xab\xee\xdb'
+_leadsize = 96
+_headermagic = b'\x8e\xad\xe8\x01'
+_header = struct.Struct('>4s4xII')
+_entry = struct.Struct('>IIII')
+
+tags = {
+    'name': 1000,
+    'version': 1001,
+    'release': 1002,
+    'epoch': 1003,
+    'summary': 1004,
+    'arch': 1022,
+    'payloadformat': 1124,
+    'payloadcompressor': 1125,
+    'payloadflags': 1126,
+    }
+"""numbers of the commonly used header tags, by name""" # pylint: disable=W0105
+
+_integers = {
+    2: 'B',
+    3: 'H',
+    4: 'I',
+    5: 'Q',
+    }
+
+def _string(store, offset):
+    """return the nul terminated string at *offset* in *store*"""
+    end = store.find(b'\x00', offset)
+    if end < 0:
+        raise cpiofile.HeaderError('unterminated rpm header string')
+    return store[offset:end]
+
+def _value(kind, store, offset, count):
+    """decode the header value of type *kind* at *offset* in *store*"""
+    if offset > len(store):
+        raise cpiofile.HeaderError('rpm header value out of bounds')
+
+    if kind == 6:
+        return _string(store, offset)
+
+    if kind in (8, 9):
+        strings = []
+        for _ in range(count):
+            strings.append(_string(store, offset))
+            offset += len(strings[-1]) + 1
+        return strings
+
+    if kind in _integers:
+        layout = struct.Struct('>{0}{1}'.format(count, _integers[kind]))
+        if offset + layout.size > len(store):
+            raise cpiofile.HeaderError('rpm header value out of bounds')
+        return list(layout.unpack_from(store, offset))
+
+    # char, bin and anything newer are left as bytes
+    return store[offset:offset + count]
+
+def _read_header(fileobj):
+    """
+    read one header structure from *fileobj*.
+
+    :returns: a tuple of a dict mapping tag numbers to values, and the
+        length of the structure in bytes
+    """
+    magic, count, size = _header.unpack(cpiofile._read(fileobj, _header.size)) # pylint: disable=W0212
+
+    if magic != _headermagic:
+        raise cpiofile.InvalidFileFormat('bad rpm header magic')
+
+    index = cpiofile._read(fileobj, count * _entry.size) # pylint: disable=W0212
+    store = cpiofile._read(fileobj, size) # pylint: disable=W0212
+    values = {}
+
+    for i in range(count):
+        tag, kind, offset, number = _entry.unpack_from(index, i * _entry.size)
+        values[tag] = _value(kind, store, offset, number)
+
+    return values, _header.size + len(index) + size
+
+class RpmFile(object):
+    """
+    An RPM package read from *fileobj*, which is left positioned at
+    the start of the payload.
+
+    :param bool closefd: if true, closing this also closes *fileobj*
+    """
+
+    def __init__(self, fileobj, closefd=False):
+        self.fileobj = fileobj
+        self.closefd = closefd
+
+        self.lead = cpiofile._read(fileobj, _leadsize) # pylint: disable=W0212
+        """the 96 bytes of the lead, which modern tools ignore""" # pylint: disable=W0105
+        if not self.lead.startswith(_leadmagic):
+            raise cpiofile.InvalidFileFormat('not an rpm package')
+
+        self.signature, length = _read_header(fileobj)
+        """the signature header, a dict by tag number""" # pylint: disable=W0105
+        padding = -length % 8
+        cpiofile._skip(fileobj, padding) # pylint: disable=W0212
+
+        self.header, hlength = _read_header(fileobj)
+        """the main header, a dict by tag number""" # pylint: disable=W0105
+
+        self.payloadoffset = _leadsize + length + padding + hlength
+        """offset of the payload from the start of the package""" # pylint: disable=W0105
+
+    @classmethod
+    def open(cls, name=None, fileobj=None):
+        """
+        Open the package *name*, or read it from *fileobj*, which need
+        not be seekable.
+        """
+        if fileobj is not None:
+            return cls(fileobj)
+
+        fileobj = io.open(os.path.normpath(os.path.expanduser(name)), 'rb')
+        try:
+            return cls(fileobj, closefd=True)
+        # pylint: disable=W0702
+        except:
+            fileobj.close()
+            raise
+
+    def tag(self, name, default=None):
+        """
+        return the value of main header tag *name*, (a key of
+        :py:data:`tags`, or a tag number), or *default*.
+        """
+        return self.header.get(tags.get(name, name), default)
+
+    @property
+    def payloadformat(self):
+        """the format of the payload, normally b'cpio'"""
+        return self.tag('payloadformat', b'cpio')
+
+    @property
+    def compressor(self):
+        """the compressor of the payload, eg, b'gzip' or b'xz'"""
+        return self.tag('payloadcompressor', b'gzip')
+
+    def payload(self, jobs=None):
+        """
+        return a file object reading the decompressed payload.  It can
+        be read only once, as the package is read sequentially.
+
+        :param int jobs: threads decompressing gzip and xz payloads
+        """
+        compressor = self.compressor
+
+        if compressor in (b'gzip', b'xz'):
+            return compression.ParallelDecompressor(
+                self.fileobj, compressor.decode('ascii'), jobs=jobs)
+
+        if compressor == b'bzip2':
+            return bz2.BZ2File(self.fileobj)
+
+        if compressor == b'lzma':
+            return lzma.LZMAFile(self.fileobj, format=lzma.FORMAT_ALONE)
+
+        if compressor == b'zstd' and _zstd is not None:
+            return _zstd.ZstdFile(self.fileobj)
+
+        if compressor == b'identity':
+            return self.fileobj
+
+        raise ValueError('unsupported rpm payload compressor {0!r}'
+                         .format(compressor))
+
+    def archive(self, jobs=None, stats=None):
+        """
+        return a :py:class:`cpiofile.CpioFile` streaming the payload,
+        (mode 'r|'), which is iterated to read the members in order.
+        """
+        if self.payloadformat != b'cpio':
+            raise cpiofile.InvalidFileFormat('rpm payload is {0!r}, not cpio'
+                                             .format(self.payloadformat))
+
+        compressor = self.compressor
+        if compressor in (b'gzip', b'xz'):
+            return cpiofile.CpioFile.open(mode='r|', fileobj=self.fileobj,
+                                          stats=stats, jobs=jobs,
+                                          compress=compressor.decode('ascii'))
+
+        return cpiofile.CpioFile.open(mode='r|', fileobj=self.payload(),
+                                      stats=stats)
+
+    def close(self):
+        """close the package file if it was opened by :py:meth:`open`"""
+        if self.closefd and not self.fileobj.closed:
+            self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2011, 2013 K Richard Pixley
+#
+# See LICENSE for details.
+
+"""
+Scanning of many cpio archives at once.
+
+Archives are spread across a :py:class:`multiprocessing.Pool`.  Each
+worker parses its archive with :py:class:`cpiofile.CpioFile` and
+returns only a compact tuple per member, (name, size, mode, mtime,
+checksum), so that very little needs to be pickled back to the parent,
+which streams the results as JSON lines.
+"""
+
+from __future__ import unicode_literals, print_function
+
+__docformat__ = 'restructuredtext en'
+
+__all__ = [
+    'scan',
+    'scan_archive',
+    ]
+
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import struct
+import sys
+
+import cpiofile
+
+_options = {}
+
+def _initialize(algorithm, grep):
+    """
+    pool initializer - set the per process scan options.  *grep* is a
+    compiled pattern, (or None), already validated by :py:func:`scan`,
+    so that nothing here can fail.
+    """
+    _options['algorithm'] = algorithm
+    _options['grep'] = grep
+
+def scan_archive(path, algorithm='sha256', grep=None):
+    """
+    return a list of (name, size, mode, mtime, checksum) tuples, one
+    for each member of the archive *path*.
+
+    :param str algorithm: name of a :py:mod:`hashlib` algorithm used
+        for the checksum, or None to skip checksumming
+    :param grep: if given, a compiled bytes regular expression.  Only
+        members whose content matches are returned.
+    """
+    results = []
+
+    with cpiofile.CpioFile.open(path, 'r') as cfile:
+        for member in cfile.members:
+            if grep is not None and not grep.search(member.content):
+                continue
+
+            checksum = None
+            if algorithm:
+                checksum = hashlib.new(algorithm, member.content).hexdigest()
+
+            results.append((member.name, member.filesize, member.mode,
+                            member.mtime, checksum))
+
+    return results
+
+def _scan(path):
+    """pool worker - return (path, results, error) for *path*"""
+    try:
+        return (path, scan_archive(path, _options['algorithm'],
+                                   _options['grep']), None)
+
+    # a truncated archive can end part way through a header struct
+    except (cpiofile.CpioError, EnvironmentError, ValueError,
+            struct.error) as error:
+        return (path, None, '{0}: {1}'.format(type(error).__name__, error))
+
+def expand_paths(paths):
+    """generate file names from *paths*, walking any directories"""
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+def _record(path, member):
+    name, size, mode, mtime, checksum = member
+    return {
+        'archive': path,
+        'name': name.decode('utf-8', 'surrogateescape'),
+        'size': size,
+        'mode': mode,
+        'mtime': mtime,
+        'checksum': checksum,
+        }
+
+def scan(paths, out, jobs=None, ordered=True, algorithm='sha256',
+         grep=None, progress=None, chunksize=4):
+    """
+    Scan every archive in *paths* and write one JSON object per line
+    to *out* for each member found, or one with an 'error' key for
+    each archive which could not be read.
+
+    :param bytes grep: if given, a regular expression.  Only members
+        whose content matches are reported.
+    :param int jobs: number of worker processes.  None means one per
+        cpu, 1 scans in this process without a pool.
+    :param bool ordered: if true, results are written in the order of
+        *paths*, otherwise as soon as each archive finishes
+    :param progress: if given, a callable which is called as
+        progress(done, total, members) after each archive
+    :returns: a tuple of (archives, members, errors) counts
+    :raises re.error: if *grep* is not a valid regular expression
+    :raises ValueError: if *algorithm* is not a :py:mod:`hashlib`
+        algorithm
+
+    Both are checked here, before any worker starts, rather than
+    failing in every worker.
+    """
+    grep = re.compile(grep) if grep else None
+    if algorithm:
+        hashlib.new(algorithm)
+
+    paths = list(paths)
+    total = len(paths)
+    counts = [0, 0, 0]
+
+    if jobs == 1:
+        _initialize(algorithm, grep)
+        results = (_scan(path) for path in paths)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(jobs, _initialize, (algorithm, grep))
+        imap = pool.imap if ordered else pool.imap_unordered
+        results = imap(_scan, paths, chunksize)
+
+    try:
+        for path, members, error in results:
+            counts[0] += 1
+
+            if error is not None:
+                counts[2] += 1
+                out.write(json.dumps({'archive': path, 'error': error}))
+                out.write('\n')
+            else:
+                counts[1] += len(members)
+                for member in members:
+                    out.write(json.dumps(_record(path, member),
+                                         sort_keys=True))
+                    out.write('\n')
+
+            if progress:
+                progress(counts[0], total, counts[1])
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return tuple(counts)
+
+def print_progress(done, total, members, stream=sys.stderr):
+    """a *progress* callback for :py:func:`scan` which writes to *stream*"""
+    stream.write('\r{0}/{1} archives, {2} members'.format(done, total,
+                                                          members))
+    if done == total:
+        stream.write('\n')
+    stream.flush()
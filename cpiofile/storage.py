@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2011, 2013 K Richard Pixley
+#
+# See LICENSE for details.
+
+"""
+Reading archives from storage which is slow to reach.
+
+A backend is any object with a ``size`` attribute, (the length of the
+archive in bytes), and a ``read_at(offset, size)`` method returning
+the bytes there.  :py:class:`FileBackend` reads a local file with
+:py:func:`os.pread`; others can put an HTTP proxy, an object store or
+a network mount behind the same two names.
+
+:py:class:`RangeCache` sits in front of a backend and is what
+:py:class:`cpiofile.CpioFile` parses instead of a map when it is
+opened with one.  It fetches whole, aligned blocks and keeps the most
+recently used of them, so the many small reads of a header scan cost
+one request per block rather than one per header.  While reads move
+forward through the archive it also fetches ahead, doubling the
+number of following blocks fetched with each sequential miss up to a
+limit, and dropping back to none when a read jumps elsewhere.  Reads
+larger than a quarter of the cache go straight to the backend rather
+than flushing it.
+
+Neither keeps a file position.  :py:class:`FileBackend` reads with
+:py:func:`os.pread` at explicit offsets and :py:class:`RangeCache`
+fetches outside of the lock which guards its blocks, so many threads
+may read members of one open archive at once without serializing on
+a shared seek.
+
+Typical use::
+
+    cache = RangeCache(FileBackend('/mnt/slow/archive.cpio'))
+    with cpiofile.CpioFile.open(mode='r', backend=cache) as archive:
+        ...
+"""
+
+from __future__ import unicode_literals, print_function
+
+__docformat__ = 'restructuredtext en'
+
+__all__ = [
+    'FileBackend',
+    'RangeCache',
+    ]
+
+import collections
+import io
+import os
+import threading
+
+class FileBackend(object):
+    """
+    A backend reading the local file *name*, or the file object
+    *fileobj*, with :py:func:`os.pread`, so that it has no file
+    position to share.
+
+    :param bool closefd: if true, closing this also closes *fileobj*
+    """
+
+    def __init__(self, name=None, fileobj=None, closefd=False):
+        if fileobj is None:
+            fileobj = io.open(os.path.normpath(os.path.expanduser(name)),
+                              'rb')
+            self._closefileobj = True
+        else:
+            self._closefileobj = closefd
+
+        self.fileobj = fileobj
+        self.fd = fileobj.fileno()
+        self.size = os.fstat(self.fd).st_size
+
+    def read_at(self, offset, size):
+        """return *size* bytes at *offset*, (fewer at the end)"""
+        chunks = []
+
+        while size > 0:
+            chunk = os.pread(self.fd, size, offset)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            offset += len(chunk)
+            size -= len(chunk)
+
+        return b''.join(chunks)
+
+    def close(self):
+        """close the file if it was opened here"""
+        if self._closefileobj:
+            self.fileobj.close()
+
+class RangeCache(object):
+    """
+    A read only, block cached view of *backend* which can be sliced
+    like bytes, and read from several threads at once.
+
+    :param int blocksize: bytes fetched and cached together
+    :param int blocks: number of blocks cached
+    :param int readahead: the most blocks fetched ahead of a
+        sequential read
+    """
+
+    def __init__(self, backend, blocksize=64 * 1024, blocks=256,
+                 readahead=32):
+        self.backend = backend
+        self.blocksize = blocksize
+        self.blocks = blocks
+        self.readahead = readahead
+        self._cache = collections.OrderedDict()
+        self._next = None
+        self._ahead = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.backend.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError('slices of a RangeCache must be contiguous')
+            return self.read_at(start, stop - start)
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('RangeCache index out of range')
+        return self.read_at(index, 1)[0]
+
+    def _fetch(self, first, count):
+        """
+        fetch *count* blocks from block number *first* into the cache,
+        returning the first of them.
+        """
+        blocksize = self.blocksize
+        data = self.backend.read_at(first * blocksize, count * blocksize)
+        blocks = [data[index * blocksize:(index + 1) * blocksize]
+                  for index in range(count)]
+
+        with self._lock:
+            for index, block in enumerate(blocks):
+                if not block:
+                    break
+                self._cache[first + index] = block
+
+            while len(self._cache) > self.blocks:
+                self._cache.popitem(last=False)
+
+        return blocks[0]
+
+    def _block(self, number):
+        """return block *number*, fetching it and any readahead on a miss"""
+        with self._lock:
+            block = self._cache.get(number)
+
+            if block is not None:
+                self._cache.move_to_end(number)
+                return block
+
+            if number == self._next:
+                self._ahead = min(max(self._ahead * 2, 1), self.readahead)
+            else:
+                self._ahead = 0
+
+            lastblock = max((len(self) - 1) // self.blocksize, number)
+            count = min(1 + self._ahead, lastblock - number + 1)
+            self._next = number + count
+
+        # the backend is read without the lock, so that a miss does not
+        # hold up other threads - two threads missing on the same block
+        # both fetch it, which is harmless
+        return self._fetch(number, count)
+
+    def read_at(self, offset, size):
+        """return *size* bytes at *offset*, (fewer at the end)"""
+        size = max(min(size, len(self) - offset), 0)
+        if not size:
+            return b''
+
+        if size > self.blocksize * self.blocks // 4:
+            return self.backend.read_at(offset, size)
+
+        blocksize = self.blocksize
+        first = offset // blocksize
+        last = (offset + size - 1) // blocksize
+        skip = offset - first * blocksize
+
+        if first == last:
+            return self._block(first)[skip:skip + size]
+
+        chunks = [self._block(number) for number in range(first, last + 1)]
+        return b''.join(chunks)[skip:skip + size]
+
+    def find(self, sub, start=0):
+        """
+        return the lowest offset of *sub* at or after *start*, or -1,
+        like :py:meth:`bytes.find`.
+        """
+        chunksize = self.blocksize * 4
+        overlap = len(sub) - 1
+        length = len(self)
+
+        while start < length:
+            chunk = self.read_at(start, chunksize + overlap)
+            found = chunk.find(sub)
+            if found >= 0:
+                return start + found
+            start += chunksize
+
+        return -1
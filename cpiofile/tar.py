@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2011, 2013 K Richard Pixley
+#
+# See LICENSE for details.
+
+"""
+Converting between cpio and tar archives without extracting them.
+
+:py:func:`cpio_to_tar` reads a cpio archive sequentially, a header
+at a time, and writes each member to a tar archive through
+:py:mod:`tarfile`, copying its content straight from the one file to
+the other in chunks.  :py:func:`tar_to_cpio` does the reverse, the
+same way, except that writing crc from an unseekable tar file reads
+each content whole, as its checksum precedes it.  So either side may
+be a pipe, and memory does not grow with the size of members.
+
+Modes, (including the set id and sticky bits), ownership, mtimes,
+symlink targets and the device numbers of character and block
+devices are carried across.  Sockets have no tar representation and
+are skipped, as tar itself skips them.  GNU sparse tar members become
+regular cpio files, with their holes filled.  Any other tar member
+type, (eg, a volume label), raises ValueError.
+
+Hardlinks are identified in cpio by a shared device and inode number
+with a link count above one, and in tar by a link member naming an
+earlier file.  From cpio, the first link to carry data becomes the tar
+file and the others link to it, (newc archives written by GNU cpio
+carry data on the last link only, so links seen before it are held
+back until it arrives).  From tar, each link shares the inode number
+of its target.  Link counts are found by a first pass over the tar
+headers when the tar file can seek; from a pipe each link count is
+the number of links seen so far.
+
+Typical use::
+
+    cpio_to_tar('initramfs.cpio', 'initramfs.tar')
+    tar_to_cpio('rootfs.tar.gz', 'rootfs.cpio', format='newc')
+"""
+
+from __future__ import unicode_literals, print_function
+
+__docformat__ = 'restructuredtext en'
+
+__all__ = [
+    'cpio_to_tar',
+    'tar_to_cpio',
+    ]
+
+import collections
+import io
+import os
+import stat
+import tarfile
+
+import cpiofile
+
+_types = {
+    stat.S_IFREG: tarfile.REGTYPE,
+    stat.S_IFDIR: tarfile.DIRTYPE,
+    stat.S_IFLNK: tarfile.SYMTYPE,
+    stat.S_IFCHR: tarfile.CHRTYPE,
+    stat.S_IFBLK: tarfile.BLKTYPE,
+    stat.S_IFIFO: tarfile.FIFOTYPE,
+    }
+"""tar member types by cpio file type""" # pylint: disable=W0105
+
+_modes = dict((value, key) for key, value in _types.items())
+_modes[tarfile.AREGTYPE] = stat.S_IFREG
+_modes[tarfile.CONTTYPE] = stat.S_IFREG
+_modes[tarfile.LNKTYPE] = stat.S_IFREG
+_modes[tarfile.GNUTYPE_SPARSE] = stat.S_IFREG
+
+def _decode(name):
+    """return the tar name for cpio name *name*"""
+    return name.decode('utf-8', 'surrogateescape')
+
+def _encode(name):
+    """return the cpio name for tar name *name*"""
+    return name.encode('utf-8', 'surrogateescape')
+
+def _tarinfo(member):
+    """return a :py:class:`tarfile.TarInfo` for *member*, or None"""
+    kind = _types.get(stat.S_IFMT(member.mode))
+    if kind is None:
+        return None
+
+    info = tarfile.TarInfo(_decode(member.name))
+    info.type = kind
+    info.mode = stat.S_IMODE(member.mode)
+    info.uid = member.uid
+    info.gid = member.gid
+    info.mtime = member.mtime
+
+    if kind == tarfile.REGTYPE:
+        info.size = member.filesize
+    elif kind == tarfile.SYMTYPE:
+        info.linkname = _decode(member.content)
+    elif kind in (tarfile.CHRTYPE, tarfile.BLKTYPE):
+        info.devmajor = member.rdevmajor
+        info.devminor = member.rdevminor
+
+    return info
+
+class _Content(object):
+    """
+    A file object reading the *length* bytes of a cpio member's content
+    from *fileobj*, and checking them against the member's checksum,
+    *check*, once they have all been read.
+    """
+
+    def __init__(self, fileobj, member, check):
+        self.fileobj = fileobj
+        self.member = member
+        self.check = check
+        self.remaining = member.filesize
+        self.csum = 0
+
+    def read(self, size=-1):
+        """read at most *size* bytes, (all that remain if negative)"""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        chunk = self.fileobj.read(size) if size else b''
+        if size and not chunk:
+            raise cpiofile.HeaderError('unexpected end of file')
+
+        self.remaining -= len(chunk)
+        # pylint: disable=W0212
+        self.csum += self.member._checksum(chunk, 0, len(chunk))
+        return chunk
+
+    def finish(self):
+        """read whatever is left and verify the checksum"""
+        while self.remaining:
+            self.read(1024 * 1024)
+
+        if (self.check is not None
+                and self.check != self.csum & 0xffffffff):
+            raise cpiofile.CheckSumError
+
+class _Sparse(object):
+    """
+    A reader of the sparse tar member *info* in *tar* which can seek
+    back to its start.  A :py:mod:`tarfile` reader of a sparse member
+    reads only zeros once it has been read through and seeked back, so
+    this opens a new one instead.
+    """
+
+    def __init__(self, tar, info):
+        self.tar = tar
+        self.info = info
+        self.reader = tar.extractfile(info)
+
+    def read(self, size=-1):
+        """read at most *size* bytes"""
+        return self.reader.read(size)
+
+    def tell(self):
+        """return the position in the member"""
+        return self.reader.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """seek, reopening the member to return to its start"""
+        if whence == os.SEEK_SET and offset == 0:
+            self.reader = self.tar.extractfile(self.info)
+            return 0
+        return self.reader.seek(offset, whence)
+
+def _link(tar, info, target):
+    """write *info* to *tar* as a hardlink to *target*"""
+    info.type = tarfile.LNKTYPE
+    info.linkname = target
+    info.size = 0
+    tar.addfile(info)
+
+def cpio_to_tar(src, dst, format=tarfile.PAX_FORMAT):
+    """
+    Convert the cpio archive *src* to a tar archive written to *dst*.
+
+    :param src: a file name, or a binary file object to read
+    :param dst: a file name, or a binary file object to write
+    :param int format: a :py:mod:`tarfile` format, eg,
+        :py:data:`tarfile.GNU_FORMAT`
+    :returns: the number of members written
+    """
+    # pylint: disable=W0622
+    if isinstance(src, (str, bytes)):
+        fileobj = io.open(os.path.normpath(os.path.expanduser(src)), 'rb')
+        closefd = True
+    else:
+        fileobj = src
+        closefd = False
+
+    try:
+        if isinstance(dst, (str, bytes)):
+            tar = tarfile.open(dst, 'w', format=format, encoding='utf-8')
+        else:
+            tar = tarfile.open(mode='w|', fileobj=dst, format=format,
+                               encoding='utf-8')
+
+        with tar:
+            return _write_infos(fileobj, tar)
+
+    finally:
+        if closefd:
+            fileobj.close()
+
+def _write_infos(fileobj, tar):
+    """
+    copy the members of the cpio archive *fileobj* to *tar*, returning
+    the number written.
+    """
+    # pylint: disable=W0212
+    written = {}
+    deferred = collections.OrderedDict()
+    count = 0
+    pointer = 0
+
+    while True:
+        member, check = cpiofile._read_member_header(fileobj, pointer)
+        pointer += member.size
+
+        if member.name == cpiofile.TRAILER:
+            break
+
+        # the tar file need not remember what it has written
+        del tar.members[:]
+
+        content = _Content(fileobj, member, check)
+        if stat.S_ISLNK(member.mode):
+            member.content = content.read()
+
+        info = _tarinfo(member)
+        key = (member.devmajor, member.devminor, member.ino)
+
+        if info is None:
+            pass
+
+        elif info.isreg() and member.nlink > 1 and key in written:
+            _link(tar, info, written[key])
+            count += 1
+
+        elif info.isreg() and member.nlink > 1 and not member.filesize:
+            deferred.setdefault(key, []).append(info)
+            count += 1
+
+        else:
+            if info.isreg() and member.nlink > 1:
+                written[key] = info.name
+
+            tar.addfile(info, content if info.isreg() else None)
+            count += 1
+
+            if key in written:
+                for link in deferred.pop(key, []):
+                    _link(tar, link, info.name)
+
+        content.finish()
+        cpiofile._skip(fileobj, member.datapad)
+
+    # groups which never carried data are empty files
+    for infos in deferred.values():
+        tar.addfile(infos[0])
+        for link in infos[1:]:
+            _link(tar, link, infos[0].name)
+
+    return count
+
+def _link_counts(tar):
+    """return a dict of the number of hardlinks to each name in *tar*"""
+    counts = collections.defaultdict(int)
+
+    for info in iter(tar.next, None):
+        del tar.members[:]
+        if info.islnk():
+            counts[info.linkname] += 1
+
+    return counts
+
+def tar_to_cpio(src, dst, format='newc'):
+    """
+    Convert the tar archive *src*, (which may be compressed), to a
+    cpio archive written to *dst*.
+
+    :param src: a file name, or a binary file object to read
+    :param dst: a file name, or a binary file object to write
+    :param str format: a key of :py:data:`cpiofile.formats`
+    :raises ValueError: for a tar member type which has no cpio
+        equivalent
+    :returns: the number of members written, (not counting the trailer)
+    """
+    # pylint: disable=W0622
+    if format not in cpiofile.formats:
+        raise ValueError('unknown format \'{0}\''.format(format))
+
+    if isinstance(src, (str, bytes)):
+        fileobj = io.open(os.path.normpath(os.path.expanduser(src)), 'rb')
+        closefd = True
+    else:
+        fileobj = src
+        closefd = False
+
+    try:
+        counts = {}
+        seekable = fileobj.seekable()
+
+        if seekable:
+            start = fileobj.tell()
+            with tarfile.open(fileobj=fileobj, mode='r:*',
+                              encoding='utf-8') as tar:
+                counts = _link_counts(tar)
+            fileobj.seek(start)
+
+        with tarfile.open(fileobj=fileobj, mode='r:*' if seekable else 'r|*',
+                          encoding='utf-8') as tar:
+            if isinstance(dst, (str, bytes)):
+                archive = cpiofile.CpioFile.open(dst, 'w', format=format)
+            else:
+                archive = cpiofile.CpioFile.open(mode='w', fileobj=dst,
+                                                 format=format)
+
+            with archive:
+                return _write_members(tar, archive, counts, seekable)
+
+    finally:
+        if closefd:
+            fileobj.close()
+
+def _write_members(tar, archive, counts, seekable):
+    """
+    copy the members of *tar* to *archive*, given the hardlink *counts*
+    of each name.
+    """
+    member_class = archive.member_class
+    crc = issubclass(member_class, cpiofile.CpioMemberCRC)
+    inodes = {}
+    seen = collections.defaultdict(int)
+    ino = 0
+    count = 0
+
+    for info in iter(tar.next, None):
+        del tar.members[:]
+
+        kind = _modes.get(info.type)
+        if kind is None:
+            raise ValueError('cannot convert tar member {0!r} of type {1!r}'
+                             .format(info.name, info.type))
+
+        member = member_class.trailer()
+        member.name = _encode(info.name)
+        member.mode = kind | (info.mode & 0o7777)
+        member.uid = info.uid
+        member.gid = info.gid
+        member.mtime = int(info.mtime)
+
+        if info.islnk() and info.linkname in inodes:
+            seen[info.linkname] += 1
+            member.ino = inodes[info.linkname]
+            member.nlink = 1 + counts.get(info.linkname,
+                                          seen[info.linkname])
+        else:
+            ino += 1
+            member.ino = ino & member_class.inomask
+            member.nlink = 2 if info.isdir() else 1 + counts.get(info.name, 0)
+            if info.isreg():
+                inodes[info.name] = member.ino
+
+        reader = None
+        if info.issym():
+            member.content = _encode(info.linkname)
+            member.filesize = len(member.content)
+        elif info.ischr() or info.isblk():
+            member.rdevmajor = info.devmajor
+            member.rdevminor = info.devminor
+        elif info.isreg() and info.size:
+            member.filesize = info.size
+            reader = (_Sparse(tar, info) if info.issparse()
+                      else tar.extractfile(info))
+            if crc and not seekable:
+                # the checksum precedes the content, and a tar stream
+                # cannot be read twice
+                member.content = reader.read()
+                reader = None
+
+        archive.addfile(member, reader)
+        count += 1
+
+    return count
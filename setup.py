@@ -58,11 +58,16 @@ setuptools.setup(
     install_requires=[
         'coding',
         ],
-    py_modules=['cpiofile'],
+    packages=['cpiofile'],
     include_package_data=True,
     test_suite='nose.collector',
     scripts = [
         ],
+    entry_points={
+        'console_scripts': [
+            'cpiofile = cpiofile.cli:main',
+            ],
+        },
     tests_require=[
         'coding',
         ],
@@ -17,10 +17,33 @@ __docformat__ = 'restructuredtext en'
 import nose
 from nose.tools import assert_true, assert_false, assert_equal, assert_raises, raises
 
+import bz2
+import gzip
+import hashlib
+import http.client
+import io
+import json
+import lzma
 import os
+import random
+import re
+import shutil
+import stat
+import struct
 import subprocess
+import tarfile
+import threading
+import time
 
+import benchmarks
 import cpiofile
+import cpiofile.cli
+import cpiofile.fs
+import cpiofile.http
+import cpiofile.rpm
+import cpiofile.scan
+import cpiofile.storage
+import cpiofile.tar
 
 types = [
     'bin',
@@ -59,5 +82,1790 @@ class testBasics(object):
         except:
             pass
 
+def newc_member(name, content, mode=0o100644, ino=1, mtime=0, nlink=1):
+    """return the bytes of a newc member, built by hand"""
+    header = ('070701' + '{:08X}' * 13).format(
+        ino, mode, 0, 0, nlink, mtime, len(content),
+        0, 0, 0, 0, len(name) + 1, 0).encode('ascii')
+    block = header + name + b'\x00'
+    block += b'\x00' * ((4 - len(block) % 4) % 4)
+    block += content
+    block += b'\x00' * ((4 - len(block) % 4) % 4)
+    return block
+
+def newc_archive(members):
+    """return the bytes of a newc archive of (name, content) *members*"""
+    block = b''.join(newc_member(name, content, ino=ino)
+                     for ino, (name, content) in enumerate(members, 1))
+    return block + newc_member(cpiofile.TRAILER, b'', mode=0, ino=0)
+
+class testScan(object):
+    archives = ['scan-{0}.cpio'.format(i) for i in range(3)]
+
+    def setUp(self):
+        for i, fname in enumerate(self.archives):
+            with open(fname, 'wb') as f:
+                f.write(newc_archive([(b'a', b'alpha' * i),
+                                      (b'dir/b', b'beta')]))
+
+        with open('scan-bogus.cpio', 'wb') as f:
+            f.write(b'not a cpio archive')
+
+    def testOpen(self):
+        with cpiofile.CpioFile.open(self.archives[2], 'r') as cf:
+            assert_equal(cf.names, [b'a', b'dir/b'])
+            assert_equal(cf.get_member(b'a').content, b'alpha' * 2)
+
+    def testScan(self):
+        for jobs in [1, 2]:
+            out = io.StringIO()
+            progress = []
+            counts = cpiofile.scan.scan(
+                self.archives + ['scan-bogus.cpio'], out, jobs=jobs,
+                progress=lambda *args: progress.append(args))
+
+            assert_equal(counts, (4, 6, 1))
+            assert_equal(progress[-1], (4, 4, 6))
+
+            records = [json.loads(line) for line in out.getvalue().splitlines()]
+            assert_equal([r['archive'] for r in records],
+                         [fname for fname in self.archives for _ in 'ab']
+                         + ['scan-bogus.cpio'])
+            assert_equal(records[2], {
+                'archive': self.archives[1], 'name': 'a', 'size': 5,
+                'mode': 0o100644, 'mtime': 0,
+                'checksum': hashlib.sha256(b'alpha').hexdigest()})
+            assert_true('error' in records[-1])
+
+    def testGrep(self):
+        out = io.StringIO()
+        cpiofile.scan.scan(self.archives, out, jobs=1, ordered=False,
+                           algorithm=None, grep=b'alp+')
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert_equal([(r['archive'], r['name'], r['checksum']) for r in records],
+                     [(self.archives[1], 'a', None),
+                      (self.archives[2], 'a', None)])
+
+    def testInvalid(self):
+        # refused before any worker starts, rather than in every one
+        for jobs in [1, 2]:
+            out = io.StringIO()
+            assert_raises(re.error, cpiofile.scan.scan, self.archives, out,
+                          jobs=jobs, grep=b'alp(')
+            assert_raises(ValueError, cpiofile.scan.scan, self.archives,
+                          out, jobs=jobs, algorithm='nosuchhash')
+            assert_equal(out.getvalue(), '')
+
+        assert_equal(cpiofile.cli.main(['scan', '--grep', 'alp(']
+                                       + self.archives), 2)
+
+    def testTruncated(self):
+        block = open(self.archives[2], 'rb').read()
+        with open('scan-truncated.cpio', 'wb') as f:
+            f.write(block[:len(block) // 2])
+
+        for jobs in [1, 2]:
+            out = io.StringIO()
+            counts = cpiofile.scan.scan(
+                [self.archives[1], 'scan-truncated.cpio', self.archives[2]],
+                out, jobs=jobs)
+            assert_equal(counts, (3, 4, 1))
+            records = [json.loads(line)
+                       for line in out.getvalue().splitlines()]
+            assert_equal([r['archive'] for r in records if 'error' in r],
+                         ['scan-truncated.cpio'])
+
+    def tearDown(self):
+        for fname in self.archives + ['scan-bogus.cpio', 'scan-truncated.cpio']:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+class testWrite(object):
+    tree = 'write-src'
+
+    def setUp(self):
+        os.makedirs(os.path.join(self.tree, 'sub'))
+        with open(os.path.join(self.tree, 'a'), 'wb') as f:
+            f.write(b'hello')
+        with open(os.path.join(self.tree, 'sub', 'b'), 'wb') as f:
+            f.write(b'odd')
+        os.symlink('a', os.path.join(self.tree, 'link'))
+        self.paths = [self.tree] + sorted(
+            os.path.join(dirpath, name)
+            for dirpath, dirnames, filenames in os.walk(self.tree)
+            for name in dirnames + filenames)
+
+    def testRoundTrip(self):
+        for format in cpiofile.formats:
+            with cpiofile.CpioFile.open('write.cpio', 'w', format=format) as cf:
+                for path in self.paths:
+                    cf.add(path)
+
+            assert_true(cpiofile.is_cpiofile('write.cpio'))
+
+            with cpiofile.CpioFile.open('write.cpio', 'r') as cf:
+                assert_equal(cf.names, [os.fsencode(p) for p in self.paths])
+                assert_true(all(type(m) is cpiofile.formats[format]
+                                for m in cf.members))
+                assert_equal(cf.get_member(b'write-src/sub/b').content, b'odd')
+                assert_equal(cf.get_member(b'write-src/link').content, b'a')
+
+                cf.extractall('write-out')
+
+            assert_equal(open('write-out/write-src/sub/b', 'rb').read(), b'odd')
+            assert_equal(os.readlink('write-out/write-src/link'), 'a')
+            assert_equal(os.stat('write-out/write-src/a').st_mtime,
+                         int(os.stat('write-src/a').st_mtime))
+            shutil.rmtree('write-out')
+
+    def testOverflow(self):
+        member = cpiofile.CpioMemberODC.from_stat(b'big', os.stat(self.tree))
+        member.uid = 0o1000000
+        assert_raises(cpiofile.HeaderError, member.pack_header)
+
+    def testCommandLine(self):
+        assert_equal(cpiofile.cli.main(
+            ['create', '-H', 'crc', '-F', 'write.cpio'] + self.paths), 0)
+        assert_equal(cpiofile.cli.main(
+            ['extract', '-F', 'write.cpio', '-D', 'write-out', '*/sub*']), 0)
+        assert_equal(sorted(os.listdir('write-out/write-src')), ['sub'])
+        assert_equal(cpiofile.cli.main(['pass', 'write-out'] + self.paths), 0)
+        assert_equal(open('write-out/write-src/a', 'rb').read(), b'hello')
+
+    def testCommandLineErrors(self):
+        assert_equal(cpiofile.cli.main(
+            ['create', '-H', 'odc', '--dedup', '-F', 'write.cpio']
+            + self.paths), 2)
+
+    def testSymlinkEscape(self):
+        outside = os.path.abspath('write-outside')
+        os.mkdir(outside)
+        os.chmod(outside, 0o755)
+        block = b''.join([
+            newc_member(b'a', os.fsencode(outside), mode=0o120777, ino=1),
+            newc_member(b'a/x', b'escaped', ino=2),
+            newc_member(cpiofile.TRAILER, b'', mode=0, ino=0)])
+
+        with cpiofile.CpioFile.open(mode='r', fileobj=io.BytesIO(block)) as cf:
+            assert_raises(cpiofile.CpioError, cf.extractall, 'write-out')
+        assert_equal(os.listdir(outside), [])
+        shutil.rmtree('write-out')
+
+        # nor through a hardlink
+        block = b''.join([
+            newc_member(b'a', os.fsencode(outside), mode=0o120777, ino=1),
+            newc_member(b'f', b'linked', ino=2, nlink=2),
+            newc_member(b'a/g', b'', ino=2, nlink=2),
+            newc_member(cpiofile.TRAILER, b'', mode=0, ino=0)])
+
+        with cpiofile.CpioFile.open(mode='r', fileobj=io.BytesIO(block)) as cf:
+            assert_equal([m.nlink for m in cf.members], [1, 2, 2])
+            assert_raises(cpiofile.CpioError, cf.extractall, 'write-out')
+        assert_equal(os.listdir(outside), [])
+        shutil.rmtree('write-out')
+
+        # a directory member replaces a symlink rather than following it
+        block = b''.join([
+            newc_member(b'a', os.fsencode(outside), mode=0o120777, ino=1),
+            newc_member(b'a', b'', mode=0o040700, ino=2),
+            newc_member(cpiofile.TRAILER, b'', mode=0, ino=0)])
+
+        with cpiofile.CpioFile.open(mode='r', fileobj=io.BytesIO(block)) as cf:
+            cf.extractall('write-out')
+        assert_false(os.path.islink('write-out/a'))
+        assert_equal(stat.S_IMODE(os.stat(outside).st_mode), 0o755)
+
+    def tearDown(self):
+        for tree in [self.tree, 'write-out', 'write-outside']:
+            shutil.rmtree(tree, ignore_errors=True)
+
+        if os.path.exists('write.cpio'):
+            os.remove('write.cpio')
+
+class testStats(object):
+    def setUp(self):
+        with open('stats.cpio', 'wb') as f:
+            f.write(newc_archive([(b'a', b'alpha'), (b'b', b'beta')]))
+
+    def testRead(self):
+        calls = []
+        stats = cpiofile.CpioStats(lambda *args: calls.append(args))
+
+        with cpiofile.CpioFile.open('stats.cpio', 'r', stats=stats) as cf:
+            assert_equal(len(cf.members), 2)
+
+        assert_equal(stats.bytes_mapped, os.path.getsize('stats.cpio'))
+        assert_equal(stats.headers_decoded, 3) # including the trailer
+        assert_true('content' not in stats.bytes) # copied only on use
+        assert_equal(stats.bytes_checksummed, 9)
+        assert_equal(stats.counts['unpack'], 1)
+        assert_equal(len(calls), sum(stats.counts.values()))
+        assert_true(all(seconds >= 0 for seconds in stats.times.values()))
+
+    def testWrite(self):
+        stats = cpiofile.CpioStats()
+        with cpiofile.CpioFile.open('stats.cpio', 'w', format='crc',
+                                    stats=stats) as cf:
+            cf.add('tests.py')
+
+        assert_equal(stats.counts['pack'], 1)
+        assert_equal(stats.bytes_checksummed, os.path.getsize('tests.py'))
+
+    def tearDown(self):
+        os.remove('stats.cpio')
+
+class testPatch(object):
+    def testPatch(self):
+        for format in benchmarks.formats:
+            benchmarks.generate('patch.cpio', format, members=20,
+                                sizes=(0, 50))
+            before = open('patch.cpio', 'rb').read()
+
+            with cpiofile.CpioFile.open('patch.cpio', 'r+') as cf:
+                name = cf.names[7]
+                cf.patch_member(name, uid=1000, gid=100, mtime=12345,
+                                mode=0o100600)
+                assert_raises(cpiofile.HeaderError, cf.patch_member,
+                              name, uid=1 << 40)
+                assert_raises(ValueError, cf.patch_member, name, filesize=1)
+                assert_raises(KeyError, cf.patch_member, b'missing', uid=0)
+                assert_equal(cf.get_member(name).uid, 1000)
+
+            after = open('patch.cpio', 'rb').read()
+            assert_equal(len(after), len(before))
+
+            with cpiofile.CpioFile.open('patch.cpio', 'r') as cf:
+                member = cf.get_member(name)
+                assert_equal((member.uid, member.gid, member.mtime, member.mode),
+                             (1000, 100, 12345, 0o100600))
+                assert_equal(cf.members[6].uid, 0)
+
+            changed = [i for i in range(len(before)) if before[i] != after[i]]
+            assert_true(changed)
+            assert_true(all(member.offset <= i < member.offset
+                            + member.coder.size for i in changed))
+
+    def tearDown(self):
+        if os.path.exists('patch.cpio'):
+            os.remove('patch.cpio')
+
+class testAppend(object):
+    def testAppend(self):
+        for format in benchmarks.formats:
+            benchmarks.generate('append.cpio', format, members=20)
+            with cpiofile.CpioFile.open('append.cpio', 'r') as cf:
+                names = cf.names
+                end = cf.members[-1].offset + cf.members[-1].size
+            before = open('append.cpio', 'rb').read()
+
+            with cpiofile.CpioFile.open('append.cpio', 'a', format='odc') as cf:
+                cf.add('tests.py', 'new/tests.py')
+                cf.add('setup.py')
+                assert_equal(cf.names, [b'new/tests.py', b'setup.py'])
+
+            after = open('append.cpio', 'rb').read()
+            assert_equal(after[:end], before[:end])
+
+            with cpiofile.CpioFile.open('append.cpio', 'r') as cf:
+                assert_equal(cf.names, names + [b'new/tests.py', b'setup.py'])
+                assert_true(all(type(m) is cpiofile.formats[format]
+                                for m in cf.members))
+                assert_equal(cf.members[-1].content,
+                             open('setup.py', 'rb').read())
+
+    def testAppendNew(self):
+        with cpiofile.CpioFile.open('append.cpio', 'a', format='odc') as cf:
+            cf.add('setup.py')
+
+        with cpiofile.CpioFile.open('append.cpio', 'r') as cf:
+            assert_equal(cf.names, [b'setup.py'])
+            assert_true(isinstance(cf.members[0], cpiofile.CpioMemberODC))
+
+    def tearDown(self):
+        if os.path.exists('append.cpio'):
+            os.remove('append.cpio')
+
+class testDeterministic(object):
+    trees = ['det-a', 'det-b']
+
+    def setUp(self):
+        for i, tree in enumerate(self.trees):
+            os.makedirs(os.path.join(tree, 'sub', 'deeper'))
+            for name in ['one', 'sub/two']:
+                with open(os.path.join(tree, name), 'wb') as f:
+                    f.write(name.encode('ascii'))
+            os.link(os.path.join(tree, 'one'), os.path.join(tree, 'sub/link'))
+            os.utime(os.path.join(tree, 'one'), (i * 1000, i * 1000))
+
+    def archive(self, tree, order, format):
+        os.chdir(tree)
+        try:
+            with cpiofile.CpioFile.open('../det.cpio', 'w', format=format,
+                                        deterministic=True, mtime=7) as cf:
+                for path in order:
+                    cf.add(path)
+        finally:
+            os.chdir('..')
+        return open('det.cpio', 'rb').read()
+
+    def testDeterministic(self):
+        order = ['sub/two', 'sub/link', 'one', 'sub', 'sub/deeper']
+
+        for format in ['newc', 'crc', 'odc', 'bin']:
+            first = self.archive(self.trees[0], order, format)
+            second = self.archive(self.trees[1], order[::-1], format)
+            assert_equal(first, second)
+
+            with cpiofile.CpioFile.open('det.cpio', 'r') as cf:
+                assert_equal(cf.names, sorted(os.fsencode(p) for p in order))
+                assert_equal(set(m.mtime for m in cf.members), set([7]))
+                one, link = cf.get_member(b'one'), cf.get_member(b'sub/link')
+                assert_equal(one.ino, link.ino)
+                assert_equal((one.nlink, link.nlink), (2, 2))
+                assert_equal(cf.get_member(b'sub').nlink, 3)
+                assert_equal([m.ino for m in cf.members], [1, 2, 3, 1, 4])
+
+    def tearDown(self):
+        for tree in self.trees:
+            shutil.rmtree(tree, ignore_errors=True)
+        if os.path.exists('det.cpio'):
+            os.remove('det.cpio')
+
+class testDedup(object):
+    tree = 'dedup-src'
+
+    def setUp(self):
+        os.makedirs(os.path.join(self.tree, 'sub'))
+        for name, content in [('a', b'same' * 100), ('b', b'other'),
+                              ('sub/c', b'same' * 100), ('sub/d', b'same' * 100),
+                              ('e', b'')]:
+            with open(os.path.join(self.tree, name), 'wb') as f:
+                f.write(content)
+            os.utime(os.path.join(self.tree, name), (100, 100))
+        os.chmod(os.path.join(self.tree, 'sub/d'), 0o600)
+        self.paths = [os.path.join(self.tree, name)
+                      for name in ['a', 'b', 'sub', 'sub/c', 'sub/d', 'e']]
+
+    def check(self, format):
+        with cpiofile.CpioFile.open('dedup.cpio', 'r') as cf:
+            a, c, d = [cf.get_member(os.fsencode(os.path.join(self.tree, name)))
+                       for name in ['a', 'sub/c', 'sub/d']]
+            assert_equal((a.ino, a.nlink, len(a.content)), (c.ino, 2, 400))
+            assert_equal((c.nlink, c.filesize), (2, 0))
+            assert_equal((d.nlink, d.filesize), (1, 400))
+            cf.extractall('dedup-out')
+
+        for name in ['a', 'b', 'sub/c', 'sub/d', 'e']:
+            assert_equal(open(os.path.join('dedup-out', self.tree, name), 'rb').read(),
+                         open(os.path.join(self.tree, name), 'rb').read())
+        assert_equal(os.stat(os.path.join('dedup-out', self.tree, 'a')).st_ino,
+                     os.stat(os.path.join('dedup-out', self.tree, 'sub/c')).st_ino)
+        shutil.rmtree('dedup-out')
+
+    def testDedup(self):
+        for format in ['newc', 'crc']:
+            for deterministic in [False, True]:
+                with cpiofile.CpioFile.open('dedup.cpio', 'w', format=format,
+                                            dedup=True,
+                                            deterministic=deterministic) as cf:
+                    for path in self.paths:
+                        cf.add(path)
+
+                self.check(format)
+
+    def testUnsupported(self):
+        assert_raises(ValueError, cpiofile.CpioFile.open, 'dedup.cpio', 'w',
+                      format='odc', dedup=True)
+
+        read, write = os.pipe()
+        os.close(read)
+        with io.open(write, 'wb') as pipe:
+            assert_raises(ValueError, cpiofile.CpioFile.open, mode='w',
+                          fileobj=pipe, dedup=True)
+
+    def tearDown(self):
+        for tree in [self.tree, 'dedup-out']:
+            shutil.rmtree(tree, ignore_errors=True)
+        if os.path.exists('dedup.cpio'):
+            os.remove('dedup.cpio')
+
+class testDiff(object):
+    def setUp(self):
+        with open('diff-old.cpio', 'wb') as f:
+            f.write(newc_archive([(b'same', b'1'), (b'gone', b'2'),
+                                  (b'content', b'abc'), (b'size', b'x')]))
+        with open('diff-new.cpio', 'wb') as f:
+            f.write(newc_archive([(b'size', b'xy'), (b'content', b'abd'),
+                                  (b'new', b'3'), (b'same', b'1')]))
+
+    def testDiff(self):
+        with cpiofile.CpioFile.open('diff-old.cpio', 'r') as old:
+            with cpiofile.CpioFile.open('diff-new.cpio', 'r') as new:
+                diff = old.diff(new)
+                assert_true(diff)
+                assert_equal([m.name for m in diff.added], [b'new'])
+                assert_equal([m.name for m in diff.removed], [b'gone'])
+                assert_equal([(a.name, d) for a, b, d in diff.changed],
+                             [(b'size', ['filesize']),
+                              (b'content', ['content'])])
+                assert_false(old.diff(old))
+                assert_true(old == old)
+                assert_false(old == new)
+                assert_true(old.close_enough(old))
+                assert_false(old.close_enough(new))
+
+                assert_equal(diff.write('diff-delta.cpio', format='odc'), 3)
+
+        with cpiofile.CpioFile.open('diff-delta.cpio', 'r') as delta:
+            assert_equal(delta.names, [b'size', b'content', b'new'])
+            assert_equal(delta.members[1].content, b'abd')
+
+    def testLazy(self):
+        big = b'0123456789' * 300000
+        with open('diff-old.cpio', 'wb') as f:
+            f.write(newc_archive([(b'same', big), (b'tail', big)]))
+        with open('diff-new.cpio', 'wb') as f:
+            f.write(newc_archive([(b'same', big), (b'tail', big[:-1] + b'!')]))
+
+        with cpiofile.CpioFile.open('diff-old.cpio', 'r') as old:
+            with cpiofile.CpioFile.open('diff-new.cpio', 'r') as new:
+                diff = old.diff(new)
+                assert_equal([(a.name, d) for a, b, d in diff.changed],
+                             [(b'tail', ['content'])])
+
+                # compared in the maps, never copied out
+                assert_true(all(m._content is None # pylint: disable=W0212
+                                for m in old.members + new.members))
+
+    def testLinks(self):
+        trailer = newc_member(cpiofile.TRAILER, b'', mode=0, ino=0)
+        with open('diff-old.cpio', 'wb') as f:
+            f.write(newc_member(b'a', b'', ino=7, nlink=2)
+                    + newc_member(b'b', b'linked', ino=7, nlink=2) + trailer)
+        with open('diff-new.cpio', 'wb') as f:
+            f.write(newc_member(b'a', b'linked', ino=7, nlink=2)
+                    + newc_member(b'b', b'', ino=7, nlink=2) + trailer)
+
+        with cpiofile.CpioFile.open('diff-old.cpio', 'r') as old:
+            with cpiofile.CpioFile.open('diff-new.cpio', 'r') as new:
+                assert_false(old.diff(new))
+
+        with open('diff-new.cpio', 'wb') as f:
+            f.write(newc_member(b'a', b'linkeD', ino=7, nlink=2)
+                    + newc_member(b'b', b'', ino=7, nlink=2) + trailer)
+
+        with cpiofile.CpioFile.open('diff-old.cpio', 'r') as old:
+            with cpiofile.CpioFile.open('diff-new.cpio', 'r') as new:
+                assert_equal([(a.name, d) for a, b, d in old.diff(new).changed],
+                             [(b'a', ['content']), (b'b', ['content'])])
+
+    def testCloseEnough(self):
+        one = cpiofile.CpioMemberNew.trailer()
+        other = cpiofile.CpioMemberODC.trailer()
+        other.ino = other.mtime = 99
+        assert_true(one.close_enough(other))
+        other.uid = 1
+        assert_false(one.close_enough(other))
+
+    def tearDown(self):
+        for fname in ['diff-old.cpio', 'diff-new.cpio', 'diff-delta.cpio']:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+class Unseekable(io.BytesIO):
+    """a file which can only be read forwards, like a pipe"""
+    def seekable(self):
+        return False
+
+class testFilter(object):
+    def setUp(self):
+        benchmarks.generate('filter.cpio', 'crc', members=40, sizes=(0, 50))
+
+    def testMapped(self):
+        with cpiofile.CpioFile.open('filter.cpio', 'r') as cf:
+            names = cf.names
+            wanted = [name for name in names
+                      if name.startswith(b'1/') or name.startswith(b'2')]
+            selected = list(cf.iter_members(include=['1/*', re.compile(b'^2')]))
+            assert_equal([m.name for m in selected], wanted)
+            assert_true(all(m._content is None for m in cf.members))
+            assert_equal(selected[0].content, open('filter.cpio', 'rb').read()[
+                selected[0].offset + selected[0].size - selected[0].filesize
+                - selected[0].datapad:][:selected[0].filesize])
+
+            assert_equal([m.name for m in cf.iter_members(exclude='*')], [])
+            assert_equal(len(list(cf.iter_members(
+                predicate=lambda m: m.filesize > 25))),
+                         len([m for m in cf.members if m.filesize > 25]))
+            assert_equal(list(cf), cf.members)
+
+    def testStream(self):
+        with cpiofile.CpioFile.open('filter.cpio', 'r') as cf:
+            members = cf.members
+            victim = [m for m in members if m.filesize][3]
+            expected = [m for m in members if m is not victim]
+
+        block = bytearray(open('filter.cpio', 'rb').read())
+        datastart = (victim.offset + victim.size - victim.datapad
+                     - victim.filesize)
+        block[datastart] ^= 0xff
+
+        for fileobj in [io.BytesIO(bytes(block)), Unseekable(bytes(block))]:
+            with cpiofile.CpioFile.open(mode='r|', fileobj=fileobj) as cf:
+                # the damaged content is never checked since it is skipped
+                streamed = list(cf.iter_members(exclude=[victim.name]))
+                assert_equal([m.name for m in streamed],
+                             [m.name for m in expected])
+                assert_equal([m.content for m in streamed],
+                             [m.content for m in expected])
+                assert_equal(cf.members, [])
+
+        with cpiofile.CpioFile.open(mode='r|',
+                                    fileobj=Unseekable(bytes(block))) as cf:
+            assert_raises(cpiofile.CheckSumError, list,
+                          cf.iter_members(include=victim.name))
+
+    def testCli(self):
+        with cpiofile.CpioFile.open('filter.cpio', 'r') as cf:
+            wanted = [m.name for m in cf.iter_members(include='3*')]
+
+        os.mkdir('filter-out')
+        assert_equal(cpiofile.cli.main(['extract', '-F', 'filter.cpio',
+                                        '-D', 'filter-out', '3*']), 0)
+        assert_equal(sorted(os.listdir('filter-out')),
+                     sorted(set(name.split(b'/')[0].decode('ascii')
+                                for name in wanted)))
+
+    def tearDown(self):
+        os.remove('filter.cpio')
+        shutil.rmtree('filter-out', ignore_errors=True)
+
+class testOpenMember(object):
+    def setUp(self):
+        benchmarks.generate('member.cpio', 'newc', members=10,
+                            sizes=(1000, 5000))
+
+    def testRead(self):
+        with cpiofile.CpioFile.open('member.cpio', 'r') as cf:
+            member = cf.members[4]
+            with cf.open_member(member.name) as reader:
+                assert_true(reader.seekable())
+                assert_equal(reader.read(10), member.content[:10])
+
+                buf = bytearray(100)
+                assert_equal(reader.readinto(buf), 100)
+                assert_equal(bytes(buf), member.content[10:110])
+
+                reader.seek(-5, os.SEEK_END)
+                assert_equal(reader.read(), member.content[-5:])
+                assert_equal(reader.read(1), b'')
+                assert_equal(reader.readinto(buf), 0)
+
+                reader.seek(0)
+                out = io.BytesIO()
+                shutil.copyfileobj(reader, out, 333)
+                assert_equal(out.getvalue(), member.content)
+
+            with io.BufferedReader(cf.open_member(member)) as reader:
+                digest = hashlib.sha256()
+                for chunk in iter(lambda: reader.read(256), b''):
+                    digest.update(chunk)
+                assert_equal(digest.digest(),
+                             hashlib.sha256(member.content).digest())
+
+            assert_raises(KeyError, cf.open_member, b'missing')
+
+    def tearDown(self):
+        os.remove('member.cpio')
+
+class testHTTP(object):
+    def setUp(self):
+        with open('http.cpio', 'wb') as f:
+            f.write(newc_archive([(b'./index.html', b'<p>hello</p>'),
+                                  (b'data.bin', bytes(bytearray(range(256))))]))
+
+    def request(self, port, method, path, headers={}):
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        try:
+            connection.request(method, path, headers=headers)
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            connection.close()
+
+    def testServer(self):
+        server = cpiofile.http.CpioHTTPServer(('127.0.0.1', 0), 'http.cpio')
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+
+        try:
+            port = server.server_address[1]
+            data = bytes(bytearray(range(256)))
+
+            status, headers, body = self.request(port, 'GET', '/index.html')
+            assert_equal((status, body), (200, b'<p>hello</p>'))
+            assert_equal(headers['Content-Type'], 'text/html')
+            assert_equal(headers['Content-Length'], '12')
+
+            status, headers, body = self.request(port, 'HEAD', '/data.bin')
+            assert_equal((status, headers['Content-Length'], body),
+                         (200, '256', b''))
+
+            status, headers, body = self.request(port, 'GET', '/data.bin',
+                                                 {'Range': 'bytes=10-19'})
+            assert_equal((status, body), (206, data[10:20]))
+            assert_equal(headers['Content-Range'], 'bytes 10-19/256')
+
+            status, _, body = self.request(port, 'GET', '/data.bin',
+                                           {'Range': 'bytes=-6'})
+            assert_equal((status, body), (206, data[-6:]))
+
+            status, _, _ = self.request(port, 'GET', '/data.bin',
+                                        {'Range': 'bytes=300-'})
+            assert_equal(status, 416)
+
+            status, _, _ = self.request(port, 'GET', '/missing')
+            assert_equal(status, 404)
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def testParseRange(self):
+        parse = cpiofile.http._parse_range # pylint: disable=W0212
+        assert_equal(parse('bytes=10-19', 100), (10, 20))
+        assert_equal(parse('bytes=90-', 100), (90, 100))
+        assert_equal(parse('bytes=-5', 100), (95, 100))
+        assert_equal(parse(' bytes = 10-19 ', 100), (10, 20))
+        assert_equal(parse('bytes=100-', 100), False)
+        assert_equal(parse('bytes=-0', 100), False)
+
+        # only digits are accepted, anything else is ignored
+        for spec in ['--5', '-', '1_0-20', '+5-10', '5- 10', '1 0-20', '-+5',
+                     '\u0663-5', '0-1,3-4']:
+            assert_equal(parse('bytes=' + spec, 100), None)
+
+    def testApplication(self):
+        with cpiofile.CpioFile.open('http.cpio', 'r') as cf:
+            app = cpiofile.http.CpioApplication(cf)
+            responses = []
+            environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/data.bin',
+                       'HTTP_RANGE': 'bytes=250-'}
+            body = b''.join(app(environ, lambda status, headers:
+                                responses.append((status, headers))))
+            assert_equal(body, bytes(bytearray(range(250, 256))))
+            assert_equal(responses[0][0], '206 Partial Content')
+
+            environ = {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/data.bin'}
+            assert_equal(list(app(environ, lambda status, headers:
+                                  responses.append((status, headers)))), [])
+            assert_equal(responses[1][0], '405 Method Not Allowed')
+
+    def tearDown(self):
+        os.remove('http.cpio')
+
+class testFS(object):
+    def setUp(self):
+        self.tree = 'fs-src'
+        os.makedirs('fs-src/sub/deeper')
+        with open('fs-src/sub/a.txt', 'w') as f:
+            f.write('alpha\n')
+        with open('fs-src/sub/deeper/b', 'wb') as f:
+            f.write(b'beta')
+        os.symlink('sub/a.txt', 'fs-src/link')
+        os.symlink('sub', 'fs-src/dirlink')
+        os.symlink('nowhere', 'fs-src/dangling')
+
+        with cpiofile.CpioFile.open('fs.cpio', 'w') as cf:
+            for dirpath, dirnames, filenames in os.walk(self.tree):
+                dirnames.sort()
+                for name in sorted(dirnames + filenames):
+                    cf.add(os.path.join(dirpath, name))
+
+    def testFS(self):
+        with cpiofile.CpioFile.open('fs.cpio', 'r') as cf:
+            fs = cpiofile.fs.CpioFS(cf)
+
+            assert_equal(fs.listdir('/'), ['fs-src'])
+            assert_equal(sorted(fs.listdir('fs-src')),
+                         ['dangling', 'dirlink', 'link', 'sub'])
+            assert_equal(sorted(fs.listdir(b'fs-src/dirlink')),
+                         [b'a.txt', b'deeper'])
+
+            assert_equal(fs.stat('fs-src/link').st_size, 6)
+            assert_true(os.path.stat.S_ISLNK(fs.lstat('fs-src/link').st_mode))
+            assert_equal(fs.readlink('fs-src/link'), 'sub/a.txt')
+            assert_raises(OSError, fs.readlink, 'fs-src/sub')
+
+            with fs.open('fs-src/dirlink/a.txt') as f:
+                assert_equal(f.read(), 'alpha\n')
+            with fs.open('/fs-src/sub/../sub/deeper/b', 'rb') as f:
+                assert_equal(f.read(), b'beta')
+
+            assert_true(fs.exists('fs-src/sub/deeper'))
+            assert_false(fs.exists('fs-src/dangling'))
+            assert_false(fs.exists('fs-src/sub/a.txt/x'))
+            assert_raises(FileNotFoundError, fs.stat, 'fs-src/missing')
+            assert_raises(NotADirectoryError, fs.listdir, 'fs-src/link')
+            assert_raises(IsADirectoryError, fs.open, 'fs-src/sub')
+            assert_raises(OSError, fs.open, 'fs-src/link', 'w')
+
+            walked = [(top, sorted(dirs), sorted(files))
+                      for top, dirs, files in fs.walk('fs-src')]
+            expected = [(top, sorted(dirs), sorted(files))
+                        for top, dirs, files in os.walk('fs-src')]
+            assert_equal(walked, expected)
+
+    def tearDown(self):
+        shutil.rmtree(self.tree, ignore_errors=True)
+        if os.path.exists('fs.cpio'):
+            os.remove('fs.cpio')
+
+class testSparse(object):
+    def setUp(self):
+        with open('sparse-src', 'wb') as f:
+            f.seek(1 << 20)
+            f.write(b'data' * 1000)
+            f.seek(1 << 18, os.SEEK_CUR)
+            f.truncate()
+        self.content = open('sparse-src', 'rb').read()
+
+    def sparse(self, path):
+        status = os.stat(path)
+        return status.st_blocks * 512 < status.st_size
+
+    def testSparse(self):
+        archives = []
+        for sparse in [False, True]:
+            with cpiofile.CpioFile.open('sparse.cpio', 'w', format='crc',
+                                        sparse=sparse) as cf:
+                cf.add('sparse-src')
+            archives.append(open('sparse.cpio', 'rb').read())
+        assert_equal(archives[0], archives[1])
+
+        with cpiofile.CpioFile.open('sparse.cpio', 'r') as cf:
+            cf.extractall('sparse-out')
+        assert_equal(open('sparse-out/sparse-src', 'rb').read(), self.content)
+
+        with cpiofile.CpioFile.open('sparse.cpio', 'r') as cf:
+            cf.holesize = 0
+            cf.extractall('sparse-dense')
+        assert_equal(open('sparse-dense/sparse-src', 'rb').read(),
+                     self.content)
+
+        assert_equal(cpiofile.cli.main(['pass', 'sparse-pass', 'sparse-src']),
+                     0)
+        assert_equal(open('sparse-pass/sparse-src', 'rb').read(),
+                     self.content)
+
+        if self.sparse('sparse-src'): # the file system supports holes
+            assert_true(self.sparse('sparse-out/sparse-src'))
+            assert_true(self.sparse('sparse-pass/sparse-src'))
+            assert_false(self.sparse('sparse-dense/sparse-src'))
+
+    def tearDown(self):
+        for tree in ['sparse-out', 'sparse-dense', 'sparse-pass']:
+            shutil.rmtree(tree, ignore_errors=True)
+        for fname in ['sparse-src', 'sparse.cpio']:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+class testRecover(object):
+    def setUp(self):
+        self.blocks = {}
+        self.members = {}
+        for format in ['newc', 'crc', 'odc', 'bin-le']:
+            benchmarks.generate('recover.cpio', format, members=30,
+                                sizes=(1, 100))
+            self.blocks[format] = open('recover.cpio', 'rb').read()
+            with cpiofile.CpioFile.open('recover.cpio', 'r') as cf:
+                self.members[format] = cf.members
+
+    def recover(self, block):
+        with open('recover.cpio', 'wb') as f:
+            f.write(block)
+
+        assert_raises(cpiofile.CpioError, cpiofile.CpioFile.open,
+                      'recover.cpio', 'r')
+
+        with cpiofile.CpioFile.open('recover.cpio', 'r', recover=True) as cf:
+            return cf.names, cf.damaged
+
+    def testMagic(self):
+        for format, block in self.blocks.items():
+            members = self.members[format]
+            victim, after = members[5], members[6]
+            block = bytearray(block)
+            block[victim.offset] ^= 0xff
+
+            names, damaged = self.recover(bytes(block))
+            assert_equal(names, [m.name for m in members if m is not victim])
+            assert_equal(damaged, [(victim.offset, after.offset)])
+
+    def testField(self):
+        members = self.members['newc']
+        block = bytearray(self.blocks['newc'])
+        block[members[10].offset + 60] = ord('Z') # in the filesize
+
+        names, damaged = self.recover(bytes(block))
+        assert_equal(names, [m.name for m in members if m is not members[10]])
+        assert_equal(damaged, [(members[10].offset, members[11].offset)])
+
+    def testChecksum(self):
+        members = self.members['crc']
+        victim = members[3]
+        block = bytearray(self.blocks['crc'])
+        block[victim.dataoffset] ^= 0xff
+
+        names, damaged = self.recover(bytes(block))
+        assert_equal(names, [m.name for m in members if m is not victim])
+        assert_equal(damaged, [(victim.offset, members[4].offset)])
+
+    def testTruncated(self):
+        for format, block in self.blocks.items():
+            members = self.members[format]
+            end = members[20].dataoffset + 1
+
+            names, damaged = self.recover(block[:end])
+            assert_equal(names, [m.name for m in members[:20]])
+            assert_equal(damaged, [(members[20].offset, end)])
+
+    def tearDown(self):
+        os.remove('recover.cpio')
+
+class testPack(object):
+    def testPack(self):
+        for format in benchmarks.formats:
+            size = benchmarks.generate('pack.cpio', format, members=25,
+                                       sizes=(0, 70), namelengths=(1, 9))
+            block = open('pack.cpio', 'rb').read()
+
+            with cpiofile.CpioFile.open('pack.cpio', 'r') as cf:
+                assert_equal(cf.size, size)
+                assert_equal(bytes(cf.pack()), block)
+                assert_equal(cf.pack_file('pack-copy.cpio'), size)
+
+            assert_equal(open('pack-copy.cpio', 'rb').read(), block)
+
+    def testEmpty(self):
+        cf = cpiofile.CpioFile()
+        assert_equal(cf.size, cpiofile.CpioMemberNew.trailer().size)
+        with cpiofile.CpioFile.open(mode='r|',
+                                    fileobj=io.BytesIO(bytes(cf.pack()))) as cf:
+            assert_equal(list(cf), [])
+
+    def tearDown(self):
+        for fname in ['pack.cpio', 'pack-copy.cpio']:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+class SmallBatches(cpiofile.CpioFile):
+    gather_threshold = 100
+    gather_buffers = 3
+
+class testGather(object):
+    def setUp(self):
+        os.makedirs('gather-src')
+        self.paths = []
+        for i in range(40):
+            path = os.path.join('gather-src', 'f{0}'.format(i))
+            with open(path, 'wb') as f:
+                f.write(b'x' * (i * 7) + (b'big' * 100000 if i == 20 else b''))
+            self.paths.append(path)
+
+    def write(self, cls, fileobj=None, format='newc'):
+        with cls.open('gather.cpio', 'w', fileobj=fileobj,
+                      format=format) as cf:
+            for path in self.paths:
+                cf.add(path)
+            member = cf.member_class.trailer()
+            member.name = b'memory'
+            member.mode = 0o100644
+            member.content = b'in memory'
+            member.filesize = len(member.content)
+            cf.addfile(member)
+
+    def testGather(self):
+        for format in ['newc', 'crc', 'odc', 'bin']:
+            unbatched = io.BytesIO()
+            self.write(cpiofile.CpioFile, unbatched, format)
+            expected = unbatched.getvalue()
+
+            for cls in [cpiofile.CpioFile, SmallBatches]:
+                self.write(cls, format=format)
+                assert_equal(open('gather.cpio', 'rb').read(), expected)
+
+            with cpiofile.CpioFile.open('gather.cpio', 'r') as cf:
+                for member in cf.members:
+                    assert_equal(b''.join(member.pack_buffers()),
+                                 bytes(member.pack()))
+
+    def testBuffered(self):
+        # content copied through the file object's buffer, rather than
+        # with sendfile, must not be overtaken by gathered writes
+        content = b'y' * (1024 * 1024 + 10)
+        for sparse in [False, True]:
+            with cpiofile.CpioFile.open('gather.cpio', 'w', format='crc',
+                                        sparse=sparse) as cf:
+                member = cf.member_class.trailer()
+                member.name = b'nofd'
+                member.mode = 0o100644
+                member.nlink = 1
+                member.filesize = len(content)
+                cf.addfile(member, io.BytesIO(content))
+
+            with cpiofile.CpioFile.open('gather.cpio', 'r') as cf:
+                assert_equal([(m.name, m.content) for m in cf.members],
+                             [(b'nofd', content)])
+
+    def testSparseTail(self):
+        # the last member ends in a hole smaller than the buffer, whose
+        # zeros are written through the file object
+        path = os.path.join('gather-src', 'holey')
+        with open(path, 'wb') as f:
+            f.write(b'data' * 1000)
+            f.seek(100, os.SEEK_CUR)
+            f.truncate()
+
+        with cpiofile.CpioFile.open('gather.cpio', 'w', format='crc',
+                                    sparse=True) as cf:
+            cf.add(path)
+
+        with cpiofile.CpioFile.open('gather.cpio', 'r') as cf:
+            assert_equal([m.content for m in cf.members],
+                         [b'data' * 1000 + b'\x00' * 100])
+
+    def tearDown(self):
+        shutil.rmtree('gather-src', ignore_errors=True)
+        if os.path.exists('gather.cpio'):
+            os.remove('gather.cpio')
+
+class testCompression(object):
+    def setUp(self):
+        benchmarks.generate('compress.cpio', 'newc', members=200,
+                            sizes=(0, 4096))
+        self.block = open('compress.cpio', 'rb').read()
+
+    def testCompressor(self):
+        for format, decompress in [('gzip', gzip.decompress),
+                                   ('xz', lzma.decompress)]:
+            out = io.BytesIO()
+            compressor = cpiofile.compression.ParallelCompressor(
+                out, format, blocksize=10000, jobs=3)
+            with cpiofile.CpioFile.open('compress.cpio', 'r') as cf:
+                for member in cf.members:
+                    for buf in member.pack_buffers():
+                        compressor.write(buf)
+            compressor.write(cpiofile.CpioMemberNew.trailer().pack())
+            compressor.close()
+
+            assert_false(out.closed)
+            assert_equal(decompress(out.getvalue()), self.block)
+
+    def testOpen(self):
+        with cpiofile.CpioFile.open('compress.cpio', 'r') as cf:
+            with cpiofile.CpioFile.open('compress.cpio.gz', 'w',
+                                        compress='gzip', jobs=2) as out:
+                for member in cf.members:
+                    out.addfile(member)
+
+        with gzip.open('compress.cpio.gz', 'rb') as f:
+            assert_equal(f.read(), self.block)
+
+        assert_raises(ValueError, cpiofile.CpioFile.open, 'compress.cpio',
+                      'a', compress='xz')
+
+    def tearDown(self):
+        for fname in ['compress.cpio', 'compress.cpio.gz']:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+class testDecompression(object):
+    def setUp(self):
+        benchmarks.generate('decompress.cpio', 'newc', members=200,
+                            sizes=(0, 4096))
+        self.block = open('decompress.cpio', 'rb').read()
+
+    def compressed(self, format, blocksize=10000):
+        out = io.BytesIO()
+        with cpiofile.compression.ParallelCompressor(
+                out, format, blocksize=blocksize, jobs=2) as compressor:
+            compressor.write(self.block)
+        return out.getvalue()
+
+    def decompress(self, data, format=None, **kwargs):
+        with cpiofile.compression.ParallelDecompressor(
+                io.BytesIO(data), format, **kwargs) as reader:
+            return b''.join(iter(lambda: reader.read(3000), b''))
+
+    def testMultiple(self):
+        for format in ['gzip', 'xz']:
+            data = self.compressed(format)
+            assert_equal(cpiofile.compression.detect(data), format)
+            assert_equal(self.decompress(data, jobs=3, chunksize=4096,
+                                         window=8192), self.block)
+            assert_equal(self.decompress(data, format), self.block)
+
+    def testSingle(self):
+        assert_equal(self.decompress(gzip.compress(self.block),
+                                     chunksize=1000), self.block)
+        assert_equal(self.decompress(lzma.compress(self.block),
+                                     chunksize=1000), self.block)
+
+    def testFalseBoundary(self):
+        # stored deflate blocks carry the gzip magic through verbatim
+        payload = (b'\x1f\x8b\x08\x00' + b'x' * 500) * 40
+        data = (gzip.compress(payload, 0) + gzip.compress(payload, 0)
+                + gzip.compress(b'end'))
+        assert_equal(self.decompress(data, chunksize=700, jobs=2),
+                     payload * 2 + b'end')
+        assert_equal(self.decompress(data, chunksize=700, jobs=2,
+                                     window=3000),
+                     payload * 2 + b'end')
+
+    def testLargeUnit(self):
+        # single units far larger than the window are streamed, without
+        # holding more than the window of compressed input
+        for data in [gzip.compress(self.block) + gzip.compress(b'tail'),
+                     lzma.compress(self.block) + b'\x00' * 4
+                     + lzma.compress(b'tail')]:
+            with cpiofile.compression.ParallelDecompressor(
+                    io.BytesIO(data), jobs=2, window=8192,
+                    chunksize=1024) as reader:
+                pieces = []
+                largest = 0
+                for piece in iter(lambda: reader.read(3000), b''):
+                    pieces.append(piece)
+                    largest = max(largest, len(reader._input)) # pylint: disable=W0212
+            assert_equal(b''.join(pieces), self.block + b'tail')
+            assert_true(largest <= 8192 + 1024)
+
+        assert_raises(EOFError, self.decompress,
+                      gzip.compress(self.block)[:-5], window=8192)
+
+    def testLargeOutput(self):
+        # units which expand far beyond the window are streamed too
+        zeros = bytes(4 * 1024 * 1024)
+        for format in ['gzip', 'xz']:
+            function = cpiofile.compression.compressors[format][0]
+            data = function(zeros, 6) + function(b'tail', 6)
+            assert_true(len(data) < 8192)
+            with cpiofile.compression.ParallelDecompressor(
+                    io.BytesIO(data), jobs=2, window=65536,
+                    chunksize=1024) as reader:
+                largest = 0
+                total = []
+                for piece in iter(lambda: reader.read(1 << 20), b''):
+                    largest = max(largest, len(piece))
+                    total.append(piece)
+            assert_equal(b''.join(total), zeros + b'tail')
+            assert_true(largest <= 65536)
+
+    def testErrors(self):
+        data = self.compressed('gzip')
+        assert_raises(EOFError, self.decompress, data[:-5])
+        assert_raises(ValueError, self.decompress, b'not compressed')
+        assert_raises(IOError, self.decompress,
+                      data[:20] + b'\xff' * 100 + data[120:])
+
+    def testOpen(self):
+        with open('decompress.cpio.xz', 'wb') as f:
+            f.write(self.compressed('xz', blocksize=50000))
+
+        with cpiofile.CpioFile.open('decompress.cpio', 'r') as cf:
+            names = cf.names
+            contents = [m.content for m in cf.members]
+
+        with cpiofile.CpioFile.open('decompress.cpio.xz', 'r|',
+                                    compress='auto', jobs=2) as cf:
+            streamed = [(m.name, m.content) for m in cf]
+        assert_equal(streamed, list(zip(names, contents)))
+
+        with cpiofile.CpioFile.open('decompress.cpio.xz', 'r',
+                                    compress='xz') as cf:
+            assert_equal(cf.names, names)
+
+    def tearDown(self):
+        for fname in ['decompress.cpio', 'decompress.cpio.xz']:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+def rpm_header(entries):
+    """return an rpm header structure holding (tag, type, value) entries"""
+    index = b''
+    store = b''
+    for tag, kind, value in entries:
+        if kind == 6:
+            data, count = value + b'\x00', 1
+        else:
+            data = struct.pack('>{0}I'.format(len(value)), *value)
+            count = len(value)
+        index += struct.pack('>IIII', tag, kind, len(store), count)
+        store += data
+    return (struct.pack('>4s4xII', b'\x8e\xad\xe8\x01', len(entries),
+                        len(store)) + index + store)
+
+def rpm_package(payload, compressor=None, payloadformat=b'cpio'):
+    """return a minimal rpm package around *payload*"""
+    lead = (b'\xed\xab\xee\xdb\x03\x00\x00\x00\x00\x01'
+            + b'tiny'.ljust(66, b'\x00')
+            + b'\x00\x01\x00\x05').ljust(96, b'\x00')
+    signature = rpm_header([(1000, 4, [len(payload)])])
+    entries = [(1000, 6, b'tiny'), (1001, 6, b'1.0'), (1002, 6, b'1'),
+               (1124, 6, payloadformat)]
+    if compressor:
+        entries.append((1125, 6, compressor))
+    return (lead + signature + b'\x00' * (-len(signature) % 8)
+            + rpm_header(entries) + payload)
+
+class testRpm(object):
+    def setUp(self):
+        benchmarks.generate('rpm.cpio', 'newc', members=50, sizes=(0, 2000))
+        with cpiofile.CpioFile.open('rpm.cpio', 'r') as cf:
+            self.expected = [(m.name, m.content) for m in cf.members]
+        self.block = open('rpm.cpio', 'rb').read()
+
+    def members(self, package, jobs=None):
+        with cpiofile.rpm.RpmFile.open(fileobj=io.BytesIO(package)) as rpm:
+            with rpm.archive(jobs=jobs) as archive:
+                return [(m.name, m.content) for m in archive]
+
+    def testCompressors(self):
+        for compressor, payload in [
+                (None, gzip.compress(self.block)),
+                (b'gzip', gzip.compress(self.block)),
+                (b'xz', lzma.compress(self.block)),
+                (b'lzma', lzma.compress(self.block, lzma.FORMAT_ALONE)),
+                (b'bzip2', bz2.compress(self.block)),
+                (b'identity', self.block)]:
+            assert_equal(self.members(rpm_package(payload, compressor),
+                                      jobs=2), self.expected)
+
+    def testHeaders(self):
+        package = rpm_package(self.block, b'identity')
+        with open('tiny.rpm', 'wb') as f:
+            f.write(package)
+
+        with cpiofile.rpm.RpmFile.open('tiny.rpm') as rpm:
+            assert_equal(rpm.tag('name'), b'tiny')
+            assert_equal(rpm.tag('version'), b'1.0')
+            assert_equal(rpm.tag('arch'), None)
+            assert_equal(rpm.signature[1000], [len(self.block)])
+            assert_equal(rpm.compressor, b'identity')
+            assert_equal(package[rpm.payloadoffset:], self.block)
+            assert_equal(rpm.payload().read(), self.block)
+        assert_true(rpm.fileobj.closed)
+
+    def testErrors(self):
+        assert_raises(cpiofile.InvalidFileFormat, cpiofile.rpm.RpmFile.open,
+                      fileobj=io.BytesIO(self.block))
+        package = rpm_package(self.block, b'identity')
+        assert_raises(cpiofile.HeaderError, cpiofile.rpm.RpmFile.open,
+                      fileobj=io.BytesIO(package[:120]))
+
+        rpm = cpiofile.rpm.RpmFile.open(fileobj=io.BytesIO(
+            rpm_package(self.block, b'compress')))
+        assert_raises(ValueError, rpm.payload)
+
+        rpm = cpiofile.rpm.RpmFile.open(fileobj=io.BytesIO(
+            rpm_package(self.block, b'identity', b'drpm')))
+        assert_raises(cpiofile.InvalidFileFormat, rpm.archive)
+
+    def tearDown(self):
+        for fname in ['rpm.cpio', 'tiny.rpm']:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+class testManifest(object):
+    def setUp(self):
+        benchmarks.generate('manifest.cpio', 'newc', members=60,
+                            sizes=(0, 8000))
+
+    def testManifest(self):
+        with cpiofile.CpioFile.open('manifest.cpio', 'r') as cf:
+            cf.hash_threshold = 2000
+            manifest = cf.manifest(['sha256', 'blake2b'], jobs=2)
+            expected = [(m.name, m.mode, m.filesize,
+                         {'sha256': hashlib.sha256(m.content).hexdigest(),
+                          'blake2b': hashlib.blake2b(m.content).hexdigest()})
+                        for m in cf.members]
+            assert_equal(manifest.entries, expected)
+            assert_equal(manifest.algorithms, ['blake2b', 'sha256'])
+            assert_equal(cf.manifest('sha256', include='1/*').entries,
+                         [(name, mode, size, {'sha256': d['sha256']})
+                          for name, mode, size, d in expected
+                          if name.startswith(b'1/')])
+
+        with open('manifest.cpio', 'rb') as f:
+            cf = cpiofile.CpioFile.open(mode='r|', fileobj=Unseekable(f.read()))
+        cf.hash_threshold = 2000
+        assert_equal(cf.manifest(['sha256', 'blake2b'], jobs=1).entries,
+                     expected)
+
+        assert_raises(ValueError, cf.manifest, ['no-such-hash'])
+
+    def testVerify(self):
+        with cpiofile.CpioFile.open('manifest.cpio', 'r') as cf:
+            manifest = cf.manifest()
+
+        out = io.StringIO()
+        manifest.dump(out)
+        loaded = cpiofile.CpioManifest.load(io.StringIO(out.getvalue()))
+        assert_equal(loaded.entries, manifest.entries)
+
+        with cpiofile.CpioFile.open('manifest.cpio', 'r') as cf:
+            assert_equal(loaded.verify(cf), [])
+
+        first, second = manifest.entries[:2]
+        loaded.entries[0] = (first[0], first[1], first[2] + 1,
+                             {'sha256': '0' * 64})
+        loaded.entries[1] = (b'\xffgone', 0o100644, 0, {'sha256': ''})
+
+        with cpiofile.CpioFile.open('manifest.cpio', 'r') as cf:
+            assert_equal(loaded.verify(cf),
+                         sorted([(first[0], ['size', 'sha256']),
+                                 (b'\xffgone', ['missing'])])
+                         + [(second[0], ['unexpected'])])
+
+    def testLinks(self):
+        os.mkdir('manifest-src')
+        for name in ['a', 'b']:
+            with open(os.path.join('manifest-src', name), 'wb') as f:
+                f.write(b'same' * 100)
+
+        # dedup stores the data on the first link, GNU newc on the last
+        dedup = io.BytesIO()
+        with cpiofile.CpioFile.open(mode='w', fileobj=dedup,
+                                    dedup=True) as cf:
+            for name in ['a', 'b']:
+                cf.add(os.path.join('manifest-src', name))
+        gnu = b''.join([newc_member(b'c', b'', ino=7, nlink=2),
+                        newc_member(b'd', b'same' * 100, ino=7, nlink=2),
+                        newc_member(cpiofile.TRAILER, b'', mode=0, ino=0)])
+
+        digest = hashlib.sha256(b'same' * 100).hexdigest()
+        for block in [dedup.getvalue(), gnu]:
+            for mode, fileobj in [('r', io.BytesIO(block)),
+                                  ('r|', Unseekable(block))]:
+                with cpiofile.CpioFile.open(mode=mode, fileobj=fileobj) as cf:
+                    entries = cf.manifest().entries
+                assert_equal([(size, digests['sha256'])
+                              for _, _, size, digests in entries],
+                             [(400, digest)] * 2)
+
+            with cpiofile.CpioFile.open(mode='r',
+                                        fileobj=io.BytesIO(block)) as cf:
+                manifest = cf.manifest()
+                assert_equal(manifest.verify(cf), [])
+
+    def tearDown(self):
+        shutil.rmtree('manifest-src', ignore_errors=True)
+        if os.path.exists('manifest.cpio'):
+            os.remove('manifest.cpio')
+
+class testTranscode(object):
+    fields = ('name', 'mode', 'uid', 'gid', 'nlink', 'mtime', 'filesize',
+              'content')
+
+    def setUp(self):
+        benchmarks.generate('transcode.cpio', 'odc', members=40,
+                            sizes=(0, 3000))
+        with cpiofile.CpioFile.open('transcode.cpio', 'r') as cf:
+            self.expected = [tuple(getattr(m, field) for field in self.fields)
+                             for m in cf.members]
+
+    def members(self, block):
+        cf = cpiofile.CpioFile.open(mode='r', fileobj=io.BytesIO(block))
+        return cf.members, [tuple(getattr(m, field) for field in self.fields)
+                            for m in cf.members]
+
+    def testFiles(self):
+        source = 'transcode.cpio'
+        for format in ['bin-le', 'bin-be', 'newc', 'crc', 'odc']:
+            stats = cpiofile.CpioStats()
+            assert_equal(cpiofile.transcode(source, 'transcode.out', format,
+                                            stats=stats), 40)
+            assert_equal(stats.counts['write'], 41)
+
+            members, found = self.members(open('transcode.out', 'rb').read())
+            assert_true(all(type(m) is cpiofile.formats[format]
+                            for m in members))
+            assert_equal(found, self.expected)
+
+            os.rename('transcode.out', 'transcode.prev')
+            source = 'transcode.prev'
+
+    def testStreams(self):
+        block = open('transcode.cpio', 'rb').read()
+
+        for dst in [io.BytesIO(), Unseekable()]:
+            cpiofile.transcode(Unseekable(block), dst, 'crc')
+            crc = dst.getvalue()
+            assert_equal(self.members(crc)[1], self.expected)
+
+        out = io.BytesIO()
+        cpiofile.transcode(io.BytesIO(crc), out, 'bin')
+        assert_equal(self.members(out.getvalue())[1], self.expected)
+
+    def testOverflow(self):
+        block = newc_archive([(b'small', b'1'), (b'large', b'2')])
+        with cpiofile.CpioFile.open(mode='r', fileobj=io.BytesIO(block)) as cf:
+            cf.members[1].uid = 70000
+            packed = cf.pack()
+
+        out = io.BytesIO()
+        try:
+            cpiofile.transcode(io.BytesIO(packed), out, 'bin')
+        except cpiofile.HeaderError as error:
+            assert_true('uid 70000' in str(error))
+        else:
+            assert_true(False, 'HeaderError not raised')
+
+        # everything before the member which does not fit is written
+        first = io.BytesIO()
+        cpiofile.transcode(io.BytesIO(newc_archive([(b'small', b'1')])),
+                           first, 'bin')
+        trailer = cpiofile.formats['bin'].trailer().size
+        assert_equal(out.getvalue(), first.getvalue()[:-trailer])
+
+    def testInodes(self):
+        out = io.BytesIO()
+        with cpiofile.CpioFile.open(mode='w', fileobj=out) as cf:
+            for name, ino, nlink in [(b'a', 1172116, 1), (b'b', 0x12345678, 2),
+                                     (b'c', 0x10000, 1), (b'd', 0x12345678, 2)]:
+                member = cf.member_class.trailer()
+                member.name = name
+                member.mode = 0o100644
+                member.ino = ino
+                member.nlink = nlink
+                member.content = name if name != b'd' else b''
+                member.filesize = len(member.content)
+                cf.addfile(member)
+
+        for format in ['odc', 'bin']:
+            dst = io.BytesIO()
+            assert_equal(cpiofile.transcode(io.BytesIO(out.getvalue()), dst,
+                                            format), 4)
+            members = self.members(dst.getvalue())[0]
+            inodes = [m.ino for m in members]
+            assert_equal(inodes, [1, 2, 3, 2])
+            assert_equal([m.content for m in members], [b'a', b'b', b'c', b''])
+
+        # newc to crc keeps them
+        dst = io.BytesIO()
+        cpiofile.transcode(io.BytesIO(out.getvalue()), dst, 'crc')
+        assert_equal([m.ino for m in self.members(dst.getvalue())[0]],
+                     [1172116, 0x12345678, 0x10000, 0x12345678])
+
+    def tearDown(self):
+        for fname in ['transcode.cpio', 'transcode.out', 'transcode.prev']:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+class testTar(object):
+    def cpio(self):
+        """return a newc archive of assorted members"""
+        out = io.BytesIO()
+        with cpiofile.CpioFile.open(mode='w', fileobj=out) as cf:
+            for name, mode, content, extra in [
+                    (b'dir', stat.S_IFDIR | 0o755, b'', {'nlink': 2}),
+                    (b'dir/file', stat.S_IFREG | 0o4750, b'data', {}),
+                    (b'dir/link', stat.S_IFLNK | 0o777, b'file', {}),
+                    (b'fifo', stat.S_IFIFO | 0o600, b'', {}),
+                    (b'null', stat.S_IFCHR | 0o666, b'',
+                     {'rdevmajor': 1, 'rdevminor': 3}),
+                    (b'sock', stat.S_IFSOCK | 0o755, b'', {}),
+                    # GNU style: only the last link carries data
+                    (b'one', stat.S_IFREG | 0o644, b'',
+                     {'ino': 50, 'nlink': 3}),
+                    (b'two', stat.S_IFREG | 0o644, b'',
+                     {'ino': 50, 'nlink': 3}),
+                    (b'three', stat.S_IFREG | 0o644, b'shared',
+                     {'ino': 50, 'nlink': 3}),
+                    (b'\xffodd', stat.S_IFREG | 0o600, b'x' * 300000, {})]:
+                member = cpiofile.CpioMemberNew.trailer()
+                member.name = name
+                member.mode = mode
+                member.uid = 1000
+                member.gid = 100
+                member.mtime = 1234567890
+                member.ino = extra.pop('ino', len(cf.members) + 1)
+                member.content = content
+                member.filesize = len(content)
+                for key, value in extra.items():
+                    setattr(member, key, value)
+                cf.addfile(member)
+        return out.getvalue()
+
+    def testToTar(self):
+        out = io.BytesIO()
+        assert_equal(cpiofile.tar.cpio_to_tar(Unseekable(self.cpio()), out), 9)
+
+        with tarfile.open(fileobj=io.BytesIO(out.getvalue())) as tar:
+            infos = dict((info.name, info) for info in tar)
+            assert_equal(infos['dir'].type, tarfile.DIRTYPE)
+            assert_equal(infos['dir/file'].mode, 0o4750)
+            assert_equal((infos['dir/file'].uid, infos['dir/file'].gid,
+                          infos['dir/file'].mtime), (1000, 100, 1234567890))
+            assert_equal(tar.extractfile('dir/file').read(), b'data')
+            assert_equal(infos['dir/link'].linkname, 'file')
+            assert_true(infos['fifo'].isfifo())
+            assert_equal((infos['null'].devmajor, infos['null'].devminor),
+                         (1, 3))
+            assert_true('sock' not in infos)
+            assert_true(infos['three'].isreg())
+            assert_equal(tar.extractfile('three').read(), b'shared')
+            assert_equal([(infos[name].type, infos[name].linkname)
+                          for name in ['one', 'two']],
+                         [(tarfile.LNKTYPE, 'three')] * 2)
+            assert_equal(len(tar.extractfile('\udcffodd').read()), 300000)
+
+    def testRoundTrip(self):
+        tar = io.BytesIO()
+        cpiofile.tar.cpio_to_tar(io.BytesIO(self.cpio()), tar)
+
+        for format, src in [('newc', io.BytesIO(tar.getvalue())),
+                            ('crc', Unseekable(tar.getvalue())),
+                            ('odc', io.BytesIO(tar.getvalue()))]:
+            out = io.BytesIO()
+            assert_equal(cpiofile.tar.tar_to_cpio(src, out, format), 9)
+
+            with cpiofile.CpioFile.open(mode='r',
+                                        fileobj=io.BytesIO(out.getvalue())) as cf:
+                members = dict((m.name, m) for m in cf.members)
+                assert_equal(members[b'dir/file'].mode,
+                             stat.S_IFREG | 0o4750)
+                assert_equal(members[b'dir/file'].content, b'data')
+                assert_equal(members[b'dir/link'].content, b'file')
+                assert_true(stat.S_ISDIR(members[b'dir'].mode))
+                assert_equal((members[b'null'].rdevmajor,
+                              members[b'null'].rdevminor), (1, 3))
+                assert_equal(members[b'\xffodd'].content, b'x' * 300000)
+
+                group = [members[name] for name in [b'three', b'one', b'two']]
+                assert_equal(len(set(m.ino for m in group)), 1)
+                assert_equal([m.filesize for m in group], [6, 0, 0])
+                if format != 'crc':
+                    # link counts are only known when the tar can seek
+                    assert_equal([m.nlink for m in group], [3, 3, 3])
+                    assert_equal(cf.data_member(group[2]).content, b'shared')
+
+    def testFiles(self):
+        with open('bridge.cpio', 'wb') as f:
+            f.write(self.cpio())
+        cpiofile.tar.cpio_to_tar('bridge.cpio', 'bridge.tar')
+        cpiofile.tar.tar_to_cpio('bridge.tar', 'bridge.out')
+
+        with cpiofile.CpioFile.open('bridge.out', 'r') as cf:
+            assert_equal(sorted(cf.names),
+                         sorted(n for n in cpiofile.CpioFile.open(
+                             'bridge.cpio', 'r').names if n != b'sock'))
+
+        assert_raises(ValueError, cpiofile.tar.tar_to_cpio, 'bridge.tar',
+                      'bridge.out', 'tar')
+
+    def gnu_sparse(self, name, realsize, chunks):
+        """
+        return a GNU sparse tar member, (python cannot write them), of
+        *realsize* bytes holding data (offset, bytes) *chunks*
+        """
+        data = b''.join(chunk for _, chunk in chunks)
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        header = bytearray(info.tobuf(tarfile.GNU_FORMAT))
+        header[156:157] = tarfile.GNUTYPE_SPARSE
+        for index, (offset, chunk) in enumerate(chunks):
+            entry = 386 + index * 24
+            header[entry:entry + 24] = (tarfile.itn(offset, 12)
+                                        + tarfile.itn(len(chunk), 12))
+        header[483:495] = tarfile.itn(realsize, 12)
+        header[148:156] = b' ' * 8
+        header[148:155] = b'%06o\x00' % sum(header[:512])
+        return bytes(header) + data + b'\x00' * (-len(data) % 512)
+
+    def testSparse(self):
+        plain = io.BytesIO()
+        with tarfile.open(fileobj=plain, mode='w',
+                          format=tarfile.GNU_FORMAT) as tar:
+            info = tarfile.TarInfo('plain')
+            info.size = 5
+            tar.addfile(info, io.BytesIO(b'plain'))
+        block = (self.gnu_sparse('sp', 10000, [(0, b'abc'), (8192, b'xyz')])
+                 + plain.getvalue())
+
+        expected = b'abc' + b'\x00' * 8189 + b'xyz' + b'\x00' * 1805
+        with tarfile.open(fileobj=io.BytesIO(block)) as tar:
+            assert_equal(tar.extractfile('sp').read(), expected)
+
+        for src in [io.BytesIO(block), Unseekable(block)]:
+            out = io.BytesIO()
+            assert_equal(cpiofile.tar.tar_to_cpio(src, out, 'crc'), 2)
+            with cpiofile.CpioFile.open(mode='r',
+                                        fileobj=io.BytesIO(out.getvalue())) as cf:
+                assert_equal([(m.name, m.mode, m.content) for m in cf.members],
+                             [(b'sp', stat.S_IFREG | 0o644, expected),
+                              (b'plain', stat.S_IFREG | 0o644, b'plain')])
+
+    def testUnsupported(self):
+        out = io.BytesIO()
+        with tarfile.open(fileobj=out, mode='w') as tar:
+            info = tarfile.TarInfo('label')
+            info.type = b'V'
+            tar.addfile(info)
+        assert_raises(ValueError, cpiofile.tar.tar_to_cpio,
+                      io.BytesIO(out.getvalue()), io.BytesIO())
+
+    def testStreaming(self):
+        # contents are copied in chunks, never read whole
+        block = self.cpio()
+        reads = []
+
+        class Recording(Unseekable):
+            def read(self, size=-1):
+                reads.append(size)
+                return Unseekable.read(self, size)
+
+        cpiofile.tar.cpio_to_tar(Recording(block), io.BytesIO())
+        assert_true(max(reads) < 300000)
+
+        # a corrupt crc checksum is still caught
+        out = io.BytesIO()
+        cpiofile.transcode(io.BytesIO(block), out, 'crc')
+        damaged = out.getvalue().replace(b'x' * 100, b'y' * 100, 1)
+        assert_raises(cpiofile.CheckSumError, cpiofile.tar.cpio_to_tar,
+                      io.BytesIO(damaged), io.BytesIO())
+
+    def tearDown(self):
+        for fname in ['bridge.cpio', 'bridge.tar', 'bridge.out']:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+class CountingBackend(object):
+    """a stand in for remote storage which counts, and delays, requests"""
+    def __init__(self, block, delay=0):
+        self.block = block
+        self.size = len(block)
+        self.delay = delay
+        self.requests = []
+
+    def read_at(self, offset, size):
+        self.requests.append((offset, size))
+        if self.delay:
+            time.sleep(self.delay)
+        return self.block[offset:offset + size]
+
+class testStorage(object):
+    def setUp(self):
+        benchmarks.generate('storage.cpio', 'crc', members=300,
+                            sizes=(0, 500))
+        self.block = open('storage.cpio', 'rb').read()
+        with cpiofile.CpioFile.open('storage.cpio', 'r') as cf:
+            self.expected = [(m.name, m.offset, m.content)
+                             for m in cf.members]
+
+    def testOpen(self):
+        backend = CountingBackend(self.block, delay=0.001)
+        cache = cpiofile.storage.RangeCache(backend, blocksize=4096,
+                                            readahead=8)
+        with cpiofile.CpioFile.open(mode='r', backend=cache) as cf:
+            assert_equal([(m.name, m.offset, m.content) for m in cf.members],
+                         self.expected)
+
+            # whole blocks, fetched several at a time
+            blocks = (len(self.block) + 4095) // 4096
+            assert_true(len(backend.requests) < blocks // 2)
+            assert_true(all(offset % 4096 == 0
+                            for offset, _ in backend.requests))
+
+            member = cf.members[7]
+            with cf.open_member(member) as reader:
+                assert_equal(reader.read(), member.content)
+                reader.seek(1)
+                assert_equal(reader.read(3), member.content[1:4])
+
+            manifest = cf.manifest()
+            assert_equal(manifest.entries[7][3]['sha256'],
+                         hashlib.sha256(member.content).hexdigest())
+            assert_equal(cf.pack(), self.block)
+
+    def testCache(self):
+        backend = CountingBackend(bytes(range(256)) * 64)
+        cache = cpiofile.storage.RangeCache(backend, blocksize=256, blocks=4,
+                                            readahead=0)
+        assert_equal(len(cache), 16384)
+        assert_equal(cache[300:310], backend.block[300:310])
+        assert_equal(cache[-1], 255)
+        assert_equal(cache.read_at(250, 20), backend.block[250:270])
+        assert_equal(len(backend.requests), 3)
+        cache.read_at(260, 30)
+        assert_equal(len(backend.requests), 3)
+
+        for offset in range(0, 16384, 256):
+            cache.read_at(offset, 1)
+        assert_true(len(cache._cache) <= 4)
+        requests = len(backend.requests)
+        cache.read_at(16000, 10)
+        assert_equal(len(backend.requests), requests)
+
+        # too big to cache
+        assert_equal(cache.read_at(0, 1000), backend.block[:1000])
+        assert_equal(backend.requests[-1], (0, 1000))
+
+        assert_equal(cache.find(b'\x05\x06', 7), 261)
+        assert_equal(cache.find(b'\xff\x00\x01', 1000), 1023)
+        assert_equal(cache.find(b'\xff\xff'), -1)
+
+    def testReadahead(self):
+        backend = CountingBackend(self.block)
+        cache = cpiofile.storage.RangeCache(backend, blocksize=1024,
+                                            readahead=4)
+        for offset in range(0, len(self.block), 1024):
+            cache.read_at(offset, 1)
+        assert_equal([size // 1024 for _, size in backend.requests[:4]],
+                     [1, 2, 3, 5])
+
+        del backend.requests[:]
+        cache = cpiofile.storage.RangeCache(backend, blocksize=1024,
+                                            readahead=4)
+        for offset in [0, 50000, 20000, 60000]:
+            cache.read_at(offset, 1)
+        assert_equal([size for _, size in backend.requests], [1024] * 4)
+
+    def testRecover(self):
+        block = bytearray(self.block)
+        block[self.expected[5][1]] ^= 0xff
+        with cpiofile.CpioFile.open(
+                mode='r', recover=True,
+                backend=CountingBackend(bytes(block))) as cf:
+            assert_equal(len(cf.members), len(self.expected) - 1)
+            assert_equal(cf.damaged, [(self.expected[5][1],
+                                       self.expected[6][1])])
+
+    def testFileBackend(self):
+        backend = cpiofile.storage.FileBackend('storage.cpio')
+        with cpiofile.CpioFile.open(mode='r', backend=backend) as cf:
+            assert_equal([(m.name, m.offset, m.content) for m in cf.members],
+                         self.expected)
+        assert_equal(backend.read_at(len(self.block) - 2, 10),
+                     self.block[-2:])
+        backend.close()
+        assert_true(backend.fileobj.closed)
+
+    def tearDown(self):
+        if os.path.exists('storage.cpio'):
+            os.remove('storage.cpio')
+
+class testConcurrent(object):
+    threads = 8
+    reads = 150
+
+    def setUp(self):
+        benchmarks.generate('concurrent.cpio', 'newc', members=120,
+                            sizes=(0, 20000), seed=5)
+        with cpiofile.CpioFile.open('concurrent.cpio', 'r') as cf:
+            self.expected = dict((m.name, m.content) for m in cf.members)
+
+    def stress(self, cf):
+        members = [m for m in cf.members if m.name in self.expected]
+        errors = []
+
+        def worker(seed):
+            # each thread has its own generator, so runs are repeatable
+            rng = random.Random(seed)
+            try:
+                for _ in range(self.reads):
+                    member = rng.choice(members)
+                    expected = self.expected[member.name]
+                    with cf.open_member(member) as reader:
+                        start = rng.randint(0, len(expected))
+                        reader.seek(start)
+                        buf = bytearray(rng.randint(1, 4096))
+                        pieces = []
+                        count = reader.readinto(buf)
+                        while count:
+                            pieces.append(bytes(buf[:count]))
+                            count = reader.readinto(buf)
+                        if b''.join(pieces) != expected[start:]:
+                            errors.append((seed, member.name, start))
+            # pylint: disable=W0703
+            except Exception as error:
+                errors.append((seed, error))
+
+        workers = [threading.Thread(target=worker, args=(seed,))
+                   for seed in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        assert_equal(errors, [])
+
+    def testMapped(self):
+        with cpiofile.CpioFile.open('concurrent.cpio', 'r') as cf:
+            self.stress(cf)
+
+    def testRangeCache(self):
+        # a cache far smaller than the archive, so that threads evict
+        # each other's blocks constantly
+        with io.open('concurrent.cpio', 'rb') as fileobj:
+            backend = cpiofile.storage.FileBackend(fileobj=fileobj)
+            cache = cpiofile.storage.RangeCache(backend, blocksize=4096,
+                                                blocks=8, readahead=4)
+            with cpiofile.CpioFile.open(mode='r', backend=cache) as cf:
+                assert_equal(len(cf.members), len(self.expected))
+                self.stress(cf)
+
+            # reads are positional, so the file position never moved
+            assert_equal(fileobj.tell(), 0)
+            assert_false(fileobj.closed)
+
+    def testPositional(self):
+        with io.open('concurrent.cpio', 'rb') as fileobj:
+            backend = cpiofile._positional(fileobj)
+            try:
+                assert_equal(backend.size, os.path.getsize('concurrent.cpio'))
+                with cpiofile.CpioFile.open(mode='r', backend=backend) as cf:
+                    self.stress(cf)
+            finally:
+                backend.close()
+
+            # the backend read, and closed, a descriptor of its own
+            assert_true(backend.fileobj.closed)
+            assert_false(fileobj.closed)
+
+        with io.BytesIO(b'') as fileobj:
+            assert_equal(cpiofile._positional(fileobj), None)
+
+    def tearDown(self):
+        if os.path.exists('concurrent.cpio'):
+            os.remove('concurrent.cpio')
+
+class testBenchmarks(object):
+    def testGenerate(self):
+        for format in benchmarks.formats:
+            sizes = [benchmarks.generate('bench-{0}.cpio'.format(i), format,
+                                         members=50, sizes=(0, 100), seed=3)
+                     for i in range(2)]
+            assert_equal(sizes[0], sizes[1])
+            blocks = [open('bench-{0}.cpio'.format(i), 'rb').read()
+                      for i in range(2)]
+            assert_equal(blocks[0], blocks[1])
+
+            with cpiofile.CpioFile.open('bench-0.cpio', 'r') as cf:
+                assert_equal(len(cf.members), 50)
+                assert_true(all(len(m.content) <= 100 for m in cf.members))
+
+    def testRun(self):
+        results = benchmarks.run(['odc'], members=10, repeat=1,
+                                 selected=['list', 'pack'])
+        assert_equal([r['operation'] for r in results['results']],
+                     ['list', 'pack'])
+        json.dumps(results)
+
+    def tearDown(self):
+        for i in range(2):
+            if os.path.exists('bench-{0}.cpio'.format(i)):
+                os.remove('bench-{0}.cpio'.format(i))
+
 if __name__ == '__main__':
     nose.main()